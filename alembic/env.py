@@ -23,6 +23,10 @@ target_metadata = Base.metadata
 # ... etc.
 
 url = APP_CONFIG["DATABASE_URL"]
+# How long a statement waits for a lock before failing, so that a migration blocked by
+# a long running query does not in turn block the bot's queries. Override with e.g.
+# alembic -x lock_timeout=0 upgrade head
+lock_timeout = context.get_x_argument(as_dictionary=True).get("lock_timeout", "5s")
 
 
 def run_migrations_offline(url: str) -> None:
@@ -55,10 +59,18 @@ def run_migrations_online(url: str) -> None:
     and associate a connection with the context.
 
     """
-    connectable = create_engine(url)
+    connectable = create_engine(
+        url, connect_args={"options": f"-c lock_timeout={lock_timeout}"}
+    )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        # Commits after each migration, so its locks are not held through the next,
+        # and the helpers in src/migrations.py can commit by themselves in between
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            transaction_per_migration=True,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,135 @@
+"""Partition question records by month
+
+The records are copied into the partitioned table in the same transaction that renames
+the old one, so question_records is locked from the rename until the copy commits. The
+bot cannot read or add records meanwhile, for as long as the copy takes, which grows
+with the number of records. Run it while the bot is stopped or quiet. Downgrading
+copies the records back the same way.
+
+Revision ID: 7b1d4e9c2f36
+Revises: 5c0e2f7a41b9
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7b1d4e9c2f36"
+down_revision = "5c0e2f7a41b9"
+branch_labels = None
+depends_on = None
+
+# Partitions are also created ahead of time by src.partitions, which uses the same
+# names and bounds.
+MONTHS_AHEAD = 3
+COLUMNS = "id, created_at, updated_at, user_id, platform, question_name, difficulty"
+
+
+# A copy of src.partitions.add_months, so that this migration keeps working the same
+# way if the app's helper changes
+def add_months(month_start: datetime, months: int) -> datetime:
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return month_start.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+
+def create_question_records_table(*args, created_at_nullable: bool, **kwargs):
+    op.create_table(
+        "question_records",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=created_at_nullable,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column("user_id", postgresql.UUID(), nullable=False),
+        sa.Column("platform", sa.String(), nullable=False),
+        sa.Column("question_name", sa.String(), nullable=False),
+        sa.Column("difficulty", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.id"], onupdate="CASCADE", ondelete="CASCADE"
+        ),
+        *args,
+        **kwargs,
+    )
+
+
+def upgrade():
+    op.rename_table("question_records", "question_records_unpartitioned")
+    op.execute(
+        "ALTER INDEX question_records_pkey RENAME TO question_records_unpartitioned_pkey"
+    )
+
+    create_question_records_table(
+        sa.PrimaryKeyConstraint("id", "created_at"),
+        # The partition key is part of the primary key, so it cannot be null
+        created_at_nullable=False,
+        postgresql_partition_by="RANGE (created_at)",
+    )
+    op.create_index(
+        "ix_question_records_user_id_created_at",
+        "question_records",
+        ["user_id", "created_at"],
+    )
+
+    # One partition per month, from the oldest record until a few months from now
+    now = datetime.now(timezone.utc)
+    oldest = (
+        op.get_bind()
+        .execute(sa.text("SELECT min(created_at) FROM question_records_unpartitioned"))
+        .scalar()
+    )
+    month_start = (oldest or now).astimezone(timezone.utc)
+    month_start = month_start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last_month_start = add_months(
+        now.replace(day=1, hour=0, minute=0, second=0, microsecond=0), MONTHS_AHEAD
+    )
+    while month_start <= last_month_start:
+        next_month_start = add_months(month_start, 1)
+        op.execute(
+            f"CREATE TABLE question_records_y{month_start:%Y}m{month_start:%m} "
+            "PARTITION OF question_records "
+            f"FOR VALUES FROM ('{month_start.isoformat()}') "
+            f"TO ('{next_month_start.isoformat()}')"
+        )
+        month_start = next_month_start
+
+    op.execute(
+        f"INSERT INTO question_records ({COLUMNS}) "
+        "SELECT id, coalesce(created_at, now()), updated_at, user_id, platform, "
+        "question_name, difficulty FROM question_records_unpartitioned"
+    )
+    op.drop_table("question_records_unpartitioned")
+
+
+def downgrade():
+    op.rename_table("question_records", "question_records_partitioned")
+    op.execute(
+        "ALTER INDEX question_records_pkey RENAME TO question_records_partitioned_pkey"
+    )
+    op.execute(
+        "ALTER INDEX ix_question_records_user_id_created_at "
+        "RENAME TO ix_question_records_partitioned_user_id_created_at"
+    )
+
+    create_question_records_table(
+        sa.PrimaryKeyConstraint("id"), created_at_nullable=True
+    )
+    op.execute(
+        f"INSERT INTO question_records ({COLUMNS}) "
+        f"SELECT {COLUMNS} FROM question_records_partitioned"
+    )
+    # Also drops every partition
+    op.drop_table("question_records_partitioned")
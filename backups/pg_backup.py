@@ -0,0 +1,223 @@
+"""Backs up each database in DATABASE_WHITELIST as a directory format dump.
+
+Each dump is made by JOBS parallel jobs, which compress every table's data as they
+write it. A dump is written under a temporary name, so a failed dump never replaces a
+good one. Once complete, it is verified by restoring it into a scratch database. Then
+only the newest RETENTION_COUNT backups of the database are kept. Failed backups are
+kept for inspection, marked with a .failed suffix.
+
+The duration and size of every backup are appended to backups.jsonl in the backup
+directory. Only needs the standard library and the Postgres client tools. Run with the
+project root, as for pg_backup.sh:
+    python3 backups/pg_backup.py /path/to/project
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import Optional
+
+DEFAULTS = {
+    "HOSTNAME": "localhost",
+    "USERNAME": "postgres",
+    "PASSWORD": "",
+    "DATABASE_WHITELIST": "",
+    "BACKUP_DIR": "",
+    "JOBS": "4",
+    "COMPRESSION": "6",
+    "RETENTION_COUNT": "7",
+    "VERIFY": "yes",
+}
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H%M%S"
+IN_PROGRESS_SUFFIX = ".in_progress"
+FAILED_SUFFIX = ".failed"
+MANIFEST_NAME = "backups.jsonl"
+
+
+@dataclass
+class BackupRecord:
+    database: str
+    name: str
+    started_at: str
+    dump_seconds: float
+    size_bytes: int
+    verify_seconds: Optional[float]
+    is_verified: Optional[bool]
+    error: Optional[str] = None
+
+
+def load_config(path: Path) -> dict[str, str]:
+    """Reads the KEY=VALUE lines of the shell config file used by pg_backup.sh."""
+    config = dict(DEFAULTS)
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        value = value.strip().strip("\"'")
+        if value:
+            config[key.strip()] = value
+    return config
+
+
+def get_size(directory: Path) -> int:
+    return sum(x.stat().st_size for x in directory.rglob("*") if x.is_file())
+
+
+class Backup:
+    def __init__(self, config: dict[str, str], backup_dir: Path):
+        self.config = config
+        self.backup_dir = backup_dir
+        self.env = {**os.environ, "PGPASSWORD": config["PASSWORD"]}
+        self.connection_args = ["-h", config["HOSTNAME"], "-U", config["USERNAME"]]
+
+    def run(self, *args: str) -> None:
+        process = subprocess.run(
+            args, env=self.env, stderr=subprocess.PIPE, text=True, check=False
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"{args[0]} failed: {process.stderr.strip()}")
+
+    def dump(self, database: str, path: Path) -> None:
+        self.run(
+            "pg_dump",
+            *self.connection_args,
+            "--no-owner",
+            "--format=directory",
+            f"--jobs={self.config['JOBS']}",
+            f"--compress={self.config['COMPRESSION']}",
+            f"--file={path}",
+            database,
+        )
+
+    def verify(self, database: str, path: Path) -> None:
+        """Restores the dump into a scratch database, which is dropped afterwards."""
+        scratch_database = f"{database}_verify_{os.getpid()}"
+        self.run("createdb", *self.connection_args, scratch_database)
+        try:
+            self.run(
+                "pg_restore",
+                *self.connection_args,
+                "--no-owner",
+                "--exit-on-error",
+                f"--jobs={self.config['JOBS']}",
+                f"--dbname={scratch_database}",
+                str(path),
+            )
+        finally:
+            self.run("dropdb", *self.connection_args, "--if-exists", scratch_database)
+
+    def back_up(self, database: str) -> BackupRecord:
+        started_at = datetime.now()
+        name = f"{database}-{started_at.strftime(TIMESTAMP_FORMAT)}"
+        path = self.backup_dir / name
+        in_progress_path = path.with_name(name + IN_PROGRESS_SUFFIX)
+
+        start_time = perf_counter()
+        self.dump(database, in_progress_path)
+        dump_seconds = perf_counter() - start_time
+        in_progress_path.rename(path)
+        record = BackupRecord(
+            database=database,
+            name=name,
+            started_at=started_at.isoformat(),
+            dump_seconds=round(dump_seconds, 3),
+            size_bytes=get_size(path),
+            verify_seconds=None,
+            is_verified=None,
+        )
+
+        if self.config["VERIFY"].lower() in ("yes", "true", "1"):
+            start_time = perf_counter()
+            try:
+                self.verify(database, path)
+                record.is_verified = True
+            except RuntimeError as e:
+                record.is_verified = False
+                record.error = str(e)
+                path.rename(path.with_name(name + FAILED_SUFFIX))
+            record.verify_seconds = round(perf_counter() - start_time, 3)
+        return record
+
+    def prune(self, database: str) -> list[str]:
+        """Deletes all but the newest backups of the database, and the partial dumps of
+        runs that were interrupted. Returns the names of what was deleted."""
+        backups = sorted(
+            x.name
+            for x in self.backup_dir.glob(f"{database}-*")
+            if x.is_dir() and x.suffix not in (IN_PROGRESS_SUFFIX, FAILED_SUFFIX)
+        )
+        retention_count = int(self.config["RETENTION_COUNT"])
+        expired = backups[: max(0, len(backups) - retention_count)]
+        expired += [
+            x.name for x in self.backup_dir.glob(f"{database}-*{IN_PROGRESS_SUFFIX}")
+        ]
+        for name in expired:
+            shutil.rmtree(self.backup_dir / name)
+        return expired
+
+    def record(self, record: BackupRecord) -> None:
+        with open(self.backup_dir / MANIFEST_NAME, "a") as manifest:
+            manifest.write(json.dumps(asdict(record)) + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("project_root", type=Path)
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=os.environ.get("CONFIG_FILE_PATH"),
+        help="Defaults to backups/pg_backup.config in the project root",
+    )
+    args = parser.parse_args()
+
+    config_path = args.config or args.project_root / "backups" / "pg_backup.config"
+    if not config_path.is_file():
+        sys.exit(f"Could not load config file from {config_path}")
+    config = load_config(config_path)
+    backup_dir = Path(config["BACKUP_DIR"] or args.project_root / "backups")
+    backup_dir.mkdir(parents=True, exist_ok=True)
+
+    backup = Backup(config, backup_dir)
+    failed_databases = []
+    for database in config["DATABASE_WHITELIST"].replace(",", " ").split():
+        print(f"Backing up {database}")
+        try:
+            record = backup.back_up(database)
+        except RuntimeError as e:
+            print(f"Failed to back up {database}: {e}", file=sys.stderr)
+            failed_databases.append(database)
+            continue
+
+        backup.record(record)
+        if record.is_verified is False:
+            print(f"Failed to verify {record.name}: {record.error}", file=sys.stderr)
+            failed_databases.append(database)
+            continue
+        print(
+            f"Backed up {database} to {record.name}: "
+            f"{record.size_bytes / 1024 / 1024:.1f} MB in {record.dump_seconds:.1f}s"
+            + (
+                f", verified in {record.verify_seconds:.1f}s"
+                if record.is_verified
+                else ""
+            )
+        )
+        for name in backup.prune(database):
+            print(f"Deleted {name}")
+
+    if failed_databases:
+        sys.exit(f"Backups failed for {', '.join(failed_databases)}")
+    print("All database backups complete!")
+
+
+if __name__ == "__main__":
+    main()
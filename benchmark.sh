@@ -0,0 +1,8 @@
+#!/usr/bin/env bash
+if [ "$#" -lt 1 ]; then
+  echo "Please specify the benchmark to run"
+  echo "e.g. $0 benchmarks/bench_persistence.py"
+  exit 1
+fi
+
+env BOT_ENV=TEST PYTHONPATH=. poetry run python "$@"
@@ -0,0 +1,137 @@
+"""Compares the throughput of the sync and async services at high concurrency.
+
+Seeds synthetic data as bench_services.py does, then runs the same mix of read calls,
+the ones behind group summaries, through the sync services on a thread per concurrent
+call and through the async services on a single event loop. Needs asyncpg. Run against
+the test database with:
+    ./benchmark.sh benchmarks/bench_async_services.py --calls 2000 --concurrency 16 64 256
+"""
+
+import argparse
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from time import perf_counter
+from typing import Callable
+
+from benchmarks.bench_services import SCALES, SeededData, clean_up, seed
+from src.async_services import ASYNC_SERVICES, async_engine, async_read_engine
+from src.services import SERVICES
+from src.utils import SummaryType
+
+WARM_UP_CALLS = 100
+# Service, method and keyword arguments of a call about the given chat
+CallFactory = Callable[[SeededData, str, random.Random], tuple[str, str, dict]]
+CALL_FACTORIES: list[CallFactory] = [
+    lambda data, chat_id, rng: (
+        "question_record_service",
+        "get_records_by_users",
+        {
+            "user_ids": data.members_by_chat[chat_id],
+            "summary_type": rng.choice(list(SummaryType)),
+        },
+    ),
+    lambda data, chat_id, rng: (
+        "belong_service",
+        "get_users_in_chat",
+        {"chat_id": chat_id},
+    ),
+    lambda data, chat_id, rng: (
+        "pair_service",
+        "get_pairs_for_chat",
+        {"chat_id": chat_id},
+    ),
+    lambda data, chat_id, rng: (
+        "user_service",
+        "get_user_by_telegram_id",
+        {"telegram_id": rng.choice(data.user_telegram_ids)},
+    ),
+]
+
+
+def get_calls(data: SeededData, count: int, rng: random.Random) -> list:
+    calls = []
+    for _ in range(count):
+        chat_id = rng.choice(data.chat_ids)
+        calls.append(rng.choice(CALL_FACTORIES)(data, chat_id, rng))
+    return calls
+
+
+def run_sync(calls: list, concurrency: int) -> tuple[list[float], float]:
+    def timed_call(call: tuple[str, str, dict]) -> float:
+        service_name, method_name, kwargs = call
+        start = perf_counter()
+        getattr(getattr(SERVICES, service_name), method_name)(**kwargs)
+        return (perf_counter() - start) * 1000
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies_ms = list(executor.map(timed_call, calls))
+    return latencies_ms, perf_counter() - start
+
+
+async def run_async(calls: list, concurrency: int) -> tuple[list[float], float]:
+    pending = iter(calls)
+    latencies_ms: list[float] = []
+
+    async def worker() -> None:
+        for service_name, method_name, kwargs in pending:
+            start = perf_counter()
+            await getattr(getattr(ASYNC_SERVICES, service_name), method_name)(**kwargs)
+            latencies_ms.append((perf_counter() - start) * 1000)
+
+    start = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies_ms, perf_counter() - start
+
+
+def print_results(kind: str, latencies_ms: list[float], seconds: float) -> None:
+    latency_percentiles = quantiles(latencies_ms, n=100)
+    print(
+        f"  {kind:>5}: {len(latencies_ms) / seconds:7.1f} calls/s, "
+        f"p50 {latency_percentiles[49]:.1f} ms, p99 {latency_percentiles[98]:.1f} ms"
+    )
+
+
+async def run_all_async(calls: list, concurrency_levels: list[int]) -> list:
+    await run_async(calls[:WARM_UP_CALLS], 1)
+    results = [
+        await run_async(calls, concurrency) for concurrency in concurrency_levels
+    ]
+    # Connections must be closed on the event loop that opened them
+    await async_engine.dispose()
+    await async_read_engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", choices=SCALES.keys(), default="small")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    data = seed(SCALES[args.scale], rng)
+    try:
+        calls = get_calls(data, args.calls, rng)
+        run_sync(calls[:WARM_UP_CALLS], 1)
+        sync_results = [
+            run_sync(calls, concurrency) for concurrency in args.concurrency
+        ]
+        async_results = asyncio.run(run_all_async(calls, args.concurrency))
+    finally:
+        clean_up(data, [])
+
+    for concurrency, sync_result, async_result in zip(
+        args.concurrency, sync_results, async_results
+    ):
+        print(f"\nConcurrency {concurrency}: {args.calls} calls")
+        print_results("sync", *sync_result)
+        print_results("async", *async_result)
+
+
+if __name__ == "__main__":
+    main()
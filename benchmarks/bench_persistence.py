@@ -0,0 +1,99 @@
+"""Measures the cost of SQLPersistence with many active conversations.
+
+Run against the test database with:
+    ./benchmark.sh benchmarks/bench_persistence.py --conversations 10000
+"""
+
+import argparse
+from datetime import datetime
+from time import perf_counter
+from uuid import uuid4
+
+from src.database import ConversationState, PersistedData, session_scope
+from src.persistence import USER_DATA, SQLPersistence
+
+CONVERSATION_NAME = "bench_conv_handler"
+# Far above real Telegram ids, so that the benchmark never touches real data
+BASE_TELEGRAM_ID = 10**12
+
+
+def time_ms(func) -> float:
+    start = perf_counter()
+    func()
+    return (perf_counter() - start) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=10000)
+    parser.add_argument(
+        "--dirty-fraction",
+        type=float,
+        default=0.1,
+        help="Fraction of conversations that change between steady-state flushes",
+    )
+    args = parser.parse_args()
+
+    telegram_ids = [BASE_TELEGRAM_ID + i for i in range(args.conversations)]
+    persistence = SQLPersistence()
+    persistence.get_user_data()
+    persistence.get_conversations(CONVERSATION_NAME)
+
+    def start_conversations() -> None:
+        for i, telegram_id in enumerate(telegram_ids):
+            persistence.update_conversation(
+                CONVERSATION_NAME, (telegram_id, telegram_id), i % 5
+            )
+            persistence.update_user_data(
+                telegram_id,
+                {
+                    "INCOMPLETE_PAIRS": [
+                        {
+                            "id": str(uuid4()),
+                            "partner_name": f"User {i}",
+                            "started_at": datetime.now(),
+                        }
+                    ]
+                },
+            )
+
+    def advance_conversations() -> None:
+        dirty_count = int(len(telegram_ids) * args.dirty_fraction)
+        for i, telegram_id in enumerate(telegram_ids[:dirty_count]):
+            persistence.update_conversation(
+                CONVERSATION_NAME, (telegram_id, telegram_id), (i % 5) + 5
+            )
+
+    try:
+        update_ms = time_ms(start_conversations)
+        full_flush_ms = time_ms(persistence.flush)
+        time_ms(advance_conversations)
+        partial_flush_ms = time_ms(persistence.flush)
+        idle_flush_ms = time_ms(persistence.flush)
+        reload_ms = time_ms(lambda: SQLPersistence().get_user_data())
+    finally:
+        with session_scope() as session:
+            session.query(ConversationState).filter(
+                ConversationState.name == CONVERSATION_NAME
+            ).delete(synchronize_session=False)
+            session.query(PersistedData).filter(
+                PersistedData.kind == USER_DATA,
+                PersistedData.telegram_id.in_([str(id) for id in telegram_ids]),
+            ).delete(synchronize_session=False)
+
+    print(f"Active conversations: {args.conversations}")
+    print(
+        f"In-memory updates: {update_ms:.1f} ms "
+        f"({update_ms * 1000 / (2 * args.conversations):.2f} us per update)"
+    )
+    print(f"Flush, all dirty: {full_flush_ms:.1f} ms")
+    print(
+        f"Flush, {args.dirty_fraction:.0%} of conversations dirty: "
+        f"{partial_flush_ms:.1f} ms"
+    )
+    print(f"Flush, nothing dirty: {idle_flush_ms:.3f} ms")
+    print(f"Reload user_data on startup: {reload_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
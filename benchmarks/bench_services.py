@@ -0,0 +1,434 @@
+"""Times every public method of the database services against seeded synthetic data.
+
+The data is generated from a fixed seed, so runs at the same scale are comparable
+between commits. Results are written as JSON. Run against the test database with:
+    ./benchmark.sh benchmarks/bench_services.py --scale small --output results.json
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import uuid
+from datetime import datetime, timedelta, timezone
+from statistics import median
+from time import perf_counter
+from typing import Callable, Iterator
+
+from src.cache import SummaryCache
+from src.config import APP_CONFIG
+from src.database import (
+    Belong,
+    Chat,
+    InterviewPair,
+    QuestionRecord,
+    User,
+    session_scope,
+)
+from src.leaderboards import Leaderboards
+from src.partitions import create_question_record_partitions
+from src.services import (
+    BelongService,
+    ChatService,
+    InterviewPairService,
+    QuestionRecordService,
+    UserService,
+)
+from src.utils import SummaryType, get_start_of_week
+
+SCALES = {
+    "small": {"users": 1_000, "chats": 10, "records": 50_000},
+    "medium": {"users": 10_000, "chats": 100, "records": 500_000},
+    "large": {"users": 100_000, "chats": 1_000, "records": 5_000_000},
+}
+# Far above real Telegram ids, so that the benchmark never touches real data
+BASE_TELEGRAM_ID = 10**12
+INSERT_BATCH_SIZE = 50_000
+DELETE_BATCH_SIZE = 10_000
+# More weeks than PAIR_ARCHIVE_HORIZON_WEEKS, so that there are pairs to archive
+PAIR_HISTORY_WEEKS = 12
+RECORD_HISTORY_DAYS = 365
+PLATFORMS = ["leetcode", "hackerrank", "other"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+
+class SeededData:
+    def __init__(self):
+        self.user_ids: list[str] = []
+        self.user_telegram_ids: list[str] = []
+        self.chat_ids: list[str] = []
+        self.chat_telegram_ids: list[str] = []
+        self.members_by_chat: dict[str, list[str]] = {}
+        # Pairs started this week, as (pair_id, user_one_id, user_two_id)
+        self.current_pairs_by_chat: dict[str, list[tuple[str, str, str]]] = {}
+
+
+def batched(rows: Iterator[dict], size: int) -> Iterator[list[dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_rows(table, rows: Iterator[dict]) -> None:
+    for batch in batched(rows, INSERT_BATCH_SIZE):
+        with session_scope() as session:
+            session.execute(table.insert(), batch)
+
+
+def seed(scale: dict, rng: random.Random) -> SeededData:
+    data = SeededData()
+
+    def new_id() -> str:
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    data.user_ids = [new_id() for _ in range(scale["users"])]
+    data.user_telegram_ids = [str(BASE_TELEGRAM_ID + i) for i in range(scale["users"])]
+    insert_rows(
+        User.__table__,
+        (
+            {"id": id, "full_name": f"Bench User {i}", "telegram_id": telegram_id}
+            for i, (id, telegram_id) in enumerate(
+                zip(data.user_ids, data.user_telegram_ids)
+            )
+        ),
+    )
+
+    data.chat_ids = [new_id() for _ in range(scale["chats"])]
+    data.chat_telegram_ids = [str(-BASE_TELEGRAM_ID - i) for i in range(scale["chats"])]
+    insert_rows(
+        Chat.__table__,
+        (
+            {"id": id, "title": f"Bench Chat {i}", "telegram_id": telegram_id}
+            for i, (id, telegram_id) in enumerate(
+                zip(data.chat_ids, data.chat_telegram_ids)
+            )
+        ),
+    )
+
+    # Every user is in one to three chats
+    data.members_by_chat = {chat_id: [] for chat_id in data.chat_ids}
+    for user_id in data.user_ids:
+        for chat_id in rng.sample(
+            data.chat_ids, min(len(data.chat_ids), rng.randint(1, 3))
+        ):
+            data.members_by_chat[chat_id].append(user_id)
+    insert_rows(
+        Belong.__table__,
+        (
+            {"id": new_id(), "user_id": user_id, "chat_id": chat_id}
+            for chat_id, user_ids in data.members_by_chat.items()
+            for user_id in user_ids
+        ),
+    )
+
+    now = datetime.now(timezone.utc)
+    create_question_record_partitions(
+        APP_CONFIG["PARTITION_MONTHS_AHEAD"],
+        months_behind=RECORD_HISTORY_DAYS // 28 + 1,
+    )
+    insert_rows(
+        QuestionRecord.__table__,
+        (
+            {
+                "id": new_id(),
+                "user_id": rng.choice(data.user_ids),
+                "platform": rng.choice(PLATFORMS),
+                "question_name": f"Question {rng.randrange(3000)}",
+                "difficulty": rng.choice(DIFFICULTIES),
+                "created_at": now
+                - timedelta(seconds=rng.randrange(RECORD_HISTORY_DAYS * 86400)),
+            }
+            for _ in range(scale["records"])
+        ),
+    )
+
+    # A round of pairs per chat for this week and each of the previous weeks, with
+    # every past pair completed
+    monday = get_start_of_week()
+    pair_rows = []
+    for chat_id, user_ids in data.members_by_chat.items():
+        data.current_pairs_by_chat[chat_id] = []
+        for week in range(PAIR_HISTORY_WEEKS):
+            shuffled = rng.sample(user_ids, len(user_ids))
+            started_at = monday - timedelta(weeks=week)
+            for user_one_id, user_two_id in zip(shuffled[::2], shuffled[1::2]):
+                pair_id = new_id()
+                pair_rows.append(
+                    {
+                        "id": pair_id,
+                        "user_one_id": user_one_id,
+                        "user_two_id": user_two_id,
+                        "chat_id": chat_id,
+                        "started_at": started_at,
+                        "is_completed": week > 0,
+                        "completed_at": (
+                            started_at + timedelta(days=3) if week > 0 else None
+                        ),
+                    }
+                )
+                if week == 0:
+                    data.current_pairs_by_chat[chat_id].append(
+                        (pair_id, user_one_id, user_two_id)
+                    )
+    insert_rows(InterviewPair.__table__, iter(pair_rows))
+
+    return data
+
+
+def consume(rows: Iterator[tuple]) -> int:
+    """Reads every row of a streamed export, which is only queried as it is read."""
+    return sum(1 for _ in rows)
+
+
+def clean_up(data: SeededData, extra_user_telegram_ids: list[str]) -> None:
+    """Deletes the seeded users and chats, which cascades to everything else."""
+    for column, values in [
+        (User.telegram_id, data.user_telegram_ids + extra_user_telegram_ids),
+        (Chat.id, data.chat_ids),
+    ]:
+        for i in range(0, len(values), DELETE_BATCH_SIZE):
+            with session_scope() as session:
+                session.query(column.class_).filter(
+                    column.in_(values[i : i + DELETE_BATCH_SIZE])
+                ).delete(synchronize_session=False)
+
+
+def get_benchmarks(
+    data: SeededData, rng: random.Random, new_user_telegram_ids: list[str]
+) -> dict[str, Callable[[int], object]]:
+    """Returns a call per method, given the index of the repetition. Methods that write
+    get fresh arguments on every repetition."""
+    summary_cache = SummaryCache(APP_CONFIG["SUMMARY_CACHE_SIZE"])
+    leaderboards = Leaderboards(
+        lambda chat_id, summary_type: record_service.get_record_counts_for_chat(
+            chat_id=chat_id, summary_type=summary_type
+        )
+    )
+    user_service = UserService(APP_CONFIG, summary_cache, leaderboards)
+    chat_service = ChatService(APP_CONFIG)
+    belong_service = BelongService(APP_CONFIG, summary_cache, leaderboards)
+    record_service = QuestionRecordService(APP_CONFIG, summary_cache, leaderboards)
+    pair_service = InterviewPairService(APP_CONFIG, summary_cache)
+
+    # The chat with the most members, as summaries are slowest for it
+    chat_id = max(data.members_by_chat, key=lambda x: len(data.members_by_chat[x]))
+    chat_index = data.chat_ids.index(chat_id)
+    members = data.members_by_chat[chat_id]
+    user_id = members[0]
+    member_set = set(members)
+    outsiders = [id for id in data.user_ids if id not in member_set]
+    current_pairs = data.current_pairs_by_chat[chat_id]
+    # The first two pairs are swapped back and forth, the rest are completed
+    (swap_pair_one, swap_user_one, _), (swap_pair_two, swap_user_two, _) = (
+        current_pairs[:2]
+    )
+    pairs_to_complete = [pair_id for pair_id, _, _ in current_pairs[2:]]
+    telegram_ids = [
+        data.chat_telegram_ids[chat_index],
+        str(-BASE_TELEGRAM_ID - len(data.chat_ids)),
+    ]
+
+    def create_user(i: int) -> dict:
+        new_user_telegram_ids.append(str(BASE_TELEGRAM_ID + len(data.user_ids) + i))
+        return user_service.create_if_not_exists(
+            full_name="New Bench User", telegram_id=new_user_telegram_ids[-1]
+        )
+
+    def swap(i: int) -> list:
+        # Every swap undoes the previous one
+        user_one_id, user_two_id = (
+            (swap_user_one, swap_user_two)
+            if i % 2 == 0
+            else (swap_user_two, swap_user_one)
+        )
+        return pair_service.swap_pairs_for_users(
+            user_one_id=user_one_id,
+            user_two_id=user_two_id,
+            pair_one_id=swap_pair_one,
+            pair_two_id=swap_pair_two,
+        )
+
+    return {
+        "UserService.create_if_not_exists": create_user,
+        "UserService.get_user_by_telegram_id": lambda i: user_service.get_user_by_telegram_id(
+            telegram_id=data.user_telegram_ids[i]
+        ),
+        "UserService.get_user_by_id": lambda i: user_service.get_user_by_id(
+            id=data.user_ids[i]
+        ),
+        "UserService.get_users_by_id": lambda i: user_service.get_users_by_id(
+            ids=members
+        ),
+        "ChatService.create_if_not_exists": lambda i: chat_service.create_if_not_exists(
+            title="Bench Chat",
+            telegram_id=data.chat_telegram_ids[i % len(data.chat_ids)],
+        ),
+        "ChatService.get_chat_by_telegram_id": lambda i: chat_service.get_chat_by_telegram_id(
+            telegram_id=data.chat_telegram_ids[i % len(data.chat_ids)]
+        ),
+        "ChatService.get_chats_by_id": lambda i: chat_service.get_chats_by_id(
+            ids=data.chat_ids
+        ),
+        "ChatService.get_all_chats": lambda i: chat_service.get_all_chats(),
+        "ChatService.migrate_chat_telegram_id": lambda i: chat_service.migrate_chat_telegram_id(
+            old_telegram_id=telegram_ids[i % 2],
+            new_telegram_id=telegram_ids[(i + 1) % 2],
+        ),
+        "BelongService.add_user_to_chat_if_not_inside": lambda i: belong_service.add_user_to_chat_if_not_inside(
+            user_id=outsiders[i], chat_id=chat_id
+        ),
+        "BelongService.remove_user_from_chat_if_inside": lambda i: belong_service.remove_user_from_chat_if_inside(
+            user_id=outsiders[i], chat_id=chat_id
+        ),
+        "BelongService.get_users_in_chat": lambda i: belong_service.get_users_in_chat(
+            chat_id=chat_id
+        ),
+        "BelongService.is_user_inside_chat": lambda i: belong_service.is_user_inside_chat(
+            user_id=members[i], chat_id=chat_id
+        ),
+        "BelongService.is_user_opted_out": lambda i: belong_service.is_user_opted_out(
+            user_id=members[i], chat_id=chat_id
+        ),
+        "BelongService.opt_in_out": lambda i: belong_service.opt_in_out(
+            user_id=user_id, chat_id=chat_id, should_opt_out=i % 2 == 0
+        ),
+        "QuestionRecordService.create_question_record": lambda i: record_service.create_question_record(
+            user_id=rng.choice(members),
+            platform=rng.choice(PLATFORMS),
+            question_name="Bench Question",
+            difficulty=rng.choice(DIFFICULTIES),
+        ),
+        "QuestionRecordService.get_records_by_user": lambda i: record_service.get_records_by_user(
+            user_id=members[i], summary_type=SummaryType.ALL
+        ),
+        "QuestionRecordService.get_records_by_users": lambda i: record_service.get_records_by_users(
+            user_ids=members, summary_type=list(SummaryType)[i % len(SummaryType)]
+        ),
+        "QuestionRecordService.get_record_counts_for_all_chats": lambda i: record_service.get_record_counts_for_all_chats(
+            summary_type=SummaryType.WEEKLY, is_last_week=True
+        ),
+        "QuestionRecordService.get_record_counts_for_chat": lambda i: record_service.get_record_counts_for_chat(
+            chat_id=chat_id, summary_type=SummaryType.WEEKLY
+        ),
+        "QuestionRecordService.get_record_stats": lambda i: record_service.get_record_stats(
+            user_ids=members, months=APP_CONFIG["STATS_MONTHS"]
+        ),
+        "QuestionRecordService.export_records": lambda i: consume(
+            record_service.export_records(user_ids=members)
+        ),
+        "InterviewPairService.add_pairs_for_chat": lambda i: pair_service.add_pairs_for_chat(
+            pairs=[[outsiders[2 * i], outsiders[2 * i + 1]]], chat_id=chat_id
+        ),
+        "InterviewPairService.add_pairs_for_chats": lambda i: pair_service.add_pairs_for_chats(
+            pairs_by_chat={chat_id: [[outsiders[-2 * i - 1], outsiders[-2 * i - 2]]]}
+        ),
+        "InterviewPairService.get_pairs_for_chat": lambda i: pair_service.get_pairs_for_chat(
+            chat_id=chat_id, is_last_week=i % 2 == 1
+        ),
+        "InterviewPairService.get_pairs_for_chats": lambda i: pair_service.get_pairs_for_chats(
+            chat_ids=data.chat_ids
+        ),
+        "InterviewPairService.get_pair_completion_for_all_chats": lambda i: pair_service.get_pair_completion_for_all_chats(
+            is_last_week=True
+        ),
+        "InterviewPairService.get_unpaired_users_for_all_chats": lambda i: pair_service.get_unpaired_users_for_all_chats(),
+        "InterviewPairService.get_pairs_for_user": lambda i: pair_service.get_pairs_for_user(
+            user_id=members[i], is_current=i % 2 == 0
+        ),
+        "InterviewPairService.get_current_pairs_for_users_in_chat": lambda i: pair_service.get_current_pairs_for_users_in_chat(
+            chat_id=chat_id, user_ids=members
+        ),
+        # Only the seeded pairs are archived, not the rest of the database's
+        "InterviewPairService.archive_old_pairs": lambda i: pair_service.archive_old_pairs(
+            batch_size=APP_CONFIG["PAIR_ARCHIVE_BATCH_SIZE"], chat_ids=data.chat_ids
+        ),
+        "InterviewPairService.get_archived_pairs_for_user": lambda i: pair_service.get_archived_pairs_for_user(
+            user_id=members[i], page=0, page_size=APP_CONFIG["PAST_PAIRS_PAGE_SIZE"]
+        ),
+        "InterviewPairService.export_pairs_for_user": lambda i: consume(
+            pair_service.export_pairs_for_user(user_id=members[i])
+        ),
+        "InterviewPairService.export_pairs_for_chat": lambda i: consume(
+            pair_service.export_pairs_for_chat(chat_id=chat_id)
+        ),
+        "InterviewPairService.mark_pair_as_completed": lambda i: pair_service.mark_pair_as_completed(
+            id=pairs_to_complete[i]
+        ),
+        "InterviewPairService.swap_pairs_for_users": swap,
+    }
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", choices=SCALES.keys(), default="small")
+    parser.add_argument("--users", type=int, help="Overrides the scale's users")
+    parser.add_argument("--chats", type=int, help="Overrides the scale's chats")
+    parser.add_argument("--records", type=int, help="Overrides the scale's records")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="File to write the JSON results to")
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    rng = random.Random(args.seed)
+    seed_start = perf_counter()
+    data = seed(scale, rng)
+    seed_seconds = perf_counter() - seed_start
+
+    new_user_telegram_ids: list[str] = []
+    results = {}
+    try:
+        for name, benchmark in get_benchmarks(data, rng, new_user_telegram_ids).items():
+            timings_ms = []
+            for i in range(args.repeat):
+                start = perf_counter()
+                benchmark(i)
+                timings_ms.append((perf_counter() - start) * 1000)
+            results[name] = {
+                "min_ms": round(min(timings_ms), 3),
+                "median_ms": round(median(timings_ms), 3),
+                "max_ms": round(max(timings_ms), 3),
+            }
+            print(f"{name}: {results[name]['median_ms']:.1f} ms")
+    finally:
+        clean_up(data, new_user_telegram_ids)
+
+    output = json.dumps(
+        {
+            "commit": get_commit(),
+            "ran_at": datetime.now(timezone.utc).isoformat(),
+            "scale": scale,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "seed_seconds": round(seed_seconds, 1),
+            "results": results,
+        },
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
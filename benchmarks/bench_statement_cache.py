@@ -0,0 +1,90 @@
+"""Measures the Python overhead of the hottest service calls before their query runs.
+
+For each call, times everything from calling the service method until the driver is
+handed the first query, which covers validation, building the statement, computing its
+cache key and compiling it or finding it in the compiled cache. Also counts how often
+the compiled cache was hit. Seeds synthetic data as bench_services.py does. Run it
+before and after a change to compare them, against the test database with:
+    ./benchmark.sh benchmarks/bench_statement_cache.py --repeat 500
+"""
+
+import argparse
+import random
+import threading
+from collections import Counter
+from statistics import median
+from time import perf_counter
+from typing import Callable
+
+from sqlalchemy import event
+
+from benchmarks.bench_services import SCALES, clean_up, seed
+from src.database import engines
+from src.services import SERVICES
+from src.utils import SummaryType
+
+_call = threading.local()
+
+
+def _on_first_query(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_call, "first_query_at", None) is None:
+        _call.first_query_at = perf_counter()
+    _call.cache_stats[
+        "hit" if context.cache_hit is context.dialect.CACHE_HIT else "miss"
+    ] += 1
+
+
+def measure(call: Callable[[], object], repeat: int) -> tuple[list[float], Counter]:
+    overheads_us = []
+    _call.cache_stats = Counter()
+    for _ in range(repeat):
+        _call.first_query_at = None
+        start = perf_counter()
+        call()
+        overheads_us.append((_call.first_query_at - start) * 1_000_000)
+    return overheads_us, _call.cache_stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", choices=SCALES.keys(), default="small")
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = seed(SCALES[args.scale], random.Random(args.seed))
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _on_first_query)
+    try:
+        chat_id = max(data.members_by_chat, key=lambda x: len(data.members_by_chat[x]))
+        members = data.members_by_chat[chat_id]
+        calls = {
+            "get_records_by_users": lambda: (
+                SERVICES.question_record_service.get_records_by_users(
+                    user_ids=members, summary_type=SummaryType.WEEKLY
+                )
+            ),
+            "get_pairs_for_chat": lambda: SERVICES.pair_service.get_pairs_for_chat(
+                chat_id=chat_id
+            ),
+            "get_users_in_chat": lambda: SERVICES.belong_service.get_users_in_chat(
+                chat_id=chat_id
+            ),
+        }
+        for name, call in calls.items():
+            # The first call compiles the statement
+            call()
+            overheads_us, cache_stats = measure(call, args.repeat)
+            print(
+                f"{name}: {median(overheads_us):.0f} us median overhead, "
+                f"{min(overheads_us):.0f} us min, "
+                f"{cache_stats['hit']} cache hits, {cache_stats['miss']} misses"
+            )
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", _on_first_query)
+        clean_up(data, [])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Replays synthetic updates through the bot's real handlers to measure throughput.
+
+Updates (commands, /add_question conversations and member joins) are generated from
+a fixed seed and processed by a dispatcher with every handler of the bot registered.
+Replies go to a fake bot that records them instead of calling Telegram. Run against
+the test database with:
+    ./benchmark.sh benchmarks/load_replay.py --updates 2000 --concurrency 1 4 16
+"""
+
+import argparse
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from queue import Queue
+from statistics import quantiles
+from threading import Lock
+from time import perf_counter, time
+from typing import Optional
+
+from telegram import Bot, Update
+from telegram.ext import DictPersistence, Dispatcher
+
+from src.app import register_handlers
+from src.database import Chat, User, session_scope, track_queries
+from src.metrics import METRICS
+
+# Far above real Telegram ids, so that the tool never touches real data
+BASE_TELEGRAM_ID = 10**12
+BOT_USERNAME = "LoadReplayBot"
+GROUP_COMMANDS = [
+    "/week",
+    "/last_week",
+    "/month",
+    "/all",
+    "/all_unique",
+    "/week_detailed",
+    "/members",
+    "/interview_pairs",
+    "/interview_pairs_last_week",
+    "/add_me",
+    "/opt_in",
+    "/opt_out",
+]
+PRIVATE_COMMANDS = ["/start", "/week", "/past_pairs"]
+# Relative frequency of each kind of session
+SESSION_WEIGHTS = {"group_command": 70, "private_command": 15, "add": 10, "join": 5}
+
+
+class FakeBot(Bot):
+    """A bot that records the requests it would have sent to Telegram."""
+
+    def __init__(self):
+        super().__init__(token=f"{BASE_TELEGRAM_ID}:load-replay")
+        self.requests: Counter = Counter()
+        self._lock = Lock()
+        self._message_ids = count(1)
+
+    def _post(
+        self,
+        endpoint: str,
+        data: Optional[dict] = None,
+        timeout=None,
+        api_kwargs: Optional[dict] = None,
+    ):
+        data = {**(data or {}), **(api_kwargs or {})}
+        with self._lock:
+            self.requests[endpoint] += 1
+            message_id = next(self._message_ids)
+
+        if endpoint == "getMe":
+            return {
+                "id": BASE_TELEGRAM_ID,
+                "is_bot": True,
+                "first_name": "Load Replay",
+                "username": BOT_USERNAME,
+            }
+        if endpoint.startswith("send") or endpoint.startswith("edit"):
+            return {
+                "message_id": message_id,
+                "date": int(time()),
+                "chat": {"id": int(data.get("chat_id", 0)), "type": "private"},
+                "text": data.get("text", ""),
+            }
+        return True
+
+
+class UpdateFactory:
+    """Builds the updates sent by a synthetic population of users and chats."""
+
+    def __init__(self, bot: Bot, rng: random.Random, users: int, chats: int):
+        self.bot = bot
+        self.rng = rng
+        self.user_ids = [BASE_TELEGRAM_ID + i for i in range(users)]
+        self.chat_ids = [-BASE_TELEGRAM_ID - i for i in range(chats)]
+        self.members_by_chat: dict[int, list[int]] = {id: [] for id in self.chat_ids}
+        self.next_user_id = BASE_TELEGRAM_ID + users
+        self._update_ids = count(1)
+
+    def setup_sessions(self) -> list[list[Update]]:
+        """Every chat is created, and then every user joins one to three chats."""
+        for user_id in self.user_ids:
+            for chat_id in self.rng.sample(
+                self.chat_ids, min(len(self.chat_ids), self.rng.randint(1, 3))
+            ):
+                self.members_by_chat[chat_id].append(user_id)
+        return [
+            [self.__message(chat_id, user_ids[0], new_chat_members=user_ids)]
+            for chat_id, user_ids in self.members_by_chat.items()
+            if user_ids
+        ]
+
+    def load_sessions(self, sessions: int) -> list[list[Update]]:
+        kinds = self.rng.choices(
+            list(SESSION_WEIGHTS), weights=list(SESSION_WEIGHTS.values()), k=sessions
+        )
+        return [getattr(self, f"_{kind}_session")() for kind in kinds]
+
+    def _group_command_session(self) -> list[Update]:
+        chat_id, user_id = self.__random_member()
+        return [self.__message(chat_id, user_id, self.rng.choice(GROUP_COMMANDS))]
+
+    def _private_command_session(self) -> list[Update]:
+        user_id = self.rng.choice(self.user_ids)
+        return [self.__message(user_id, user_id, self.rng.choice(PRIVATE_COMMANDS))]
+
+    def _add_session(self) -> list[Update]:
+        """A complete /add_question conversation, with the details entered by hand."""
+        user_id = self.rng.choice(self.user_ids)
+        replies = [
+            "/add_question",
+            "https://example.com/question",
+            f"Question {self.rng.randrange(3000)}",
+            self.rng.choice(["Easy", "Medium", "Hard"]),
+            "Yes",
+        ]
+        return [self.__message(user_id, user_id, text) for text in replies]
+
+    def _join_session(self) -> list[Update]:
+        chat_id = self.rng.choice(self.chat_ids)
+        user_id = self.next_user_id
+        self.next_user_id += 1
+        self.members_by_chat[chat_id].append(user_id)
+        return [self.__message(chat_id, user_id, new_chat_members=[user_id])]
+
+    def __random_member(self) -> tuple[int, int]:
+        chat_id = self.rng.choice(
+            [id for id, members in self.members_by_chat.items() if members]
+        )
+        return chat_id, self.rng.choice(self.members_by_chat[chat_id])
+
+    def __message(
+        self,
+        chat_id: int,
+        user_id: int,
+        text: Optional[str] = None,
+        new_chat_members: Optional[list[int]] = None,
+    ) -> Update:
+        message = {
+            "message_id": next(self._update_ids),
+            "date": int(time()),
+            "chat": (
+                {"id": chat_id, "type": "private", "first_name": f"User {user_id}"}
+                if chat_id > 0
+                else {"id": chat_id, "type": "group", "title": f"Chat {chat_id}"}
+            ),
+            "from": self.__user(user_id),
+        }
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [
+                    {"type": "bot_command", "offset": 0, "length": len(text)}
+                ]
+        if new_chat_members is not None:
+            message["new_chat_members"] = [self.__user(id) for id in new_chat_members]
+        return Update.de_json(
+            {"update_id": message["message_id"], "message": message}, self.bot
+        )
+
+    @staticmethod
+    def __user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+
+class Results:
+    def __init__(self):
+        self._lock = Lock()
+        self.latencies_ms: list[float] = []
+        self.query_counts: list[int] = []
+
+    def record(self, latency_ms: float, query_count: int) -> None:
+        with self._lock:
+            self.latencies_ms.append(latency_ms)
+            self.query_counts.append(query_count)
+
+
+def replay(
+    dispatcher: Dispatcher, sessions: list[list[Update]], concurrency: int
+) -> tuple[Results, float]:
+    """Processes the sessions on a pool of threads. Updates within a session are
+    processed in order, like the updates of a single conversation."""
+    results = Results()
+
+    def process_session(updates: list[Update]) -> None:
+        for update in updates:
+            start = perf_counter()
+            with track_queries() as query_stats:
+                dispatcher.process_update(update)
+            results.record((perf_counter() - start) * 1000, query_stats.count)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Consume the results so that exceptions are raised
+        list(executor.map(process_session, sessions))
+    return results, perf_counter() - start
+
+
+def clean_up(factory: UpdateFactory) -> None:
+    """Deletes the synthetic users and chats, which cascades to everything else."""
+    user_telegram_ids = [
+        str(id) for id in range(BASE_TELEGRAM_ID, factory.next_user_id)
+    ]
+    chat_telegram_ids = [str(id) for id in factory.chat_ids]
+    with session_scope() as session:
+        session.query(User).filter(User.telegram_id.in_(user_telegram_ids)).delete(
+            synchronize_session=False
+        )
+        session.query(Chat).filter(Chat.telegram_id.in_(chat_telegram_ids)).delete(
+            synchronize_session=False
+        )
+
+
+def print_results(concurrency: int, results: Results, seconds: float) -> None:
+    latency_percentiles = quantiles(results.latencies_ms, n=100)
+    print(f"\nConcurrency {concurrency}: {len(results.latencies_ms)} updates")
+    print(f"  Throughput: {len(results.latencies_ms) / seconds:.1f} updates/s")
+    print(
+        f"  Latency: p50 {latency_percentiles[49]:.1f} ms, "
+        f"p99 {latency_percentiles[98]:.1f} ms"
+    )
+    print(
+        "  Queries per update: "
+        f"{sum(results.query_counts) / len(results.query_counts):.1f} mean, "
+        f"{max(results.query_counts)} max"
+    )
+    print("  Slowest handlers by total time:")
+    for name, metrics in METRICS.get_top_handlers(5):
+        print(
+            f"    {name}: {metrics.latency.count} updates, "
+            f"p50 {metrics.latency.quantile(0.5) * 1000:.0f} ms, "
+            f"p99 {metrics.latency.quantile(0.99) * 1000:.0f} ms, "
+            f"{metrics.queries.mean:.1f} queries/update"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument(
+        "--updates",
+        type=int,
+        default=2000,
+        help="Approximate number of updates to replay at each concurrency",
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    bot = FakeBot()
+    dispatcher = Dispatcher(bot, Queue(), persistence=DictPersistence())
+    register_handlers(dispatcher)
+    factory = UpdateFactory(bot, random.Random(args.seed), args.users, args.chats)
+
+    try:
+        setup_results, setup_seconds = replay(
+            dispatcher, factory.setup_sessions(), max(args.concurrency)
+        )
+        print(
+            f"Set up {args.users} users in {args.chats} chats with "
+            f"{len(setup_results.latencies_ms)} updates in {setup_seconds:.1f} s"
+        )
+
+        # An /add_question session is five updates, and every other session is one
+        mean_session_length = (
+            sum(SESSION_WEIGHTS.values()) + 4 * SESSION_WEIGHTS["add"]
+        ) / sum(SESSION_WEIGHTS.values())
+        for concurrency in args.concurrency:
+            sessions = factory.load_sessions(int(args.updates / mean_session_length))
+            METRICS.reset()
+            results, seconds = replay(dispatcher, sessions, concurrency)
+            print_results(concurrency, results, seconds)
+    finally:
+        clean_up(factory)
+
+    print("\nRequests sent to Telegram:")
+    for endpoint, request_count in bot.requests.most_common():
+        print(f"  {endpoint}: {request_count}")
+
+
+if __name__ == "__main__":
+    main()
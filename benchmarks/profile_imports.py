@@ -0,0 +1,85 @@
+"""Profiles the imports done when the bot starts, to find what slows down a cold start.
+
+Imports src.app in a fresh interpreter with -X importtime, and reports the total import
+time and the slowest modules. Run with:
+    ./benchmark.sh benchmarks/profile_imports.py --top 20
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+
+
+@dataclass
+class ImportTime:
+    name: str
+    # Microseconds, as reported by -X importtime
+    self_us: int
+    cumulative_us: int
+    # 0 for modules imported directly by the profiled module's import
+    depth: int
+
+
+def profile_imports(module: str) -> list[ImportTime]:
+    env = {**os.environ, "PYTHONPATH": os.getcwd()}
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    import_times = []
+    for line in process.stderr.splitlines():
+        # e.g. "import time:       351 |        351 |   telegram.constants"
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        import_times.append(
+            ImportTime(name.strip(), int(self_us), int(cumulative_us), depth)
+        )
+    if process.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{process.stderr[-3000:]}")
+    return import_times
+
+
+def print_top(title: str, import_times: list[ImportTime], top: int) -> None:
+    print(f"\n{title}:")
+    for import_time in import_times[:top]:
+        print(
+            f"  {import_time.cumulative_us / 1000:8.1f} ms cumulative "
+            f"{import_time.self_us / 1000:8.1f} ms self  {import_time.name}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="src.app")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    import_times = profile_imports(args.module)
+    # Only top level imports count towards the total, as the rest are nested in them
+    total_us = sum(x.cumulative_us for x in import_times if x.depth == 0)
+
+    print(
+        f"Importing {args.module} took {total_us / 1000:.1f} ms "
+        f"over {len(import_times)} modules"
+    )
+    print_top(
+        "Slowest modules including their imports",
+        sorted(import_times, key=lambda x: -x.cumulative_us),
+        args.top,
+    )
+    print_top(
+        "Slowest modules by themselves",
+        sorted(import_times, key=lambda x: -x.self_us),
+        args.top,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+#!/usr/bin/env bash
+if [ "$#" -lt 1 ]; then
+  echo "Please specify the CSV file to import"
+  echo "e.g. $0 records.csv --telegram-id 123456789"
+  exit 1
+fi
+
+env PYTHONPATH=. poetry run python src/importer.py "$@"
@@ -286,4 +286,6 @@ add_conv_handler = ConversationHandler(
         THANKS: [MessageHandler(Filters.regex("^(Yes|No)$"), thanks)],
     },
     fallbacks=[CommandHandler("cancel", cancel)],
+    name="add_conv_handler",
+    persistent=True,
 )
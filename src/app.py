@@ -1,4 +1,14 @@
-from telegram.ext import CommandHandler, Filters, MessageHandler, Updater
+from datetime import timedelta
+from typing import Optional
+
+from telegram.ext import (
+    CommandHandler,
+    Dispatcher,
+    Filters,
+    JobQueue,
+    MessageHandler,
+    Updater,
+)
 
 from src.add_handlers import add_conv_handler
 from src.chat_handlers import (
@@ -12,28 +22,42 @@ from src.chat_handlers import (
     opt_out,
 )
 from src.config import APP_CONFIG
-from src.general_handlers import cancel, error_handler, start, unknown_message
+from src.database import with_read_your_writes
+from src.digest_handlers import digest_dry_run, weekly_digest_job
+from src.error_reports import send_error_digest_job
+from src.export_handlers import export
+from src.general_handlers import cancel, error_handler, perf, start, unknown_message
+from src.import_handlers import import_conv_handler
+from src.metrics import instrument_handlers, start_metrics_server
 from src.pair_handlers import (
+    archive_pairs_job,
     complete_conv_handler,
     interview_pairs,
     interview_pairs_last_week,
     past_pairs,
     swap_conv_handler,
+    weekly_pairing_job,
 )
+from src.partitions import create_partitions_job
+from src.persistence import SQLPersistence
+from src.query_monitor import send_query_reports_job
 from src.stats_handlers import (
     all_questions,
     all_unique,
+    cache_stats,
     last_week,
     month,
+    rank,
+    stats,
+    top,
     week,
     week_detailed,
 )
+from src.utils import get_callback_handlers
 
 
-def main() -> None:
-    updater = Updater(APP_CONFIG["BOT_ACCESS_TOKEN"])
-    dispatcher = updater.dispatcher
-
+def register_handlers(dispatcher: Dispatcher) -> None:
+    """Adds every handler of the bot to the dispatcher, and instruments them."""
     # Individual commands
     dispatcher.add_handler(CommandHandler("start", start))
     dispatcher.add_handler(CommandHandler("week", week))
@@ -41,9 +65,12 @@ def main() -> None:
     dispatcher.add_handler(CommandHandler("month", month))
     dispatcher.add_handler(CommandHandler("all", all_questions))
     dispatcher.add_handler(CommandHandler("all_unique", all_unique))
+    dispatcher.add_handler(CommandHandler("stats", stats))
+    dispatcher.add_handler(CommandHandler("export", export))
     dispatcher.add_handler(CommandHandler("past_pairs", past_pairs))
     dispatcher.add_handler(add_conv_handler)
     dispatcher.add_handler(complete_conv_handler)
+    dispatcher.add_handler(import_conv_handler)
 
     # Group commands
     dispatcher.add_handler(CommandHandler("members", chat_members))
@@ -56,6 +83,13 @@ def main() -> None:
     dispatcher.add_handler(swap_conv_handler)
     dispatcher.add_handler(CommandHandler("opt_in", opt_in))
     dispatcher.add_handler(CommandHandler("opt_out", opt_out))
+    dispatcher.add_handler(CommandHandler("rank", rank))
+    dispatcher.add_handler(CommandHandler("top", top))
+
+    # Developer commands
+    dispatcher.add_handler(CommandHandler("digest_dry_run", digest_dry_run))
+    dispatcher.add_handler(CommandHandler("cache_stats", cache_stats))
+    dispatcher.add_handler(CommandHandler("perf", perf))
 
     # General handlers
     dispatcher.add_handler(CommandHandler("cancel", cancel))
@@ -76,6 +110,89 @@ def main() -> None:
     )
     dispatcher.add_error_handler(error_handler)
 
+    # Reads in every handler see the update's own writes, whether or not the handler
+    # is instrumented
+    for handler in get_callback_handlers(dispatcher):
+        handler.callback = with_read_your_writes(handler.callback)
+
+    # Instrumentation
+    instrument_handlers(dispatcher)
+
+
+def schedule_jobs(job_queue: JobQueue) -> None:
+    """Schedules the jobs that run once for the whole bot. Their reads see their own
+    writes."""
+    job_queue.run_repeating(
+        with_read_your_writes(create_partitions_job),
+        interval=timedelta(days=1),
+        first=0,
+        name="create_partitions",
+    )
+    job_queue.run_daily(
+        with_read_your_writes(weekly_pairing_job),
+        time=APP_CONFIG["WEEKLY_PAIRING_TIME"],
+        days=(0,),  # Monday
+        name="weekly_pairing",
+    )
+    job_queue.run_daily(
+        with_read_your_writes(archive_pairs_job),
+        time=APP_CONFIG["PAIR_ARCHIVAL_TIME"],
+        days=(0,),  # Monday
+        name="pair_archival",
+    )
+    job_queue.run_daily(
+        with_read_your_writes(weekly_digest_job),
+        time=APP_CONFIG["WEEKLY_DIGEST_TIME"],
+        days=(6,),  # Sunday
+        name="weekly_digest",
+    )
+
+
+def schedule_process_jobs(
+    job_queue: JobQueue, persistence: Optional[SQLPersistence] = None
+) -> None:
+    """Schedules the jobs that report on, or flush, what a single process holds in
+    memory, which run in every process of the bot."""
+    if persistence is not None:
+        job_queue.run_repeating(
+            lambda _: persistence.flush(),
+            interval=APP_CONFIG["PERSISTENCE_FLUSH_INTERVAL"],
+            name="persistence_flush",
+        )
+    job_queue.run_repeating(
+        send_error_digest_job,
+        interval=APP_CONFIG["ERROR_DIGEST_INTERVAL"],
+        name="error_digest",
+    )
+    job_queue.run_repeating(
+        send_query_reports_job,
+        interval=APP_CONFIG["QUERY_REPORT_INTERVAL"],
+        name="query_reports",
+    )
+
+
+def main() -> None:
+    if APP_CONFIG["WORKER_PROCESSES"]:
+        # Imported here, as the worker processes are built from this module
+        from src.workers import run_intake
+
+        run_intake(APP_CONFIG["WORKER_PROCESSES"])
+        return
+
+    persistence = SQLPersistence()
+    updater = Updater(
+        APP_CONFIG["BOT_ACCESS_TOKEN"],
+        base_url=APP_CONFIG["BOT_API_URL"],
+        persistence=persistence,
+    )
+    register_handlers(updater.dispatcher)
+    if APP_CONFIG["METRICS_PORT"]:
+        start_metrics_server(APP_CONFIG["METRICS_PORT"])
+
+    # Scheduled jobs
+    schedule_jobs(updater.job_queue)
+    schedule_process_jobs(updater.job_queue, persistence)
+
     updater.start_polling()
     updater.idle()
 
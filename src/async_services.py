@@ -0,0 +1,116 @@
+import inspect
+from functools import wraps
+from typing import Any, Iterator
+
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+# Runs sync code in a greenlet that suspends on the event loop whenever it waits on the
+# database, which is how the asyncio extension itself runs ORM code
+from sqlalchemy.util import greenlet_spawn
+
+from src.config import APP_CONFIG
+from src.database import use_session_factories
+from src.services import SERVICES, Services
+
+
+def get_async_url(url: str) -> URL:
+    return make_url(url).set(drivername="postgresql+asyncpg")
+
+
+# asyncpg prepares statements on the server, and SQLAlchemy keeps the prepared
+# statements of each connection in a cache, so hot queries are only planned once per
+# connection. psycopg2, used by the sync services, has no prepared statements.
+async_engine = create_async_engine(get_async_url(APP_CONFIG["DATABASE_URL"]))
+async_read_engine = (
+    create_async_engine(get_async_url(APP_CONFIG["READ_DATABASE_URL"]))
+    if APP_CONFIG["READ_DATABASE_URL"]
+    else async_engine
+)
+# Sessions bound to the sync facades of the async engines, used by the sync services
+# when they are called through AsyncService
+AsyncEngineSession = sessionmaker(bind=async_engine.sync_engine)
+AsyncEngineReadSession = sessionmaker(bind=async_read_engine.sync_engine)
+
+
+def call_with_async_sessions(method, *args, **kwargs):
+    with use_session_factories(AsyncEngineSession, AsyncEngineReadSession):
+        return method(*args, **kwargs)
+
+
+def take(iterator: Iterator, count: int) -> list:
+    return [item for _, item in zip(range(count), iterator)]
+
+
+class AsyncService:
+    """Exposes the methods of a service as coroutines, with the same signatures.
+
+    Each call runs the service's own method, with its sessions on the async engines, so
+    that waiting on the database suspends the coroutine instead of blocking the thread.
+    Callers that need to read their own writes across calls, like an update handler,
+    should make their calls within a read_your_writes scope.
+
+    Methods that yield rows, like the exports, become async generators. The rows are
+    read from the service's generator a batch of EXPORT_BATCH_SIZE at a time, each
+    batch in a greenlet, as the generator queries the database as it is read.
+    """
+
+    def __init__(self, service: object):
+        self._service = service
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._service, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        if inspect.isgeneratorfunction(inspect.unwrap(attribute)):
+
+            @wraps(attribute)
+            async def async_generator_method(*args, **kwargs):
+                # Validates the arguments, without running the generator yet
+                generator = await greenlet_spawn(
+                    call_with_async_sessions, attribute, *args, **kwargs
+                )
+                batch_size = APP_CONFIG["EXPORT_BATCH_SIZE"]
+                try:
+                    while True:
+                        batch = await greenlet_spawn(
+                            call_with_async_sessions, take, generator, batch_size
+                        )
+                        for item in batch:
+                            yield item
+                        if len(batch) < batch_size:
+                            return
+                finally:
+                    # Closes the generator's session, which also waits on the database
+                    await greenlet_spawn(call_with_async_sessions, generator.close)
+
+            return async_generator_method
+
+        @wraps(attribute)
+        async def async_method(*args, **kwargs):
+            return await greenlet_spawn(
+                call_with_async_sessions, attribute, *args, **kwargs
+            )
+
+        return async_method
+
+
+class AsyncServices:
+    """Async variants of the database services. The question info service is left out,
+    as it waits on Chrome rather than on the database."""
+
+    def __init__(self, services: Services):
+        self.config = services.config
+        self.summary_cache = services.summary_cache
+        self.leaderboards = services.leaderboards
+        self.user_service = AsyncService(services.user_service)
+        self.chat_service = AsyncService(services.chat_service)
+        self.belong_service = AsyncService(services.belong_service)
+        self.question_record_service = AsyncService(services.question_record_service)
+        self.pair_service = AsyncService(services.pair_service)
+        self.logger = services.logger
+
+
+ASYNC_SERVICES = AsyncServices(SERVICES)
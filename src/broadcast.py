@@ -0,0 +1,28 @@
+from telegram import ParseMode
+from telegram.error import BadRequest, Unauthorized
+from telegram.ext import CallbackContext, JobQueue
+
+from src.config import APP_CONFIG
+from src.services import SERVICES
+from src.utils import break_message_up
+
+
+def send_queued_message(context: CallbackContext) -> None:
+    """Sends a single queued HTML message. Chats that have removed the bot are skipped."""
+    chat_id, message = context.job.context  # type: ignore
+    try:
+        context.bot.send_message(
+            chat_id=chat_id, text=message, parse_mode=ParseMode.HTML
+        )
+    except (Unauthorized, BadRequest):
+        SERVICES.logger.info("Could not send queued message to chat %s", chat_id)
+
+
+def queue_messages(job_queue: JobQueue, messages: list[tuple[str, str]]) -> None:
+    """Queues (chat telegram id, HTML message) pairs to be sent in the background,
+    spaced out so that a broadcast stays within Telegram's rate limits."""
+    delay = 0.0
+    for chat_id, message in messages:
+        for part in break_message_up(message):
+            job_queue.run_once(send_queued_message, when=delay, context=(chat_id, part))
+            delay += APP_CONFIG["BROADCAST_INTERVAL"]
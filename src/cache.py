@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from math import inf
+from threading import Lock
+from time import monotonic
+from typing import Callable, Hashable, Iterable, Optional
+
+
+class SummaryCache:
+    """LRU cache of rendered group summaries.
+
+    Each chat has a data version, which services bump whenever they change data that
+    appears in the chat's summaries. Entries remember the version they were rendered
+    at, and are treated as misses once the chat's version has moved on.
+
+    When summaries are rendered from a read replica, a change may not be visible yet
+    right after it is made. Summaries are then not stored until the chat's last change
+    is older than settle_time seconds, the most the replica is expected to lag.
+
+    When the bot runs as several processes, each has its own cache. The bump listener
+    is called with every bump made in this process, to pass it on to the others.
+    """
+
+    def __init__(self, max_size: int, settle_time: float = 0):
+        self.max_size = max_size
+        self.settle_time = settle_time
+        self._versions: dict[str, int] = {}
+        self._bumped_at: dict[str, float] = {}
+        self.bump_listener: Optional[Callable[[list[str]], None]] = None
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._evictions = 0
+
+    def get_version(self, chat_id: str) -> int:
+        with self._lock:
+            return self._versions.get(chat_id, 0)
+
+    def bump(self, chat_ids: Iterable[str], notify: bool = True) -> None:
+        chat_ids = list(chat_ids)
+        with self._lock:
+            for chat_id in chat_ids:
+                self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+                self._bumped_at[chat_id] = monotonic()
+        if notify and chat_ids and self.bump_listener is not None:
+            self.bump_listener(chat_ids)
+
+    def get(self, chat_id: str, key: Hashable) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get((chat_id, key))
+            if entry is None:
+                self._misses += 1
+                return None
+
+            version, value = entry
+            if version != self._versions.get(chat_id, 0):
+                self._stale += 1
+                self._misses += 1
+                del self._entries[(chat_id, key)]
+                return None
+
+            self._hits += 1
+            self._entries.move_to_end((chat_id, key))
+            return value
+
+    def set(self, chat_id: str, key: Hashable, version: int, value: str) -> None:
+        """Stores a summary rendered from data read at the given version. Summaries
+        rendered from data that has since changed are not stored."""
+        with self._lock:
+            if version != self._versions.get(chat_id, 0):
+                return
+            if monotonic() - self._bumped_at.get(chat_id, -inf) < self.settle_time:
+                return
+            self._entries[(chat_id, key)] = (version, value)
+            self._entries.move_to_end((chat_id, key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "stale": self._stale,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
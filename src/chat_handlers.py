@@ -85,7 +85,7 @@ def new_chat_member_handler(update: Update, _: CallbackContext) -> None:
             user_id=user_dict["id"], chat_id=chat_dict["id"]
         )
         SERVICES.logger.info(
-            f"Added {user_dict['full_name']} to chat {chat_dict['title']}"
+            "Added %s to chat %s", user_dict["full_name"], chat_dict["title"]
         )
 
 
@@ -108,7 +108,7 @@ def left_chat_member_handler(update: Update, _: CallbackContext) -> None:
             user_id=user_dict["id"], chat_id=chat_dict["id"]
         )
         SERVICES.logger.info(
-            f"Removed {user_dict['full_name']} from chat {chat_dict['title']}"
+            "Removed %s from chat %s", user_dict["full_name"], chat_dict["title"]
         )
     except ResourceNotFoundException:
         # User did not exist in the group. Fail silently.
@@ -126,7 +126,7 @@ def migrate_chat_handler(update: Update, _: CallbackContext) -> None:
     chat_dict = SERVICES.chat_service.migrate_chat_telegram_id(
         old_telegram_id=str(old_chat_id), new_telegram_id=str(new_chat_id)
     )
-    SERVICES.logger.info(f"Migrated {chat_dict['title']}")
+    SERVICES.logger.info("Migrated %s", chat_dict["title"])
 
 
 def chat_members(update: Update, _: CallbackContext) -> None:
@@ -172,7 +172,7 @@ def add_me(update: Update, _: CallbackContext) -> None:
             user_id=user_dict["id"], chat_id=chat_dict["id"]
         )
         SERVICES.logger.info(
-            f"Added {user_dict['full_name']} to chat {chat_dict['title']}"
+            "Added %s to chat %s", user_dict["full_name"], chat_dict["title"]
         )
         message = "Added you to this chat group!\n\n"
 
@@ -214,19 +214,19 @@ def opt_in_out_helper(update: Update, should_opt_out: bool) -> None:
             should_opt_out=should_opt_out,
         )
         SERVICES.logger.info(
-            f"{user_dict['full_name']} has opted {'out' if should_opt_out else 'in'} for chat {chat_dict['title']}"
+            "%s has opted %s for chat %s",
+            user_dict["full_name"],
+            "out" if should_opt_out else "in",
+            chat_dict["title"],
         )
         message = (
             f"You have opted {'out' if should_opt_out else 'in'} for this chat group!\n"
         )
         if should_opt_out:
-            pair_list = SERVICES.pair_service.get_pairs_for_user(
-                user_id=user_dict["id"], is_current=True
-            )
-            chat_pair_list = [
-                pair for pair in pair_list if pair["chat_id"] == chat_dict["id"]
-            ]
-            if chat_pair_list and not chat_pair_list[0]["is_completed"]:
+            chat_pair = SERVICES.pair_service.get_current_pairs_for_users_in_chat(
+                chat_id=chat_dict["id"], user_ids=[user_dict["id"]]
+            ).get(user_dict["id"])
+            if chat_pair is not None and not chat_pair["is_completed"]:
                 message += "Note that you will still need to complete your ongoing interview for this week.\n\n"
             else:
                 message += "\n"
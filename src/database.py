@@ -1,14 +1,22 @@
+import threading
 import uuid
+from collections import Counter
 from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Optional
 
 from sqlalchemy import (
     Boolean,
     Column,
     DateTime,
     ForeignKey,
+    Index,
+    LargeBinary,
     String,
     UniqueConstraint,
     create_engine,
+    event,
     func,
 )
 from sqlalchemy.dialects.postgresql import UUID
@@ -76,6 +84,10 @@ class User(Base):
 class QuestionRecord(Base):
     __tablename__ = "question_records"
 
+    # Part of the primary key, as the table is partitioned by month of creation
+    created_at = Column(
+        DateTime(timezone=True), primary_key=True, server_default=func.now()
+    )
     user_id = Column(
         UUID,
         ForeignKey("users.id", ondelete="CASCADE", onupdate="CASCADE"),
@@ -87,6 +99,11 @@ class QuestionRecord(Base):
 
     user = relationship("User", back_populates="question_records")
 
+    __table_args__ = (
+        Index("ix_question_records_user_id_created_at", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
 
 class Chat(Base):
     __tablename__ = "chats"
@@ -160,6 +177,75 @@ class InterviewPair(Base):
         "Chat", back_populates="interview_pairs", foreign_keys=[chat_id]
     )
 
+    __table_args__ = (
+        Index(
+            "ix_interview_pairs_chat_id_user_one_id_started_at",
+            "chat_id",
+            "user_one_id",
+            "started_at",
+        ),
+        Index(
+            "ix_interview_pairs_chat_id_user_two_id_started_at",
+            "chat_id",
+            "user_two_id",
+            "started_at",
+        ),
+    )
+
+    @property
+    def additional_things_to_dict(self):
+        return {
+            "user_one_name": self.user_one.full_name,
+            "user_two_name": self.user_two.full_name,
+            "chat_title": self.chat.title,
+        }
+
+
+class ArchivedInterviewPair(Base):
+    """Interview pairs moved out of interview_pairs once they are old enough, keeping
+    the rows that weekly commands read small. Archived pairs keep their original id,
+    timestamps and completion."""
+
+    __tablename__ = "archived_interview_pairs"
+
+    user_one_id = Column(
+        UUID,
+        ForeignKey("users.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False,
+    )
+    user_two_id = Column(
+        UUID,
+        ForeignKey("users.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False,
+    )
+    chat_id = Column(
+        UUID,
+        ForeignKey("chats.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False,
+    )
+
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    is_completed = Column(Boolean, nullable=False)
+    completed_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    user_one = relationship("User", foreign_keys=[user_one_id])
+    user_two = relationship("User", foreign_keys=[user_two_id])
+    chat = relationship("Chat", foreign_keys=[chat_id])
+
+    __table_args__ = (
+        Index(
+            "ix_archived_interview_pairs_user_one_id_started_at",
+            "user_one_id",
+            "started_at",
+        ),
+        Index(
+            "ix_archived_interview_pairs_user_two_id_started_at",
+            "user_two_id",
+            "started_at",
+        ),
+    )
+
     @property
     def additional_things_to_dict(self):
         return {
@@ -169,14 +255,143 @@ class InterviewPair(Base):
         }
 
 
+class ConversationState(Base):
+    __tablename__ = "conversation_states"
+
+    name = Column(String, nullable=False)
+    # JSON-encoded conversation key, e.g. [chat_id, user_id]
+    key = Column(String, nullable=False)
+    # Pickled conversation state
+    state = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (UniqueConstraint("name", "key"),)
+
+
+class PersistedData(Base):
+    __tablename__ = "persisted_data"
+
+    # Either "user" or "chat"
+    kind = Column(String, nullable=False)
+    telegram_id = Column(String, nullable=False)
+    # Pickled user_data or chat_data
+    data = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (UniqueConstraint("kind", "telegram_id"),)
+
+
 engine = create_engine(APP_CONFIG["DATABASE_URL"])
 Session = sessionmaker(bind=engine)
+# Read only queries go to a replica when one is configured, and to the primary otherwise
+read_engine = (
+    create_engine(APP_CONFIG["READ_DATABASE_URL"])
+    if APP_CONFIG["READ_DATABASE_URL"]
+    else engine
+)
+ReadSession = sessionmaker(bind=read_engine)
+# Listeners that instrument queries are registered on each of these
+engines = [engine] if read_engine is engine else [engine, read_engine]
+
+
+class QueryStats:
+    def __init__(self, handler: Optional[str] = None):
+        self.handler = handler
+        self.count = 0
+        # Number of times each statement was run, keyed by its parameterised SQL
+        self.statements: Counter = Counter()
+
+
+_query_tracking = threading.local()
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_query_tracking, "stats", None)
+    if stats is not None:
+        stats.count += 1
+        stats.statements[statement] += 1
+
+
+for _engine in engines:
+    event.listen(_engine, "before_cursor_execute", _count_query)
+
+
+def get_query_stats() -> Optional[QueryStats]:
+    """Returns the innermost query tracking scope of the current thread, if any."""
+    return getattr(_query_tracking, "stats", None)
+
+
+@contextmanager
+def track_queries(handler: Optional[str] = None):
+    """Counts the queries issued by the current thread within this scope."""
+    previous = getattr(_query_tracking, "stats", None)
+    stats = QueryStats(
+        handler if handler is not None or previous is None else previous.handler
+    )
+    _query_tracking.stats = stats
+    try:
+        yield stats
+    finally:
+        _query_tracking.stats = previous
+        if previous is not None:
+            previous.count += stats.count
+            previous.statements.update(stats.statements)
+
+
+# Whether the current thread has used the primary within its read your writes scope.
+# Context variables rather than thread locals, so that async service calls sharing a
+# thread each have their own.
+_has_written: ContextVar[Optional[bool]] = ContextVar("has_written", default=None)
+# Session factories for the primary and the replica, replaced within async service
+# calls by factories bound to the async engines
+_session_factories: ContextVar[tuple[sessionmaker, sessionmaker]] = ContextVar(
+    "session_factories", default=(Session, ReadSession)
+)
+
+
+@contextmanager
+def read_your_writes():
+    """Sends reads within this scope to the primary once the scope has used it, so that
+    they see the scope's own writes despite replication lag. Reads before then still go
+    to the replica. Used around each update, and around jobs that read what they
+    wrote."""
+    token = _has_written.set(False)
+    try:
+        yield
+    finally:
+        _has_written.reset(token)
+
+
+def with_read_your_writes(callback: Callable) -> Callable:
+    """Runs each call of the callback in its own read_your_writes scope. Callbacks that
+    already are are returned as they are."""
+    if getattr(callback, "reads_own_writes", False):
+        return callback
+
+    @wraps(callback)
+    def callback_reading_own_writes(*args, **kwargs):
+        with read_your_writes():
+            return callback(*args, **kwargs)
+
+    callback_reading_own_writes.reads_own_writes = True  # type: ignore
+    return callback_reading_own_writes
+
+
+@contextmanager
+def use_session_factories(write_session: sessionmaker, read_session: sessionmaker):
+    """Makes session_scope and read_session_scope use the given session factories
+    within this scope."""
+    token = _session_factories.set((write_session, read_session))
+    try:
+        yield
+    finally:
+        _session_factories.reset(token)
 
 
 @contextmanager
 def session_scope():
     """Provide a transactional scope around a series of operations."""
-    session = Session()
+    if _has_written.get() is not None:
+        _has_written.set(True)
+    session = _session_factories.get()[0]()
     try:
         yield session
         session.commit()
@@ -185,3 +400,17 @@ def session_scope():
         raise
     finally:
         session.close()
+
+
+@contextmanager
+def read_session_scope():
+    """Provide a scope for read only operations, on the replica if there is one."""
+    if _has_written.get():
+        with session_scope() as session:
+            yield session
+        return
+    session = _session_factories.get()[1]()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,96 @@
+from time import perf_counter
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import CallbackContext
+
+from src.broadcast import queue_messages
+from src.config import APP_CONFIG
+from src.database import track_queries
+from src.general_handlers import developer_only
+from src.services import SERVICES
+from src.utils import SummaryType, unwrap
+
+# Summary Generators
+
+
+def generate_group_digest(
+    chat: dict, counts: list[dict], pair_completion: Optional[dict]
+) -> str:
+    counts.sort(key=lambda x: (-x["count"], x["full_name"].lower()))
+
+    digest = f"<b>Weekly digest for {chat['title']}</b>\n\n"
+    digest += "<b>Questions completed this week:</b>\n"
+    for count in counts:
+        # Using .format for readability
+        digest += "{}: {}/{} completed\n".format(
+            count["full_name"], count["count"], APP_CONFIG["WEEKLY_TARGET"]
+        )
+
+    if pair_completion is None:
+        digest += "\nThere were no interview pairings this week.\n"
+    else:
+        digest += "\n<b>Mock interviews:</b> {}/{} pairs completed\n".format(
+            pair_completion["completed"], pair_completion["total"]
+        )
+
+    if min(count["count"] for count in counts) >= APP_CONFIG["WEEKLY_TARGET"]:
+        digest += "\nAwesome! Everyone has achieved the weekly target!\n"
+
+    return digest
+
+
+# Helpers
+
+
+def build_weekly_digests() -> list[tuple[str, str]]:
+    """Builds the weekly digest of every chat group with opted-in members, as
+    (chat telegram id, digest) pairs. Uses a fixed number of queries regardless of
+    the number of chats."""
+    chat_dicts = SERVICES.chat_service.get_all_chats()
+    record_counts = SERVICES.question_record_service.get_record_counts_for_all_chats(
+        summary_type=SummaryType.WEEKLY
+    )
+    pair_completion = SERVICES.pair_service.get_pair_completion_for_all_chats()
+
+    digests = []
+    for chat_dict in chat_dicts:
+        counts = record_counts.get(chat_dict["id"])
+        if not counts:
+            continue
+        digest = generate_group_digest(
+            chat_dict, list(counts.values()), pair_completion.get(chat_dict["id"])
+        )
+        digests.append((chat_dict["telegram_id"], digest))
+    return digests
+
+
+# Jobs
+
+
+def weekly_digest_job(context: CallbackContext) -> None:
+    """Sends every chat group a digest of its progress for the week."""
+    digests = build_weekly_digests()
+    queue_messages(unwrap(context.job_queue), digests)
+    SERVICES.logger.info("Queued weekly digests for %d chats", len(digests))
+
+
+# Handlers
+
+
+@developer_only
+def digest_dry_run(update: Update, _: CallbackContext) -> None:
+    """Builds the weekly digests without sending them, and reports the cost of doing so."""
+    update.message = unwrap(update.message)
+
+    start_time = perf_counter()
+    with track_queries() as query_stats:
+        digests = build_weekly_digests()
+    runtime_ms = (perf_counter() - start_time) * 1000
+
+    update.message.reply_text(
+        f"Weekly digest dry run:\n"
+        f"Chats with digests: {len(digests)}\n"
+        f"Runtime: {runtime_ms:.1f} ms\n"
+        f"Queries: {query_stats.count}"
+    )
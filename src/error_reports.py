@@ -0,0 +1,164 @@
+import html
+import json
+import os
+import traceback
+from datetime import datetime
+from threading import Lock
+
+from telegram import ParseMode, Update
+from telegram.ext import CallbackContext
+
+from src.config import APP_CONFIG
+from src.utils import MAX_MESSAGE_LENGTH, escape_html, pack_messages
+
+SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PRE_TAGS_LENGTH = len("<pre></pre>")
+SAMPLE_UPDATE_PREFIX = "\nupdate = "
+
+
+class ErrorReport:
+    def __init__(self, fingerprint: tuple[str, str], traceback_string: str):
+        self.fingerprint = fingerprint
+        self.title = " at ".join(fingerprint)
+        self.traceback_string = traceback_string
+        self.occurrences = 0
+        self.first_seen = datetime.now()
+        self.last_seen = self.first_seen
+        self.sample_updates: list[str] = []
+
+
+class ErrorCollector:
+    """Groups errors by fingerprint, so that an outage is reported as a count of the same
+    error rather than as one report per failed update. Reports are sent to the developer
+    in periodic digests."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._reports: dict[tuple[str, str], ErrorReport] = {}
+        # Errors that were not reported as there were already too many fingerprints
+        self._dropped = 0
+
+    def record(self, error: BaseException, update: object) -> None:
+        fingerprint = get_fingerprint(error)
+        with self._lock:
+            report = self._reports.get(fingerprint)
+            if report is None:
+                if len(self._reports) >= APP_CONFIG["ERROR_DIGEST_MAX_REPORTS"]:
+                    self._dropped += 1
+                    return
+                report = ErrorReport(fingerprint, format_traceback(error))
+                self._reports[fingerprint] = report
+            report.occurrences += 1
+            report.last_seen = datetime.now()
+            if len(report.sample_updates) < APP_CONFIG["ERROR_SAMPLE_UPDATES"]:
+                report.sample_updates.append(format_update(update))
+
+    def pop_reports(self) -> tuple[list[ErrorReport], int]:
+        with self._lock:
+            reports = list(self._reports.values())
+            dropped = self._dropped
+            self._reports = {}
+            self._dropped = 0
+        return reports, dropped
+
+    def restore(self, reports: list[ErrorReport], dropped: int) -> None:
+        """Puts back popped reports that could not be sent, merged with the errors
+        recorded since."""
+        with self._lock:
+            for report in reports:
+                current = self._reports.get(report.fingerprint)
+                if current is None:
+                    self._reports[report.fingerprint] = report
+                    continue
+                current.occurrences += report.occurrences
+                current.first_seen = report.first_seen
+                current.sample_updates = (
+                    report.sample_updates + current.sample_updates
+                )[: APP_CONFIG["ERROR_SAMPLE_UPDATES"]]
+            self._dropped += dropped
+
+
+def get_fingerprint(error: BaseException) -> tuple[str, str]:
+    """Identifies an error by its type and where it was raised, preferring the innermost
+    frame in the bot's own code over library frames."""
+    frames = traceback.extract_tb(error.__traceback__)
+    own_frames = [
+        frame for frame in frames if frame.filename.startswith(SOURCE_DIRECTORY)
+    ]
+    frame = (own_frames or frames or [None])[-1]
+    location = (
+        f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}"
+        if frame is not None
+        else "unknown location"
+    )
+    return type(error).__name__, location
+
+
+def format_traceback(error: BaseException) -> str:
+    # The end of a traceback is the most useful part
+    traceback_string = "".join(
+        traceback.format_exception(type(error), error, error.__traceback__)
+    )
+    return traceback_string[-APP_CONFIG["TRACEBACK_LENGTH"] :]
+
+
+def format_update(update: object) -> str:
+    update_data = update.to_dict() if isinstance(update, Update) else str(update)
+    return json.dumps(update_data, ensure_ascii=False)[
+        : APP_CONFIG["ERROR_SAMPLE_LENGTH"]
+    ]
+
+
+def format_report(report: ErrorReport) -> str:
+    """Describes the report in HTML, in at most MAX_MESSAGE_LENGTH characters. The
+    traceback and sample updates are cut before they are escaped, leaving room for
+    their tags, so that the entry never has to be cut."""
+    # Using .format for readability
+    entry = "<b>{}</b>\n{} times, from {:%H:%M:%S} to {:%H:%M:%S}\n".format(
+        html.escape(report.title),
+        report.occurrences,
+        report.first_seen,
+        report.last_seen,
+    )
+    room = MAX_MESSAGE_LENGTH - len(entry) - PRE_TAGS_LENGTH
+    traceback_html = escape_html(report.traceback_string, room, keep_end=True)
+    entry += f"<pre>{traceback_html}</pre>"
+    room -= len(traceback_html)
+    for sample_update in report.sample_updates:
+        room -= len(SAMPLE_UPDATE_PREFIX) + PRE_TAGS_LENGTH
+        if room <= 0:
+            break
+        sample_html = escape_html(sample_update, room)
+        entry += f"{SAMPLE_UPDATE_PREFIX}<pre>{sample_html}</pre>"
+        room -= len(sample_html)
+    return entry
+
+
+ERROR_COLLECTOR = ErrorCollector()
+
+# Jobs
+
+
+def send_error_digest_job(context: CallbackContext) -> None:
+    """Sends the developer every error recorded since the last run."""
+    reports, dropped = ERROR_COLLECTOR.pop_reports()
+    if not reports:
+        return
+    reports.sort(key=lambda x: -x.occurrences)
+
+    entries = [f"<b>Error digest: {sum(x.occurrences for x in reports)} errors</b>"]
+    entries += [format_report(report) for report in reports]
+    if dropped:
+        entries.append(f"{dropped} more errors of other kinds were not recorded.")
+
+    try:
+        for message in pack_messages(entries):
+            context.bot.send_message(
+                chat_id=APP_CONFIG["DEVELOPER_ID"],
+                text=message,
+                parse_mode=ParseMode.HTML,
+            )
+    except Exception:
+        # Sent with the next digest instead, which may repeat any part already sent
+        ERROR_COLLECTOR.restore(reports, dropped)
+        raise
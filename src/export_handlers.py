@@ -0,0 +1,106 @@
+import csv
+import gzip
+import io
+from contextlib import closing
+from tempfile import SpooledTemporaryFile
+from typing import IO, Iterable
+
+from telegram import ChatMember, Update
+from telegram.ext import CallbackContext
+
+from src.config import APP_CONFIG
+from src.exceptions import InvalidRequestException, ResourceNotFoundException
+from src.services import PAIR_EXPORT_COLUMNS, RECORD_EXPORT_COLUMNS, SERVICES
+from src.utils import unwrap
+
+# Bots cannot send documents larger than this
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+ADMIN_STATUSES = (ChatMember.ADMINISTRATOR, ChatMember.CREATOR)
+
+# Helpers
+
+
+def write_compressed_csv(columns: list[str], rows: Iterable[tuple]) -> IO[bytes]:
+    """Writes the rows as they are produced to a gzipped CSV, and returns the file
+    ready to be read. Only the compressed output is buffered, in memory while it is
+    small and in a temporary file after that.
+
+    The rows of the export_* service methods are streamed from a server-side cursor,
+    whose session, connection and transaction stay open while they are compressed. For
+    a large export that takes seconds, not the minutes of a slow upload, as the file is
+    only sent after it is written.
+    """
+    file = SpooledTemporaryFile(max_size=APP_CONFIG["EXPORT_SPOOL_SIZE"])
+    with gzip.GzipFile(fileobj=file, mode="wb") as compressed_file, io.TextIOWrapper(
+        compressed_file, encoding="utf-8", newline=""
+    ) as text_file:
+        writer = csv.writer(text_file)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    file.seek(0)
+    return file
+
+
+def send_export(update: Update, filename: str, file: IO[bytes]) -> None:
+    update.message = unwrap(update.message)
+    with file:
+        size = file.seek(0, io.SEEK_END)
+        if size > MAX_DOCUMENT_SIZE:
+            update.message.reply_text(
+                f"{filename} is {size // (1024 * 1024)} MB, which is too large to send!"
+            )
+            return
+        file.seek(0)
+        update.message.reply_document(document=file, filename=filename)
+
+
+# Handlers
+
+
+def export(update: Update, _: CallbackContext) -> None:
+    """Sends the user's records and pairs, or the group's to its admins, as compressed
+    CSV documents."""
+    update.message = unwrap(update.message)
+    user = unwrap(update.effective_user)
+    chat = update.message.chat
+
+    if chat.type == "private":
+        user_dict = SERVICES.user_service.create_if_not_exists(
+            full_name=user.full_name, telegram_id=str(user.id)
+        )
+        records = SERVICES.question_record_service.export_records(
+            user_ids=[user_dict["id"]]
+        )
+        pairs = SERVICES.pair_service.export_pairs_for_user(user_id=user_dict["id"])
+    else:
+        if chat.get_member(user.id).status not in ADMIN_STATUSES:
+            update.message.reply_text("Only admins can export this group's history!")
+            return
+        try:
+            chat_dict = SERVICES.chat_service.get_chat_by_telegram_id(
+                telegram_id=str(chat.id)
+            )
+        except (InvalidRequestException, ResourceNotFoundException):
+            # No one has used the bot in this group yet
+            update.message.reply_text("This group has no history to export yet!")
+            return
+        user_dicts = SERVICES.belong_service.get_users_in_chat(chat_id=chat_dict["id"])
+        records = SERVICES.question_record_service.export_records(
+            user_ids=[user_dict["id"] for user_dict in user_dicts]
+        )
+        pairs = SERVICES.pair_service.export_pairs_for_chat(chat_id=chat_dict["id"])
+
+    # The rows are only read from the database as they are written, so the pairs' query
+    # does not start before the records are sent. Closing the rows ends their session
+    # if writing fails partway, instead of whenever they are collected.
+    with closing(records), closing(pairs):
+        send_export(
+            update,
+            "question_records.csv.gz",
+            write_compressed_csv(RECORD_EXPORT_COLUMNS, records),
+        )
+        send_export(
+            update,
+            "interview_pairs.csv.gz",
+            write_compressed_csv(PAIR_EXPORT_COLUMNS, pairs),
+        )
@@ -1,26 +1,42 @@
 import html
-import json
-import traceback
-from typing import cast
+from functools import wraps
+from typing import Callable, cast
 
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
-    ParseMode,
     ReplyKeyboardRemove,
     Update,
 )
 from telegram.ext import CallbackContext
 
 from src.config import APP_CONFIG
+from src.error_reports import ERROR_COLLECTOR
+from src.metrics import METRICS
 from src.services import SERVICES
-from src.utils import unwrap
+from src.utils import reply_html, unwrap
 
 GET_STARTED_KEYBOARD = [
     [InlineKeyboardButton(text="Get started", url=APP_CONFIG["BOT_URL"])]
 ]
 
 
+def developer_only(
+    handler: Callable[[Update, CallbackContext], None]
+) -> Callable[[Update, CallbackContext], None]:
+    """Restricts a handler to the developer. Everyone else gets the unknown command reply."""
+
+    @wraps(handler)
+    def decorated_handler(update: Update, context: CallbackContext) -> None:
+        user = unwrap(update.effective_user)
+        if str(user.id) != APP_CONFIG["DEVELOPER_ID"]:
+            unknown_message(update, context)
+            return
+        handler(update, context)
+
+    return decorated_handler
+
+
 def start(update: Update, _: CallbackContext) -> None:
     """Sends a default welcome message when the /start command is issued"""
     # Unwrap and fail fast
@@ -34,7 +50,7 @@ def start(update: Update, _: CallbackContext) -> None:
         )
         return
 
-    SERVICES.logger.info(f"User started: {user.full_name}")
+    SERVICES.logger.info("User started: %s", user.full_name)
     update.message.reply_text(
         f"Hello {user.full_name}!", reply_markup=ReplyKeyboardRemove()
     )
@@ -60,53 +76,46 @@ def unknown_message(update: Update, _: CallbackContext) -> None:
     )
 
 
+@developer_only
+def perf(update: Update, _: CallbackContext) -> None:
+    """Lists the handlers that the bot has spent the most time in."""
+    update.message = unwrap(update.message)
+    top_handlers = METRICS.get_top_handlers(APP_CONFIG["PERF_TOP_HANDLERS"])
+    if not top_handlers:
+        update.message.reply_text("No updates have been handled yet.")
+        return
+
+    message = "<b>Handlers by total time spent:</b>\n"
+    for name, metrics in top_handlers:
+        # Using .format for readability
+        message += "{}: {:.1f}s total, {} calls, {} errors\n".format(
+            html.escape(name),
+            metrics.latency.sum,
+            metrics.latency.count,
+            metrics.errors,
+        )
+        message += "  p50 <= {}s, p99 <= {}s, {:.1f} queries/update\n".format(
+            metrics.latency.quantile(0.5),
+            metrics.latency.quantile(0.99),
+            metrics.queries.mean,
+        )
+    reply_html(update, message)
+
+
 def error_handler(update: object, context: CallbackContext) -> None:
-    """Log the error and send a telegram message to notify the developer."""
+    """Log the error and record it for the next error digest to the developer."""
     # Log the error before we do anything else, so we can see it even if something breaks.
     SERVICES.logger.error(
         msg="Exception while handling an update:", exc_info=context.error
     )
-
-    # traceback.format_exception returns the usual python message about an exception, but as a
-    # list of strings rather than a single string, so we have to join them together.
-    tb_list = traceback.format_exception(
-        None,
-        context.error,
-        context.error.__traceback__ if context.error is not None else None,
-    )
-    tb_string = "".join(tb_list)
-
-    # Build the message with some markup and additional information about what happened.
-    update_str = update.to_dict() if isinstance(update, Update) else str(update)
-    message = (
-        f"An exception was raised while handling an update\n"
-        f"<pre>update = {html.escape(json.dumps(update_str, indent=2, ensure_ascii=False))}"
-        "</pre>\n\n"
-        f"<pre>context.chat_data = {html.escape(str(context.chat_data))}</pre>\n\n"
-        f"<pre>context.user_data = {html.escape(str(context.user_data))}</pre>\n\n"
-    )
-    context.bot.send_message(
-        chat_id=APP_CONFIG["DEVELOPER_ID"], text=message, parse_mode=ParseMode.HTML
-    )
-
-    for i in range(len(tb_string) // APP_CONFIG["TRACEBACK_LENGTH"] + 1):
-        tb_segment = tb_string[
-            (i * APP_CONFIG["TRACEBACK_LENGTH"]) : (
-                (i + 1) * APP_CONFIG["TRACEBACK_LENGTH"]
-            )
-        ]
-        if not tb_segment:
-            continue
-        message = f"<pre>{html.escape(tb_segment)}</pre>"
-        context.bot.send_message(
-            chat_id=APP_CONFIG["DEVELOPER_ID"], text=message, parse_mode=ParseMode.HTML
-        )
+    if context.error is not None:
+        ERROR_COLLECTOR.record(context.error, update)
 
     casted_update = cast(Update, update)
     if casted_update is None or casted_update.message is None:
         return
 
     casted_update.message.reply_text(
-        "Uh oh, something went wrong! I've already informed my developer about this.",
+        "Uh oh, something went wrong! My developer will be informed about this.",
         reply_markup=ReplyKeyboardRemove(),
     )
@@ -0,0 +1,102 @@
+import csv
+import gzip
+import io
+from html import escape
+from tempfile import TemporaryFile
+
+from telegram import Update
+from telegram.ext import (
+    CallbackContext,
+    CommandHandler,
+    ConversationHandler,
+    Filters,
+    MessageHandler,
+)
+
+from src.exceptions import InvalidRequestException
+from src.importer import REQUIRED_COLUMNS, ImportResult, import_records
+from src.services import SERVICES
+from src.utils import reply_html, unwrap
+
+UPLOAD = 0
+# Rejected lines listed in the reply. Any more are only counted.
+MAX_REJECTED_SHOWN = 20
+
+
+def generate_import_summary(result: ImportResult) -> str:
+    # Using .format for readability
+    summary = "Imported {} questions in {:.1f}s ({:.0f} rows/s).\n".format(
+        result.imported, result.seconds, result.rows_per_second
+    )
+    if not result.rejected:
+        return summary
+
+    summary += f"\n<b>Rejected {len(result.rejected)} lines:</b>\n"
+    for line_num, reason in result.rejected[:MAX_REJECTED_SHOWN]:
+        summary += f"Line {line_num}: {escape(reason)}\n"
+    if len(result.rejected) > MAX_REJECTED_SHOWN:
+        summary += f"...and {len(result.rejected) - MAX_REJECTED_SHOWN} more\n"
+    return summary
+
+
+def import_history(update: Update, _: CallbackContext) -> int:
+    """Asks for a CSV of questions completed before the user used the bot."""
+    update.message = unwrap(update.message)
+    if update.message.chat.type != "private":
+        update.message.reply_text("Please send /import to me in a private chat!")
+        return ConversationHandler.END
+
+    update.message.reply_text(
+        "Send me a CSV file of the questions you have completed, with the columns "
+        f"{', '.join(REQUIRED_COLUMNS)}. Files from /export work too.\n"
+        "You can also send /cancel to cancel."
+    )
+    return UPLOAD
+
+
+def import_document(update: Update, _: CallbackContext) -> int:
+    update.message = unwrap(update.message)
+    user = unwrap(update.effective_user)
+    document = unwrap(update.message.document)
+
+    user_dict = SERVICES.user_service.create_if_not_exists(
+        full_name=user.full_name, telegram_id=str(user.id)
+    )
+    # Downloaded to disk, as uploads can be larger than is worth holding in memory
+    with TemporaryFile() as file:
+        document.get_file().download(out=file)
+        file.seek(0)
+        binary_file = (
+            gzip.GzipFile(fileobj=file)
+            if (document.file_name or "").endswith(".gz")
+            else file
+        )
+        try:
+            result = import_records(
+                io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline=""),
+                user_dict["id"],
+            )
+        except InvalidRequestException as e:
+            update.message.reply_text(e.message)
+            return ConversationHandler.END
+        except (UnicodeDecodeError, OSError, csv.Error):
+            update.message.reply_text("I couldn't read that file as a CSV!")
+            return ConversationHandler.END
+
+    reply_html(update, generate_import_summary(result))
+    return ConversationHandler.END
+
+
+def cancel_import(update: Update, _: CallbackContext) -> int:
+    update.message = unwrap(update.message)
+    update.message.reply_text("Import cancelled.")
+    return ConversationHandler.END
+
+
+import_conv_handler = ConversationHandler(
+    entry_points=[CommandHandler("import", import_history)],
+    states={UPLOAD: [MessageHandler(Filters.document, import_document)]},
+    fallbacks=[CommandHandler("cancel", cancel_import)],
+    name="import_conv_handler",
+    persistent=True,
+)
@@ -0,0 +1,217 @@
+import argparse
+import csv
+import io
+import logging
+import sys
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from itertools import islice
+from time import perf_counter
+from typing import IO, Iterable, Optional
+
+from cerberus import Validator  # type: ignore
+
+from src.config import APP_CONFIG
+from src.database import Belong, QuestionRecord, User, session_scope
+from src.exceptions import InvalidRequestException, ResourceNotFoundException
+from src.partitions import create_question_record_partitions, get_month_start
+from src.schemata import IMPORT_QUESTION_RECORD_SCHEMA
+from src.services import SERVICES
+
+# Named explicitly, as this module is also run as a script, named __main__
+logger = logging.getLogger("src.importer")
+
+# The columns of /export's records are accepted too, and its name column is ignored
+REQUIRED_COLUMNS = ["completed_at", "question", "difficulty", "platform"]
+# Needed when the rows are not all for one given user
+TELEGRAM_ID_COLUMN = "telegram_id"
+COPY_STATEMENT = (
+    f"COPY {QuestionRecord.__tablename__} "
+    "(id, created_at, user_id, platform, question_name, difficulty) "
+    "FROM STDIN WITH (FORMAT csv)"
+)
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    # Line numbers of the rows that were not imported, with the reason
+    rejected: list[tuple[int, str]] = field(default_factory=list)
+    seconds: float = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.imported / self.seconds if self.seconds else 0
+
+
+def format_errors(errors: dict) -> str:
+    return "; ".join(
+        f"{column}: {', '.join(map(str, messages))}"
+        for column, messages in errors.items()
+    )
+
+
+def count_months(earlier: datetime, later: datetime) -> int:
+    return (later.year - earlier.year) * 12 + later.month - earlier.month
+
+
+def copy_records(session, records: Iterable[tuple[str, dict]]) -> None:
+    """Loads the records, given as user ids and validated rows, with a single COPY."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for user_id, row in records:
+        writer.writerow(
+            [
+                uuid.uuid4(),
+                row["completed_at"].isoformat(),
+                user_id,
+                row["platform"],
+                row["question"],
+                row["difficulty"],
+            ]
+        )
+    buffer.seek(0)
+    with session.connection().connection.cursor() as cursor:
+        cursor.copy_expert(COPY_STATEMENT, buffer)
+
+
+def bump_caches(user_ids: set[str]) -> None:
+    """Marks the cached summaries and leaderboards of the users' chats as stale."""
+    if not user_ids:
+        return
+    with session_scope() as session:
+        chat_ids = [
+            str(chat_id)
+            for (chat_id,) in session.query(Belong.chat_id)
+            .filter(Belong.user_id.in_(user_ids))
+            .distinct()
+        ]
+    SERVICES.summary_cache.bump(chat_ids)
+    SERVICES.leaderboards.invalidate(chat_ids)
+
+
+def import_records(file: IO[str], user_id: Optional[str] = None) -> ImportResult:
+    """Imports question records from a CSV with a header row. The records are the given
+    user's, or else the user's whose Telegram id is in the row.
+
+    Rows are validated and copied into the database a batch at a time, each batch in
+    its own transaction, so a failure part way keeps the batches before it. Rows that
+    fail validation are skipped and reported.
+    """
+    reader = csv.DictReader(file)
+    columns = REQUIRED_COLUMNS + ([] if user_id else [TELEGRAM_ID_COLUMN])
+    missing_columns = [x for x in columns if x not in (reader.fieldnames or [])]
+    if missing_columns:
+        raise InvalidRequestException(f"Missing columns: {', '.join(missing_columns)}")
+
+    validator = Validator(
+        IMPORT_QUESTION_RECORD_SCHEMA, require_all=True, allow_unknown=True
+    )
+    result = ImportResult()
+    imported_user_ids: set[str] = set()
+    # Partitions exist from this month on, and are created for older rows as needed
+    partitioned_since = get_month_start(datetime.now(timezone.utc))
+    start_time = perf_counter()
+    # The line of a row is where it ends, as values may span lines
+    rows = ((reader.line_num, row) for row in reader)
+    try:
+        while batch := list(islice(rows, APP_CONFIG["IMPORT_BATCH_SIZE"])):
+            now = datetime.now(timezone.utc)
+            valid_rows = []
+            for line_num, row in batch:
+                if not validator.validate(row):
+                    result.rejected.append((line_num, format_errors(validator.errors)))
+                elif validator.document["completed_at"] > now:
+                    result.rejected.append((line_num, "completed_at: in the future"))
+                else:
+                    valid_rows.append((line_num, validator.document))
+            if not valid_rows:
+                continue
+
+            oldest_month = get_month_start(
+                min(row["completed_at"] for _, row in valid_rows)
+            )
+            if oldest_month < partitioned_since:
+                create_question_record_partitions(
+                    months_ahead=0, months_behind=count_months(oldest_month, now)
+                )
+                partitioned_since = oldest_month
+
+            with session_scope() as session:
+                if user_id is not None:
+                    records = [(user_id, row) for _, row in valid_rows]
+                else:
+                    user_ids_by_telegram_id = {
+                        telegram_id: str(id)
+                        for id, telegram_id in session.query(
+                            User.id, User.telegram_id
+                        ).filter(
+                            User.telegram_id.in_(
+                                {row[TELEGRAM_ID_COLUMN] for _, row in valid_rows}
+                            )
+                        )
+                    }
+                    records = []
+                    for line_num, row in valid_rows:
+                        row_user_id = user_ids_by_telegram_id.get(
+                            row[TELEGRAM_ID_COLUMN]
+                        )
+                        if row_user_id is None:
+                            result.rejected.append(
+                                (line_num, "telegram_id: no such user")
+                            )
+                        else:
+                            records.append((row_user_id, row))
+                if records:
+                    copy_records(session, records)
+
+            result.imported += len(records)
+            imported_user_ids.update(x for x, _ in records)
+    finally:
+        result.seconds = perf_counter() - start_time
+        bump_caches(imported_user_ids)
+
+    result.rejected.sort()
+    logger.info(
+        "Imported %d records at %.0f rows/s, rejected %d",
+        result.imported,
+        result.rows_per_second,
+        len(result.rejected),
+    )
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Imports question records from a CSV file, with the columns "
+        f"{', '.join(REQUIRED_COLUMNS)} and {TELEGRAM_ID_COLUMN}, unless every row is "
+        "for the user given by --telegram-id."
+    )
+    parser.add_argument("file")
+    parser.add_argument("--telegram-id")
+    args = parser.parse_args()
+
+    user_id = None
+    if args.telegram_id is not None:
+        try:
+            user_id = SERVICES.user_service.get_user_by_telegram_id(
+                telegram_id=args.telegram_id
+            )["id"]
+        except ResourceNotFoundException:
+            sys.exit(f"No user has the Telegram id {args.telegram_id}")
+    with open(args.file, newline="", encoding="utf-8-sig") as file:
+        result = import_records(file, user_id)
+
+    print(
+        f"Imported {result.imported} records in {result.seconds:.1f} s "
+        f"({result.rows_per_second:.0f} rows/s)"
+    )
+    for line_num, reason in result.rejected:
+        print(f"Rejected line {line_num}: {reason}")
+    # The running bot keeps its own caches, which this process cannot reach
+    print("Restart the bot for its summaries and leaderboards to include the import.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Lock
+from typing import Callable, Iterable, Optional
+
+from sortedcontainers import SortedList
+
+from src.utils import SummaryType, get_summary_period_start
+
+# Periods that have a leaderboard. Unique questions are not counted incrementally, as
+# a new record may repeat a question the member has already completed.
+LEADERBOARD_SUMMARY_TYPES = (SummaryType.WEEKLY, SummaryType.MONTHLY, SummaryType.ALL)
+
+
+class Leaderboard:
+    """Opted-in members of a chat, ranked by the number of questions they completed in
+    a period. Ties share a rank, and are listed by name."""
+
+    def __init__(self, period_start: Optional[datetime], counts: dict[str, dict]):
+        self.period_start = period_start
+        # User id to count and full name
+        self._entries: dict[str, tuple[int, str]] = {}
+        # Sorted by descending count, then by name
+        self._ranking = SortedList()
+        for user_id, entry in counts.items():
+            self.set(user_id, entry["full_name"], entry["count"])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set(self, user_id: str, full_name: str, count: int) -> None:
+        self.remove(user_id)
+        self._entries[user_id] = (count, full_name)
+        self._ranking.add((-count, full_name.lower(), user_id))
+
+    def remove(self, user_id: str) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            count, full_name = entry
+            self._ranking.remove((-count, full_name.lower(), user_id))
+
+    def increment(self, user_id: str) -> None:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            count, full_name = entry
+            self.set(user_id, full_name, count + 1)
+
+    def rename(self, user_id: str, full_name: str) -> None:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self.set(user_id, full_name, entry[0])
+
+    def get_rank(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        count, full_name = entry
+        return {
+            "full_name": full_name,
+            "count": count,
+            # Everyone ahead has a higher count, and sorts before the shorter key
+            "rank": self._ranking.bisect_left((-count,)) + 1,
+            "size": len(self._entries),
+        }
+
+    def get_top(self, size: int) -> list[dict]:
+        top: list[dict] = []
+        for index, (_, _, user_id) in enumerate(self._ranking.islice(0, size)):
+            count, full_name = self._entries[user_id]
+            rank = top[-1]["rank"] if top and top[-1]["count"] == count else index + 1
+            top.append(
+                {
+                    "user_id": user_id,
+                    "full_name": full_name,
+                    "count": count,
+                    "rank": rank,
+                }
+            )
+        return top
+
+
+class Leaderboards:
+    """Leaderboards of every chat, for each period in LEADERBOARD_SUMMARY_TYPES.
+
+    A leaderboard is loaded the first time it is needed, and again once its period
+    rolls over. Services then keep it up to date as records are added and members
+    change, instead of counting every member's records on each query.
+
+    Like SummaryCache, each chat has a version, which every change to the chat bumps.
+    A leaderboard loaded while the chat changed is used once but not kept, as the
+    change may or may not be in it. The same goes for one loaded while a record of the
+    chat is being committed, which would otherwise be counted twice if the leaderboard
+    already had it.
+    """
+
+    def __init__(self, load: Callable[[str, SummaryType], dict[str, dict]]):
+        # Loads the counts of every opted-in member of a chat, by user id
+        self._load = load
+        self._boards: dict[tuple[str, SummaryType], Leaderboard] = {}
+        self._versions: dict[str, int] = {}
+        # The number of records of each chat being added
+        self._adding: dict[str, int] = {}
+        self._lock = Lock()
+
+    def get_top(self, chat_id: str, summary_type: SummaryType, size: int) -> list[dict]:
+        return self.__query(chat_id, summary_type, lambda x: x.get_top(size))
+
+    def get_rank(
+        self, chat_id: str, summary_type: SummaryType, user_id: str
+    ) -> Optional[dict]:
+        return self.__query(chat_id, summary_type, lambda x: x.get_rank(user_id))
+
+    @contextmanager
+    def adding_record(self, user_id: str, chat_ids: Iterable[str]):
+        """Counts a record created by the user within this scope, which has to include
+        its commit, once the scope exits without an error. A leaderboard whose period
+        has rolled over is reloaded before its next query anyway."""
+        chat_ids = list(chat_ids)
+        with self._lock:
+            for chat_id in chat_ids:
+                self.__bump(chat_id)
+                self._adding[chat_id] = self._adding.get(chat_id, 0) + 1
+        is_added = False
+        try:
+            yield
+            is_added = True
+        finally:
+            with self._lock:
+                for chat_id in chat_ids:
+                    self._adding[chat_id] -= 1
+                    if not self._adding[chat_id]:
+                        del self._adding[chat_id]
+                    if is_added:
+                        self.__update_chat(chat_id, lambda x: x.increment(user_id))
+
+    def remove_member(self, user_id: str, chat_id: str) -> None:
+        """Called when the user leaves or opts out of the chat."""
+        self.__update([chat_id], lambda x: x.remove(user_id))
+
+    def rename_member(
+        self, user_id: str, full_name: str, chat_ids: Iterable[str]
+    ) -> None:
+        self.__update(chat_ids, lambda x: x.rename(user_id, full_name))
+
+    def invalidate(self, chat_ids: Iterable[str]) -> None:
+        """Drops the chats' leaderboards, to be loaded again when next needed. Used when
+        a member joins or opts in, as their counts have to be loaded anyway."""
+        with self._lock:
+            for chat_id in chat_ids:
+                self.__bump(chat_id)
+                for summary_type in LEADERBOARD_SUMMARY_TYPES:
+                    self._boards.pop((chat_id, summary_type), None)
+
+    def __query(self, chat_id: str, summary_type: SummaryType, query: Callable):
+        key = (chat_id, summary_type)
+        period_start = get_summary_period_start(summary_type)
+        with self._lock:
+            board = self._boards.get(key)
+            if board is not None and board.period_start == period_start:
+                return query(board)
+            version = self._versions.get(chat_id, 0)
+
+        board = Leaderboard(period_start, self._load(chat_id, summary_type))
+        with self._lock:
+            if (
+                version == self._versions.get(chat_id, 0)
+                and chat_id not in self._adding
+            ):
+                self._boards[key] = board
+            return query(board)
+
+    def __update(
+        self, chat_ids: Iterable[str], update: Callable[[Leaderboard], None]
+    ) -> None:
+        with self._lock:
+            for chat_id in chat_ids:
+                self.__update_chat(chat_id, update)
+
+    def __update_chat(
+        self, chat_id: str, update: Callable[[Leaderboard], None]
+    ) -> None:
+        self.__bump(chat_id)
+        for summary_type in LEADERBOARD_SUMMARY_TYPES:
+            board = self._boards.get((chat_id, summary_type))
+            if board is not None:
+                update(board)
+
+    def __bump(self, chat_id: str) -> None:
+        self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
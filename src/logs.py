@@ -0,0 +1,102 @@
+import atexit
+import json
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from sys import stdout
+from typing import Optional
+
+from telegram import Update
+
+# Describes the update being handled by the current thread, added to every log record
+_update_context: ContextVar[dict] = ContextVar("update_context", default={})
+
+RECORD_CONTEXT_KEYS = ("update_id", "chat_id", "user_id", "handler")
+
+
+@contextmanager
+def log_update_context(handler: str, update: object):
+    """Adds the ids of the update, and the name of its handler, to records logged
+    within."""
+    context: dict[str, Optional[object]] = {"handler": handler}
+    if isinstance(update, Update):
+        context["update_id"] = update.update_id
+        if update.effective_chat is not None:
+            context["chat_id"] = update.effective_chat.id
+        if update.effective_user is not None:
+            context["user_id"] = update.effective_user.id
+    token = _update_context.set(context)
+    try:
+        yield
+    finally:
+        _update_context.reset(token)
+
+
+class UpdateContextFilter(logging.Filter):
+    """Copies the update context onto records. Must run on the thread that logs, as the
+    context is per thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _update_context.get().items():
+            setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of records below WARNING, to cut the volume of info logs."""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.sample_rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in RECORD_CONTEXT_KEYS:
+            if hasattr(record, key):
+                data[key] = getattr(record, key)
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def configure_logging(logger: logging.Logger, info_sample_rate: float) -> QueueListener:
+    """Sends the logger's records through a queue, so that logging never blocks on
+    stdout or stderr. Records are formatted as JSON lines by the thread that logs, and
+    written by a background thread, with info logs to stdout and warnings and errors
+    to stderr."""
+    stdout_handler = logging.StreamHandler(stdout)
+    stdout_handler.setLevel(logging.INFO)
+    stdout_handler.addFilter(lambda record: record.levelno == logging.INFO)
+    stderr_handler = logging.StreamHandler()
+    stderr_handler.setLevel(logging.WARNING)
+
+    log_queue: SimpleQueue = SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    # Sampling runs first, so that dropped records are never formatted
+    queue_handler.addFilter(SamplingFilter(info_sample_rate))
+    queue_handler.addFilter(UpdateContextFilter())
+    queue_handler.setFormatter(JsonFormatter())
+    logger.addHandler(queue_handler)
+    logger.setLevel(logging.INFO)
+
+    listener = QueueListener(
+        log_queue, stdout_handler, stderr_handler, respect_handler_level=True
+    )
+    listener.start()
+    # Writes out whatever is still queued when the bot exits
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,196 @@
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Callable
+
+from telegram.ext import Dispatcher
+
+from src.database import track_queries
+from src.logs import log_update_context
+from src.query_monitor import QUERY_MONITOR
+from src.utils import get_callback_handlers
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # The last count is for observations above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile as the upper bound of the bucket it falls in."""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bucket
+        return float("inf")
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+class HandlerMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.successes = 0
+        self.errors = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = Lock()
+        self._handlers: dict[str, HandlerMetrics] = {}
+
+    def record(
+        self, handler: str, latency: float, query_count: int, is_error: bool
+    ) -> None:
+        with self._lock:
+            metrics = self._handlers.setdefault(handler, HandlerMetrics())
+            metrics.latency.observe(latency)
+            metrics.queries.observe(query_count)
+            if is_error:
+                metrics.errors += 1
+            else:
+                metrics.successes += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._handlers = {}
+
+    def get_top_handlers(self, n: int) -> list[tuple[str, HandlerMetrics]]:
+        """Returns the handlers that the bot has spent the most time in."""
+        with self._lock:
+            handlers = list(self._handlers.items())
+        handlers.sort(key=lambda x: x[1].latency.sum, reverse=True)
+        return handlers[:n]
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            handlers = sorted(self._handlers.items())
+            lines = [
+                "# HELP bot_handler_latency_seconds Time taken to handle an update.",
+                "# TYPE bot_handler_latency_seconds histogram",
+            ]
+            for name, metrics in handlers:
+                lines += render_histogram(
+                    "bot_handler_latency_seconds", name, metrics.latency
+                )
+            lines += [
+                "# HELP bot_handler_queries Database queries made per update.",
+                "# TYPE bot_handler_queries histogram",
+            ]
+            for name, metrics in handlers:
+                lines += render_histogram("bot_handler_queries", name, metrics.queries)
+            lines += [
+                "# HELP bot_handler_updates_total Updates handled, by outcome.",
+                "# TYPE bot_handler_updates_total counter",
+            ]
+            for name, metrics in handlers:
+                lines += [
+                    f'bot_handler_updates_total{{handler="{name}",outcome="success"}} '
+                    f"{metrics.successes}",
+                    f'bot_handler_updates_total{{handler="{name}",outcome="error"}} '
+                    f"{metrics.errors}",
+                ]
+        return "\n".join(lines) + "\n"
+
+
+def render_histogram(metric: str, handler: str, histogram: Histogram) -> list[str]:
+    lines = []
+    cumulative = 0
+    for bucket, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(
+            f'{metric}_bucket{{handler="{handler}",le="{bucket}"}} {cumulative}'
+        )
+    lines.append(f'{metric}_bucket{{handler="{handler}",le="+Inf"}} {histogram.count}')
+    lines.append(f'{metric}_sum{{handler="{handler}"}} {histogram.sum}')
+    lines.append(f'{metric}_count{{handler="{handler}"}} {histogram.count}')
+    return lines
+
+
+METRICS = MetricsRegistry()
+
+# Instrumentation
+
+
+def instrument(callback: Callable, name: str) -> Callable:
+    @wraps(callback)
+    def instrumented_callback(*args, **kwargs):
+        is_error = False
+        start_time = perf_counter()
+        with track_queries(name) as query_stats, log_update_context(name, args[0]):
+            try:
+                return callback(*args, **kwargs)
+            except Exception:
+                is_error = True
+                raise
+            finally:
+                METRICS.record(
+                    name, perf_counter() - start_time, query_stats.count, is_error
+                )
+                QUERY_MONITOR.check_update(query_stats)
+
+    instrumented_callback.is_instrumented = True  # type: ignore
+    return instrumented_callback
+
+
+def instrument_handlers(dispatcher: Dispatcher) -> None:
+    """Records the latency, outcome and query count of every registered handler. The
+    conversation handlers are shared by every dispatcher of the process, so their
+    callbacks may have been instrumented by an earlier one, and are left as they are."""
+    for handler in get_callback_handlers(dispatcher):
+        callback = handler.callback
+        if getattr(callback, "is_instrumented", False):
+            continue
+        name = f"{callback.__module__.split('.')[-1]}.{callback.__name__}"
+        handler.callback = instrument(callback, name)
+
+
+# Endpoint
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        # Scrapes are too frequent to be worth logging
+        pass
+
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    """Serves /metrics in the Prometheus text format on localhost, in the background."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsRequestHandler)
+    Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
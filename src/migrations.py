@@ -0,0 +1,221 @@
+import logging
+from contextlib import contextmanager
+from time import sleep
+from typing import Sequence
+
+import sqlalchemy as sa
+
+from alembic import context, op
+
+logger = logging.getLogger(__name__)
+
+# Helpers for migrations that change big tables, like question_records and
+# interview_pairs, without blocking the bot's reads and writes while they run. Each
+# helper commits on its own, so call them outside of any other work in a migration.
+# Online migrations are run with a lock timeout, set in alembic/env.py, so that a
+# statement that has to wait for a lock fails quickly instead of blocking everything
+# queued behind it. Failed migrations can be run again.
+
+
+def is_partitioned(table_name: str) -> bool:
+    return (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:name)"
+            ),
+            {"name": table_name},
+        )
+        .scalar()
+    )
+
+
+def get_partitions(table_name: str) -> list[str]:
+    return list(
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT inhrelid::regclass::text FROM pg_inherits "
+                "WHERE inhparent = to_regclass(:name) ORDER BY 1"
+            ),
+            {"name": table_name},
+        )
+        .scalars()
+    )
+
+
+@contextmanager
+def without_lock_timeout():
+    """Building an index concurrently waits for every transaction that might use the
+    index to finish, which the lock timeout would cut short."""
+    bind = op.get_bind()
+    lock_timeout = bind.exec_driver_sql("SHOW lock_timeout").scalar()
+    bind.exec_driver_sql("SET lock_timeout = 0")
+    try:
+        yield
+    finally:
+        bind.execute(
+            sa.text("SELECT set_config('lock_timeout', :value, false)"),
+            {"value": lock_timeout},
+        )
+
+
+def drop_invalid_index(index_name: str) -> None:
+    """Drops what is left of an index whose concurrent build failed, so that it can be
+    built again."""
+    is_invalid = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT NOT indisvalid FROM pg_index "
+                "WHERE indexrelid = to_regclass(:name)"
+            ),
+            {"name": index_name},
+        )
+        .scalar()
+    )
+    if is_invalid:
+        logger.warning("Dropping invalid index %s", index_name)
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+
+
+def create_index_concurrently(
+    index_name: str, table_name: str, columns: Sequence[str], **kwargs
+) -> None:
+    """Creates an index without blocking writes to the table while it is built.
+
+    Partitioned tables cannot build an index concurrently, so the partitioned index is
+    created on the table alone, which is instant, and each partition's index is built
+    concurrently and then attached to it. The partitioned index becomes valid once
+    every partition's index is attached. Only unique indexes are supported there.
+    """
+    with context.get_context().autocommit_block(), without_lock_timeout():
+        if not is_partitioned(table_name):
+            drop_invalid_index(index_name)
+            op.create_index(
+                index_name,
+                table_name,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+                **kwargs,
+            )
+            return
+
+        if set(kwargs) - {"unique"}:
+            raise ValueError(
+                f"{table_name} is partitioned, so only unique indexes are supported"
+            )
+        op.execute(
+            f"CREATE {'UNIQUE ' if kwargs.get('unique') else ''}INDEX IF NOT EXISTS "
+            f"{index_name} ON ONLY {table_name} ({', '.join(columns)})"
+        )
+        for partition_name in get_partitions(table_name):
+            partition_index_name = f"{partition_name}_{index_name}"[:63]
+            drop_invalid_index(partition_index_name)
+            op.create_index(
+                partition_index_name,
+                partition_name,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+                **kwargs,
+            )
+            is_attached = (
+                op.get_bind()
+                .execute(
+                    sa.text(
+                        "SELECT EXISTS (SELECT FROM pg_inherits "
+                        "WHERE inhrelid = to_regclass(:name))"
+                    ),
+                    {"name": partition_index_name},
+                )
+                .scalar()
+            )
+            if not is_attached:
+                op.execute(
+                    f"ALTER INDEX {index_name} ATTACH PARTITION {partition_index_name}"
+                )
+
+
+def drop_index_concurrently(index_name: str, table_name: str) -> None:
+    """Drops an index without blocking reads or writes to the table. Indexes of
+    partitioned tables cannot be dropped concurrently, and are dropped as usual."""
+    if is_partitioned(table_name):
+        op.drop_index(index_name, table_name=table_name, if_exists=True)
+        return
+    with context.get_context().autocommit_block(), without_lock_timeout():
+        op.drop_index(
+            index_name,
+            table_name=table_name,
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def backfill_in_batches(
+    table_name: str,
+    set_clause: str,
+    where_clause: str,
+    key_columns: Sequence[str] = ("id",),
+    batch_size: int = 5000,
+    pause: float = 0.1,
+) -> int:
+    """Updates the rows matching where_clause with set_clause, a batch at a time, each
+    in its own transaction, pausing between batches to let the bot's queries through.
+    where_clause must no longer match a row once it is updated, e.g. "x IS NULL" when
+    setting x. Returns the number of rows updated.
+
+    Batches are picked by key_columns, which must identify a row. On a partitioned
+    table, these are its primary key columns, e.g. ("id", "created_at") for
+    question_records.
+    """
+    if context.is_offline_mode():
+        raise RuntimeError("Backfills need to run online, to know when they are done")
+
+    keys = ", ".join(key_columns)
+    statement = sa.text(
+        f"UPDATE {table_name} SET {set_clause} WHERE ({keys}) IN "
+        f"(SELECT {keys} FROM {table_name} WHERE {where_clause} LIMIT :batch_size)"
+    )
+    updated = 0
+    with context.get_context().autocommit_block():
+        while True:
+            # Each statement commits on its own, which only locks the batch's rows
+            row_count = (
+                op.get_bind().execute(statement, {"batch_size": batch_size}).rowcount
+            )
+            updated += row_count
+            if row_count < batch_size:
+                break
+            logger.info("Backfilled %d rows of %s", updated, table_name)
+            sleep(pause)
+    return updated
+
+
+def add_constraint_not_valid(
+    table_name: str, constraint_name: str, definition: str
+) -> None:
+    """Adds a foreign key or check constraint, given as e.g. "CHECK (x > 0)", which
+    only holds for rows written from now on. Existing rows are not scanned, so the
+    table is only locked briefly. Use validate_constraint to check existing rows.
+
+    Postgres does not allow this on partitioned tables, like question_records.
+    """
+    if is_partitioned(table_name):
+        raise ValueError(
+            f"{table_name} is partitioned, which does not allow NOT VALID constraints"
+        )
+    with context.get_context().autocommit_block():
+        op.execute(
+            f"ALTER TABLE {table_name} "
+            f"ADD CONSTRAINT {constraint_name} {definition} NOT VALID"
+        )
+
+
+def validate_constraint(table_name: str, constraint_name: str) -> None:
+    """Checks the existing rows against a constraint added with
+    add_constraint_not_valid. This scans the table, but allows reads and writes
+    meanwhile."""
+    with context.get_context().autocommit_block():
+        op.execute(f"ALTER TABLE {table_name} VALIDATE CONSTRAINT {constraint_name}")
@@ -17,8 +17,10 @@ from telegram.ext import (
     MessageHandler,
 )
 
+from src.broadcast import queue_messages
 from src.config import APP_CONFIG
-from src.exceptions import InvalidUserDataException
+from src.database import read_your_writes
+from src.exceptions import InvalidRequestException, InvalidUserDataException
 from src.services import SERVICES
 from src.utils import MONTH_ALL_SUMMARY_STRFTIME_FORMAT, reply_html, unwrap
 
@@ -56,7 +58,9 @@ def notify_partner(context: CallbackContext, pair: dict):
     except (Unauthorized, BadRequest):
         self_dict = SERVICES.user_service.get_user_by_id(id=pair["self_id"])
         SERVICES.logger.info(
-            f"Could not notify partner: {pair['partner_name']} [{pair['chat_title']}]",
+            "Could not notify partner: %s [%s]",
+            pair["partner_name"],
+            pair["chat_title"],
         )
         context.bot.send_message(
             chat_id=self_dict["telegram_id"],
@@ -69,25 +73,34 @@ def notify_partner(context: CallbackContext, pair: dict):
 # Summary Generators
 
 
-def generate_individual_interview_summary(records: list[dict]) -> str:
+def generate_individual_interview_summary(
+    records: list[dict], page: int = 1, first_number: int = 1, has_more: bool = False
+) -> str:
     if not records:
+        if page > 1:
+            return "There are no more past interview pairings!"
         return (
             "You have no mock interviews arranged!\n"
             "Join a group with this bot and use the /interview_pairs command to get started!"
         )
 
-    summary = "<b>All Past Interview Pairings:</b>\n"
+    summary = "<b>All Past Interview Pairings{}:</b>\n".format(
+        f" (Page {page})" if page > 1 or has_more else ""
+    )
 
     for i, record in enumerate(records):
         # Using .format for readability
         summary += "{}. {} [{}] [{}] ({})\n".format(
-            i + 1,
+            first_number + i,
             record["partner_name"],
             record["chat_title"],
             record["started_at"].strftime(MONTH_ALL_SUMMARY_STRFTIME_FORMAT),
             "Completed" if record["is_completed"] else "Incomplete",
         )
 
+    if has_more:
+        summary += f"\nSend /past_pairs {page + 1} to see older pairings."
+
     return summary
 
 
@@ -118,11 +131,79 @@ def generate_group_interview_summary(
     return summary
 
 
+# Jobs
+
+
+def weekly_pairing_job(context: CallbackContext) -> None:
+    """Pairs up the opted-in, unpaired members of every chat group and announces the pairs."""
+    # The pairs are read back after they are added
+    with read_your_writes():
+        unpaired_users = SERVICES.pair_service.get_unpaired_users_for_all_chats()
+
+        pairs_by_chat: dict[str, list[list[str]]] = {}
+        extra_user_ids: dict[str, str] = {}
+        for chat_id, user_ids in unpaired_users.items():
+            if len(user_ids) < 2:
+                continue
+            new_pairs, extra_user_id = pair_users(set(user_ids))
+            pairs_by_chat[chat_id] = new_pairs
+            if extra_user_id is not None:
+                extra_user_ids[chat_id] = extra_user_id
+
+        if not pairs_by_chat:
+            return
+
+        SERVICES.pair_service.add_pairs_for_chats(pairs_by_chat=pairs_by_chat)
+
+        chat_ids = list(pairs_by_chat)
+        pairs_by_chat_dicts = SERVICES.pair_service.get_pairs_for_chats(
+            chat_ids=chat_ids
+        )
+        chat_dicts = SERVICES.chat_service.get_chats_by_id(ids=chat_ids)
+        extra_user_dicts = {
+            user_dict["id"]: user_dict
+            for user_dict in (
+                SERVICES.user_service.get_users_by_id(ids=list(extra_user_ids.values()))
+                if extra_user_ids
+                else []
+            )
+        }
+
+        messages = []
+        for chat_dict in chat_dicts:
+            extra_user_id = extra_user_ids.get(chat_dict["id"])
+            summary = generate_group_interview_summary(
+                pairs_by_chat_dicts[chat_dict["id"]],
+                (
+                    [extra_user_dicts[extra_user_id]]
+                    if extra_user_id is not None
+                    else None
+                ),
+            )
+            messages.append((chat_dict["telegram_id"], summary))
+        queue_messages(unwrap(context.job_queue), messages)
+
+        SERVICES.logger.info(
+            "Weekly pairing created %d pairs across %d chats",
+            sum(len(pairs) for pairs in pairs_by_chat.values()),
+            len(pairs_by_chat),
+        )
+
+
+def archive_pairs_job(_: CallbackContext) -> None:
+    """Moves old pairs out of the table read by the weekly commands."""
+    archived_count = SERVICES.pair_service.archive_old_pairs(
+        batch_size=APP_CONFIG["PAIR_ARCHIVE_BATCH_SIZE"]
+    )
+    SERVICES.logger.info("Archived %d interview pairs", archived_count)
+
+
 # Handlers
 
 
 def interview_pairs(update: Update, _: CallbackContext) -> None:
-    """Generates pairs for the group for members who have yet to be paired, and lists all pairs out."""
+    """Lists all pairs for the group. Pairs are generated by the weekly pairing job, but members
+    who joined since then and have yet to be paired are paired here."""
     update.message = unwrap(update.message)
     if update.message.chat.type == "private":
         update.message.reply_text("Please use this command in a chat group!")
@@ -317,7 +398,10 @@ def list_confirm(update: Update, context: CallbackContext) -> int:
         "Awesome! I have marked it as completed.", reply_markup=ReplyKeyboardRemove()
     )
     SERVICES.logger.info(
-        f"{selected_pair['self_name']} and {selected_pair['partner_name']} [{selected_pair['chat_title']}] have completed their mock interview"
+        "%s and %s [%s] have completed their mock interview",
+        selected_pair["self_name"],
+        selected_pair["partner_name"],
+        selected_pair["chat_title"],
     )
     notify_partner(context, selected_pair)
 
@@ -347,6 +431,8 @@ complete_conv_handler = ConversationHandler(
         LIST_CONFIRM: [MessageHandler(Filters.text & ~Filters.command, list_confirm)],
     },
     fallbacks=[CommandHandler("cancel", cancel_complete)],
+    name="complete_conv_handler",
+    persistent=True,
 )
 
 
@@ -369,12 +455,33 @@ def past_pairs(update: Update, context: CallbackContext) -> None:
         finally:
             return
 
+    page = 1
+    if context.args:
+        if not context.args[0].isdigit() or int(context.args[0]) < 1:
+            update.message.reply_text("Please send a page number, e.g. /past_pairs 2")
+            return
+        page = int(context.args[0])
+
+    # Recent pairs are all shown on the first page, followed by pages of archived pairs
     user_dict = SERVICES.user_service.get_user_by_telegram_id(telegram_id=str(user.id))
-    pairs = SERVICES.pair_service.get_pairs_for_user(
+    recent_pairs = SERVICES.pair_service.get_pairs_for_user(
         user_id=user_dict["id"], is_current=False
     )
+    recent_pairs.sort(key=lambda x: x["started_at"], reverse=True)
+    page_size = APP_CONFIG["PAST_PAIRS_PAGE_SIZE"]
+    archived_pairs, has_more = SERVICES.pair_service.get_archived_pairs_for_user(
+        user_id=user_dict["id"], page=page - 1, page_size=page_size
+    )
 
-    summary = generate_individual_interview_summary(pairs)
+    if page == 1:
+        pairs = recent_pairs + archived_pairs
+        first_number = 1
+    else:
+        pairs = archived_pairs
+        first_number = len(recent_pairs) + (page - 1) * page_size + 1
+    summary = generate_individual_interview_summary(
+        pairs, page=page, first_number=first_number, has_more=has_more
+    )
     reply_html(update, summary)
 
 
@@ -438,17 +545,11 @@ def confirm_swap_selection(update: Update, context: CallbackContext) -> int:
     user_1 = users[num_1 - 1]
     user_2 = users[num_2 - 1]
 
-    pair_list_1 = SERVICES.pair_service.get_pairs_for_user(
-        user_id=user_1["id"], is_current=True
-    )
-    pair_list_1 = [pair for pair in pair_list_1 if pair["chat_id"] == chat_dict["id"]]
-    pair_1 = None if len(pair_list_1) == 0 else pair_list_1[0]
-
-    pair_list_2 = SERVICES.pair_service.get_pairs_for_user(
-        user_id=user_2["id"], is_current=True
+    pairs = SERVICES.pair_service.get_current_pairs_for_users_in_chat(
+        chat_id=chat_dict["id"], user_ids=[user_1["id"], user_2["id"]]
     )
-    pair_list_2 = [pair for pair in pair_list_2 if pair["chat_id"] == chat_dict["id"]]
-    pair_2 = None if len(pair_list_2) == 0 else pair_list_2[0]
+    pair_1 = pairs.get(user_1["id"])
+    pair_2 = pairs.get(user_2["id"])
 
     if pair_1 is None and pair_2 is None:
         update.message.reply_text(
@@ -517,12 +618,18 @@ def swap_completed(update: Update, context: CallbackContext) -> int:
     swap_data = context.chat_data["SWAP_DATA"]
     user_one_id, pair_one_id = swap_data[0]
     user_two_id, pair_two_id = swap_data[1]
-    SERVICES.pair_service.swap_pairs_for_users(
-        user_one_id=user_one_id,
-        user_two_id=user_two_id,
-        pair_one_id=pair_one_id,
-        pair_two_id=pair_two_id,
-    )
+    try:
+        SERVICES.pair_service.swap_pairs_for_users(
+            user_one_id=user_one_id,
+            user_two_id=user_two_id,
+            pair_one_id=pair_one_id,
+            pair_two_id=pair_two_id,
+        )
+    except InvalidRequestException as e:
+        # The pairs changed while the swap was being confirmed
+        update.message.reply_text(e.message, reply_markup=ReplyKeyboardRemove())
+        context.chat_data.clear()
+        return ConversationHandler.END
 
     update.message.reply_text("Swap has been done!", reply_markup=ReplyKeyboardRemove())
 
@@ -575,4 +682,6 @@ swap_conv_handler = ConversationHandler(
         SWAP_COMPLETED: [MessageHandler(Filters.regex("^(Yes|No)$"), swap_completed)],
     },
     fallbacks=[CommandHandler("cancel", cancel_swap)],
+    name="swap_conv_handler",
+    persistent=True,
 )
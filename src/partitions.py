@@ -0,0 +1,65 @@
+import logging
+from datetime import datetime, timezone
+
+from telegram.ext import CallbackContext
+
+from src.config import APP_CONFIG
+from src.database import QuestionRecord, engine
+
+logger = logging.getLogger(__name__)
+
+# question_records is range partitioned by created_at, with one partition per month.
+# Partition bounds are in UTC.
+
+
+def get_month_start(date: datetime) -> datetime:
+    return date.astimezone(timezone.utc).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+# The migration that partitioned question_records has its own copy of this, as
+# migrations should not change with the app's code
+def add_months(month_start: datetime, months: int) -> datetime:
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return month_start.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+
+def get_partition_name(month_start: datetime) -> str:
+    return f"{QuestionRecord.__tablename__}_y{month_start:%Y}m{month_start:%m}"
+
+
+def create_question_record_partitions(
+    months_ahead: int, months_behind: int = 0
+) -> list[str]:
+    """Creates the partitions for this month and the given number of months around it,
+    if they do not exist yet. Returns the names of the partitions."""
+    month_start = add_months(
+        get_month_start(datetime.now(timezone.utc)), -months_behind
+    )
+    partition_names = []
+    with engine.begin() as connection:
+        for _ in range(months_behind + months_ahead + 1):
+            next_month_start = add_months(month_start, 1)
+            partition_name = get_partition_name(month_start)
+            connection.exec_driver_sql(
+                f"CREATE TABLE IF NOT EXISTS {partition_name} "
+                f"PARTITION OF {QuestionRecord.__tablename__} "
+                f"FOR VALUES FROM ('{month_start.isoformat()}') "
+                f"TO ('{next_month_start.isoformat()}')"
+            )
+            partition_names.append(partition_name)
+            month_start = next_month_start
+    return partition_names
+
+
+# Jobs
+
+
+def create_partitions_job(_: CallbackContext) -> None:
+    """Keeps partitions ready ahead of time, as inserting a question record into a month
+    without a partition fails."""
+    partition_names = create_question_record_partitions(
+        APP_CONFIG["PARTITION_MONTHS_AHEAD"]
+    )
+    logger.info("Question record partitions up to %s exist", partition_names[-1])
@@ -0,0 +1,232 @@
+import json
+import logging
+import pickle
+from collections import defaultdict
+from threading import Lock
+from typing import DefaultDict, Optional
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from telegram.ext import BasePersistence
+from telegram.ext.utils.types import ConversationDict
+
+from src.database import ConversationState, PersistedData, session_scope
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = "user"
+CHAT_DATA = "chat"
+
+
+class SQLPersistence(BasePersistence):
+    """Persists conversation states, user_data and chat_data in Postgres, so that
+    conversations survive restarts.
+
+    Updates from the dispatcher only mark entries as dirty in memory. Dirty entries
+    are written in batches by flush(), which is run on an interval by the job queue
+    and by the updater when the bot is stopped.
+
+    With several worker processes, a user's updates can reach several workers, each
+    with its own copy of their user_data. Only the worker at shard_index, of
+    shard_count, that handles the user's private chat writes their user_data, so that
+    the copies do not overwrite each other. The other copies are kept in memory only.
+    """
+
+    def __init__(self, shard_index: int = 0, shard_count: int = 1):
+        super().__init__(
+            store_user_data=True, store_chat_data=True, store_bot_data=False
+        )
+        self._shard_index = shard_index
+        self._shard_count = shard_count
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._data: Optional[dict[str, DefaultDict[int, dict]]] = None
+        self._conversations: dict[str, ConversationDict] = {}
+        self._dirty_data: set[tuple[str, int]] = set()
+        self._dirty_conversations: set[tuple[str, tuple]] = set()
+
+    # Loading
+
+    def get_user_data(self) -> DefaultDict[int, dict]:
+        return self.__load_data()[USER_DATA]
+
+    def get_chat_data(self) -> DefaultDict[int, dict]:
+        return self.__load_data()[CHAT_DATA]
+
+    def get_bot_data(self) -> dict:
+        return {}
+
+    def get_conversations(self, name: str) -> ConversationDict:
+        with session_scope() as session:
+            rows = (
+                session.query(ConversationState.key, ConversationState.state)
+                .filter(ConversationState.name == name)
+                .all()
+            )
+        conversations = {
+            tuple(json.loads(key)): pickle.loads(state) for key, state in rows
+        }
+        with self._lock:
+            self._conversations[name] = dict(conversations)
+        return conversations
+
+    # Updates, kept in memory until the next flush
+
+    def update_user_data(self, user_id: int, data: dict) -> None:
+        self.__update_data(USER_DATA, user_id, data)
+
+    def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self.__update_data(CHAT_DATA, chat_id, data)
+
+    def update_bot_data(self, data: dict) -> None:
+        pass
+
+    def update_conversation(
+        self, name: str, key: tuple[int, ...], new_state: Optional[object]
+    ) -> None:
+        with self._lock:
+            conversations = self._conversations.setdefault(name, {})
+            if conversations.get(key) == new_state:
+                return
+            if new_state is None:
+                conversations.pop(key, None)
+            else:
+                conversations[key] = new_state
+            self._dirty_conversations.add((name, key))
+
+    def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    # Writing
+
+    def flush(self) -> None:
+        """Writes all dirty entries to the database in a single transaction."""
+        with self._flush_lock:
+            with self._lock:
+                dirty_data = self._dirty_data
+                dirty_conversations = self._dirty_conversations
+                self._dirty_data = set()
+                self._dirty_conversations = set()
+                # Data passed to the update methods is a copy that is replaced, not
+                # mutated, so it is safe to serialise outside of the lock.
+                data_snapshot = {
+                    (kind, id): self.__get_loaded_data()[kind].get(id)
+                    for kind, id in dirty_data
+                }
+                conversation_snapshot = {
+                    (name, key): self._conversations.get(name, {}).get(key)
+                    for name, key in dirty_conversations
+                }
+
+            if not data_snapshot and not conversation_snapshot:
+                return
+
+            try:
+                self.__write(data_snapshot, conversation_snapshot)
+            except Exception:
+                logger.exception("Failed to flush persistence, will retry")
+                with self._lock:
+                    self._dirty_data |= dirty_data
+                    self._dirty_conversations |= dirty_conversations
+
+    def __write(
+        self,
+        data_snapshot: dict[tuple[str, int], Optional[dict]],
+        conversation_snapshot: dict[tuple[str, tuple], Optional[object]],
+    ) -> None:
+        data_upserts = [
+            {"kind": kind, "telegram_id": str(id), "data": pickle.dumps(data)}
+            for (kind, id), data in data_snapshot.items()
+            if data
+        ]
+        data_deletes = [
+            (kind, str(id)) for (kind, id), data in data_snapshot.items() if not data
+        ]
+        conversation_upserts = [
+            {"name": name, "key": json.dumps(key), "state": pickle.dumps(state)}
+            for (name, key), state in conversation_snapshot.items()
+            if state is not None
+        ]
+        conversation_deletes = [
+            (name, json.dumps(key))
+            for (name, key), state in conversation_snapshot.items()
+            if state is None
+        ]
+
+        with session_scope() as session:
+            if data_upserts:
+                statement = insert(PersistedData.__table__)
+                session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["kind", "telegram_id"],
+                        set_={
+                            "data": statement.excluded.data,
+                            "updated_at": func.now(),
+                        },
+                    ),
+                    data_upserts,
+                )
+            if data_deletes:
+                session.query(PersistedData).filter(
+                    tuple_(PersistedData.kind, PersistedData.telegram_id).in_(
+                        data_deletes
+                    )
+                ).delete(synchronize_session=False)
+            if conversation_upserts:
+                statement = insert(ConversationState.__table__)
+                session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["name", "key"],
+                        set_={
+                            "state": statement.excluded.state,
+                            "updated_at": func.now(),
+                        },
+                    ),
+                    conversation_upserts,
+                )
+            if conversation_deletes:
+                session.query(ConversationState).filter(
+                    tuple_(ConversationState.name, ConversationState.key).in_(
+                        conversation_deletes
+                    )
+                ).delete(synchronize_session=False)
+
+    # Helpers
+
+    def __load_data(self) -> dict[str, DefaultDict[int, dict]]:
+        with self._lock:
+            if self._data is not None:
+                return self._data
+
+            data: dict[str, DefaultDict[int, dict]] = {
+                USER_DATA: defaultdict(dict),
+                CHAT_DATA: defaultdict(dict),
+            }
+            with session_scope() as session:
+                for kind, telegram_id, pickled_data in session.query(
+                    PersistedData.kind, PersistedData.telegram_id, PersistedData.data
+                ):
+                    data[kind][int(telegram_id)] = pickle.loads(pickled_data)
+            self._data = data
+            return data
+
+    def __update_data(self, kind: str, id: int, data: dict) -> None:
+        with self._lock:
+            stored = self.__get_loaded_data()[kind]
+            # The dispatcher reports the data of every update, changed or not
+            if stored.get(id, {}) == data:
+                return
+            stored[id] = data
+            if kind != USER_DATA or id % self._shard_count == self._shard_index:
+                self._dirty_data.add((kind, id))
+
+    def __get_loaded_data(self) -> dict[str, DefaultDict[int, dict]]:
+        # The dispatcher loads all data when it is created, before any update
+        assert self._data is not None
+        return self._data
@@ -0,0 +1,126 @@
+import html
+from threading import Lock
+from time import perf_counter
+
+from sqlalchemy import event
+from telegram import ParseMode
+from telegram.ext import CallbackContext
+
+from src.config import APP_CONFIG
+from src.database import QueryStats, engines, get_query_stats
+from src.services import SERVICES
+from src.utils import escape_html, pack_messages
+
+# Characters of a statement shown in a report, once escaped
+STATEMENT_PREVIEW_LENGTH = 1000
+
+
+class QueryReport:
+    def __init__(self, kind: str, handler: str, statement: str):
+        self.kind = kind
+        self.handler = handler
+        self.statement = statement
+        # Number of times this was seen since the last report
+        self.occurrences = 0
+        # Slowest duration in seconds, or the most repetitions in one update
+        self.worst = 0.0
+
+
+class QueryMonitor:
+    """Collects slow queries, and statements repeated many times within a single update
+    (usually lazy loads in a loop). Findings are deduplicated and sent to the developer
+    in periodic batches."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._reports: dict[tuple[str, str, str], QueryReport] = {}
+
+    def record_slow_query(self, statement: str, duration: float) -> None:
+        stats = get_query_stats()
+        handler = (stats.handler if stats is not None else None) or "(no handler)"
+        SERVICES.logger.warning(
+            "Slow query in %s took %.0f ms: %s",
+            handler,
+            duration * 1000,
+            statement[:STATEMENT_PREVIEW_LENGTH],
+        )
+        self.__add_report("slow", handler, statement, duration)
+
+    def check_update(self, stats: QueryStats) -> None:
+        """Flags statements that were run too many times while handling one update."""
+        for statement, count in stats.statements.items():
+            if count > APP_CONFIG["REPEATED_QUERY_THRESHOLD"]:
+                self.__add_report(
+                    "repeated", stats.handler or "(no handler)", statement, count
+                )
+
+    def pop_reports(self) -> list[QueryReport]:
+        with self._lock:
+            reports = list(self._reports.values())
+            self._reports = {}
+        return reports
+
+    def __add_report(
+        self, kind: str, handler: str, statement: str, value: float
+    ) -> None:
+        with self._lock:
+            report = self._reports.setdefault(
+                (kind, handler, statement), QueryReport(kind, handler, statement)
+            )
+            report.occurrences += 1
+            report.worst = max(report.worst, value)
+
+
+QUERY_MONITOR = QueryMonitor()
+
+
+# The start time is kept on the statement's execution context, which is discarded
+# whether or not the statement succeeds
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = perf_counter()
+
+
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is None or not hasattr(context, "_query_start"):
+        return
+    duration = perf_counter() - context._query_start
+    if duration > APP_CONFIG["SLOW_QUERY_THRESHOLD"]:
+        QUERY_MONITOR.record_slow_query(statement, duration)
+
+
+for _engine in engines:
+    event.listen(_engine, "before_cursor_execute", _start_query_timer)
+    event.listen(_engine, "after_cursor_execute", _stop_query_timer)
+
+
+# Jobs
+
+
+def send_query_reports_job(context: CallbackContext) -> None:
+    """Sends the developer the slow and repeated queries found since the last run."""
+    reports = QUERY_MONITOR.pop_reports()
+    if not reports:
+        return
+    reports.sort(key=lambda x: (x.kind, -x.occurrences))
+
+    entries = ["<b>Query report</b>"]
+    for report in reports:
+        if report.kind == "slow":
+            # Using .format for readability
+            title = "Slow query in {}: {} times, slowest {:.0f} ms".format(
+                report.handler, report.occurrences, report.worst * 1000
+            )
+        else:
+            title = "Repeated query in {}: in {} updates, up to {} times each".format(
+                report.handler, report.occurrences, int(report.worst)
+            )
+        entries.append(
+            f"<b>{html.escape(title)}</b>\n"
+            f"<pre>{escape_html(report.statement, STATEMENT_PREVIEW_LENGTH)}</pre>"
+        )
+
+    for message in pack_messages(entries):
+        context.bot.send_message(
+            chat_id=APP_CONFIG["DEVELOPER_ID"], text=message, parse_mode=ParseMode.HTML
+        )
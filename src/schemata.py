@@ -1,3 +1,4 @@
+from datetime import datetime
 from functools import wraps
 
 from cerberus import Validator  # type: ignore
@@ -21,6 +22,12 @@ def validate_input(schema, **validator_kwargs):
     return decorator
 
 
+def to_aware_datetime(value: str) -> datetime:
+    """Parses an ISO 8601 timestamp. Timestamps without an offset are local."""
+    parsed = datetime.fromisoformat(value.strip())
+    return parsed if parsed.tzinfo is not None else parsed.astimezone()
+
+
 UUID_REGEX = (
     "[a-fA-F0-9]{8}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{12}"
 )
@@ -64,6 +71,13 @@ CREATE_QUESTION_RECORD_SCHEMA = {
     "question_name": {"type": "string"},
     "difficulty": {"type": "string", "allowed": ["easy", "medium", "hard"]},
 }
+# Rows of an imported CSV, which may have other columns
+IMPORT_QUESTION_RECORD_SCHEMA = {
+    "completed_at": {"type": "datetime", "coerce": to_aware_datetime},
+    "question": {"type": "string", "empty": False, "coerce": str.strip},
+    "difficulty": {**CREATE_QUESTION_RECORD_SCHEMA["difficulty"], "coerce": str.lower},
+    "platform": {**CREATE_QUESTION_RECORD_SCHEMA["platform"], "coerce": str.lower},
+}
 GET_QUESTION_RECORD_SCHEMA = {
     "user_id": UUID_RULE,
     "summary_type": {"required": False},
@@ -74,6 +88,18 @@ GET_QUESTION_RECORDS_SCHEMA = {
     "summary_type": {"required": False},
     "is_last_week": {"type": "boolean", "required": False},
 }
+GET_CHAT_RECORD_COUNTS_SCHEMA = {
+    "chat_id": UUID_RULE,
+    "summary_type": {"required": False},
+}
+GET_RECORD_STATS_SCHEMA = {
+    "user_ids": UUIDS_RULE,
+    "months": {"type": "integer", "min": 1},
+}
+GET_CHATS_SUMMARY_SCHEMA = {
+    "summary_type": {"required": False},
+    "is_last_week": {"type": "boolean", "required": False},
+}
 
 CREATE_INTERVIEW_PAIRS_SCHEMA = {
     "pairs": {
@@ -82,10 +108,26 @@ CREATE_INTERVIEW_PAIRS_SCHEMA = {
     },
     "chat_id": UUID_RULE,
 }
+CREATE_INTERVIEW_PAIRS_FOR_CHATS_SCHEMA = {
+    "pairs_by_chat": {
+        "type": "dict",
+        "keysrules": UUID_RULE,
+        "valuesrules": CREATE_INTERVIEW_PAIRS_SCHEMA["pairs"],
+    },
+}
 GET_INTERVIEW_PAIRS_FOR_USER_SCHEMA = {
     "user_id": UUID_RULE,
     "is_current": {"type": "boolean", "required": False},
 }
+GET_ARCHIVED_INTERVIEW_PAIRS_FOR_USER_SCHEMA = {
+    "user_id": UUID_RULE,
+    "page": {"type": "integer", "min": 0},
+    "page_size": {"type": "integer", "min": 1},
+}
+GET_CURRENT_INTERVIEW_PAIRS_FOR_USERS_IN_CHAT_SCHEMA = {
+    "chat_id": UUID_RULE,
+    "user_ids": UUIDS_RULE,
+}
 SWAP_INTERVIEW_PAIRS_SCHEMA = {
     "user_one_id": UUID_RULE,
     "user_two_id": UUID_RULE,
@@ -1,36 +1,56 @@
 import logging
-from datetime import datetime
-from sys import stdout
+from datetime import date, datetime, timedelta
+from itertools import product
+from threading import Lock
 from time import sleep
-from typing import Optional
-
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from sqlalchemy.orm import aliased
-from sqlalchemy.sql.expression import or_
+from typing import Iterator, Optional
+
+from sqlalchemy import (
+    Date,
+    Integer,
+    bindparam,
+    cast,
+    delete,
+    extract,
+    func,
+    insert,
+    select,
+    union_all,
+)
+from sqlalchemy.orm import aliased, joinedload
+from sqlalchemy.sql.expression import and_, or_
 
-from src.config import APP_CONFIG, Config
+from src.cache import SummaryCache
+from src.config import APP_CONFIG, LOCAL_TIMEZONE, Config
 from src.database import (
+    ArchivedInterviewPair,
     Belong,
     Chat,
     InterviewPair,
     QuestionRecord,
     User,
+    read_session_scope,
     session_scope,
 )
-from src.exceptions import ResourceNotFoundException
+from src.exceptions import InvalidRequestException, ResourceNotFoundException
+from src.leaderboards import Leaderboards
+from src.logs import configure_logging
 from src.schemata import (
     BELONG_SCHEMA,
     CREATE_CHAT_SCHEMA,
+    CREATE_INTERVIEW_PAIRS_FOR_CHATS_SCHEMA,
     CREATE_INTERVIEW_PAIRS_SCHEMA,
     CREATE_QUESTION_RECORD_SCHEMA,
     CREATE_USER_SCHEMA,
+    GET_ARCHIVED_INTERVIEW_PAIRS_FOR_USER_SCHEMA,
+    GET_CHAT_RECORD_COUNTS_SCHEMA,
     GET_CHAT_SCHEMA,
+    GET_CHATS_SUMMARY_SCHEMA,
+    GET_CURRENT_INTERVIEW_PAIRS_FOR_USERS_IN_CHAT_SCHEMA,
     GET_INTERVIEW_PAIRS_FOR_USER_SCHEMA,
     GET_QUESTION_RECORD_SCHEMA,
     GET_QUESTION_RECORDS_SCHEMA,
+    GET_RECORD_STATS_SCHEMA,
     GET_USER_SCHEMA,
     MIGRATE_CHAT_SCHEMA,
     OPT_IN_OUT_SCHEMA,
@@ -46,15 +66,153 @@ from src.utils import (
     get_start_of_last_week,
     get_start_of_month,
     get_start_of_week,
+    get_summary_period_start,
+)
+
+# Eagerly loads everything needed by InterviewPair.asdict, avoiding a lazy load
+# per pair.
+PAIR_LOAD_OPTIONS = (
+    joinedload(InterviewPair.user_one),
+    joinedload(InterviewPair.user_two),
+    joinedload(InterviewPair.chat),
+)
+ARCHIVED_PAIR_LOAD_OPTIONS = (
+    joinedload(ArchivedInterviewPair.user_one),
+    joinedload(ArchivedInterviewPair.user_two),
+    joinedload(ArchivedInterviewPair.chat),
+)
+
+
+# Prebuilt statements for the hottest queries. Calls only bind parameters, instead of
+# building a statement and computing its cache key every time, which costs more than
+# running these queries for a small group.
+
+
+def build_records_by_users_statement(
+    has_before_date: bool, has_after_date: bool, is_unique: bool
+):
+    record_filters = []
+    if has_before_date:
+        record_filters.append(QuestionRecord.created_at >= bindparam("before_date"))
+    if has_after_date:
+        record_filters.append(QuestionRecord.created_at < bindparam("after_date"))
+    question_alias = aliased(
+        QuestionRecord, select(QuestionRecord).filter(*record_filters).subquery()
+    )
+
+    statement = (
+        select(User, question_alias)
+        .filter(User.id.in_(bindparam("user_ids", expanding=True)))
+        .outerjoin(question_alias, question_alias.user_id == User.id)
+    )
+    if is_unique:
+        return statement.distinct(
+            question_alias.question_name,
+            question_alias.platform,
+            question_alias.difficulty,
+        )
+    return statement.order_by(question_alias.created_at)
+
+
+# Keyed by whether there is a before date, an after date, and only unique questions
+RECORDS_BY_USERS_STATEMENTS = {
+    key: build_records_by_users_statement(*key)
+    for key in product((False, True), repeat=3)
+}
+USERS_IN_CHAT_STATEMENT = (
+    select(User, Belong)
+    .join(Belong, Belong.user_id == User.id)
+    .filter(Belong.chat_id == bindparam("chat_id"))
+)
+PAIRS_FOR_CHAT_STATEMENT = (
+    select(InterviewPair)
+    .options(*PAIR_LOAD_OPTIONS)
+    .filter(InterviewPair.chat_id == bindparam("chat_id"))
+    .filter(InterviewPair.started_at >= bindparam("before_date"))
+    .filter(InterviewPair.started_at < bindparam("after_date"))
+)
+
+
+# Days and weekdays of records are those of the bot's time zone
+LOCAL_CREATED_AT = func.timezone(LOCAL_TIMEZONE.zone, QuestionRecord.created_at)
+
+
+RECORD_EXPORT_COLUMNS = ["completed_at", "name", "question", "difficulty", "platform"]
+PAIR_EXPORT_COLUMNS = [
+    "started_at",
+    "user_one",
+    "user_two",
+    "chat",
+    "is_completed",
+    "completed_at",
+]
+
+
+def build_pair_export_statement(*conditions):
+    """Selects the current and archived pairs that match any of the conditions, each
+    given as a function of the pair model, as in PAIR_EXPORT_COLUMNS."""
+    user_one = aliased(User)
+    user_two = aliased(User)
+    selects = [
+        select(
+            model.started_at,
+            user_one.full_name,
+            user_two.full_name,
+            Chat.title,
+            model.is_completed,
+            model.completed_at,
+        )
+        .join(user_one, model.user_one_id == user_one.id)
+        .join(user_two, model.user_two_id == user_two.id)
+        .join(Chat, model.chat_id == Chat.id)
+        .where(condition(model))
+        for model in (ArchivedInterviewPair, InterviewPair)
+        for condition in conditions
+    ]
+    pairs = union_all(*selects).subquery()
+    return (
+        select(pairs)
+        .order_by(pairs.c.started_at)
+        .execution_options(stream_results=True)
+    )
+
+
+def stream_rows(statement, batch_size: int) -> Iterator[tuple]:
+    """Yields the rows of a statement with stream_results set, fetching them from the
+    server-side cursor a batch at a time."""
+    with read_session_scope() as session:
+        for rows in session.execute(statement).partitions(batch_size):
+            yield from rows
+
+
+def get_chat_ids_for_user(session, user_id: str) -> list[str]:
+    return [
+        chat_id
+        for (chat_id,) in session.query(Belong.chat_id).filter_by(user_id=user_id)
+    ]
+
+
+SWAP_STALE_MESSAGE = (
+    "These pairs have changed since the swap was requested. "
+    "Please send /swap_pairs again."
+)
+SWAP_COMPLETED_MESSAGE = (
+    "At least one of these two users has already completed their interview. "
+    "You won't be able to swap them."
 )
 
 
 class UserService:
-    def __init__(self, config: Config):
+    def __init__(
+        self, config: Config, summary_cache: SummaryCache, leaderboards: Leaderboards
+    ):
         self.config = config
+        self.summary_cache = summary_cache
+        self.leaderboards = leaderboards
 
     @validate_input(CREATE_USER_SCHEMA)
     def create_if_not_exists(self, full_name: str, telegram_id: str) -> dict:
+        renamed_chat_ids: list[str] = []
         with session_scope() as session:
             user: Optional[User] = (
                 session.query(User).filter_by(telegram_id=telegram_id).one_or_none()
@@ -63,15 +221,22 @@ class UserService:
                 user = User(full_name=full_name, telegram_id=telegram_id)
                 session.add(user)
                 session.flush()
-            else:
+            elif user.full_name != full_name:
                 user.full_name = full_name
+                renamed_chat_ids = get_chat_ids_for_user(session, str(user.id))
 
             session.commit()
-            return user.asdict()
+            user_dict = user.asdict()
+        # Names appear in group summaries and leaderboards
+        self.summary_cache.bump(renamed_chat_ids)
+        self.leaderboards.rename_member(
+            user_dict["id"], user_dict["full_name"], renamed_chat_ids
+        )
+        return user_dict
 
     @validate_input(GET_USER_SCHEMA)
     def get_user_by_telegram_id(self, telegram_id: str) -> dict:
-        with session_scope() as session:
+        with read_session_scope() as session:
             user: Optional[User] = (
                 session.query(User).filter_by(telegram_id=telegram_id).one_or_none()
             )
@@ -82,7 +247,7 @@ class UserService:
 
     @validate_input({"id": UUID_RULE})
     def get_user_by_id(self, id: str) -> dict:
-        with session_scope() as session:
+        with read_session_scope() as session:
             user: Optional[User] = session.query(User).filter_by(id=id).one_or_none()
             if user is None:
                 raise ResourceNotFoundException()
@@ -91,7 +256,7 @@ class UserService:
 
     @validate_input({"ids": UUIDS_RULE})
     def get_users_by_id(self, ids: list[str]) -> list[dict]:
-        with session_scope() as session:
+        with read_session_scope() as session:
             users: list[User] = session.query(User).filter(User.id.in_(ids)).all()
             if len(users) != len(ids):
                 raise ResourceNotFoundException()
@@ -100,8 +265,12 @@ class UserService:
 
 
 class QuestionRecordService:
-    def __init__(self, config: Config):
+    def __init__(
+        self, config: Config, summary_cache: SummaryCache, leaderboards: Leaderboards
+    ):
         self.config = config
+        self.summary_cache = summary_cache
+        self.leaderboards = leaderboards
 
     @validate_input(CREATE_QUESTION_RECORD_SCHEMA)
     def create_question_record(
@@ -120,9 +289,13 @@ class QuestionRecordService:
             )
 
             session.add(question_record)
-            session.commit()
+            chat_ids = get_chat_ids_for_user(session, user_id)
+            with self.leaderboards.adding_record(user_id, chat_ids):
+                session.commit()
 
-            return question_record.asdict()
+            question_record_dict = question_record.asdict()
+        self.summary_cache.bump(chat_ids)
+        return question_record_dict
 
     @validate_input(GET_QUESTION_RECORD_SCHEMA)
     def get_records_by_user(
@@ -134,7 +307,7 @@ class QuestionRecordService:
         before_date = self.__get_before_date(summary_type, is_last_week=is_last_week)
         after_date = self.__get_after_date(summary_type) if is_last_week else None
 
-        with session_scope() as session:
+        with read_session_scope() as session:
             query = session.query(QuestionRecord).filter_by(user_id=user_id)
             if before_date is not None:
                 query = query.filter(QuestionRecord.created_at >= before_date)
@@ -162,29 +335,21 @@ class QuestionRecordService:
         before_date = self.__get_before_date(summary_type, is_last_week=is_last_week)
         after_date = self.__get_after_date(summary_type) if is_last_week else None
 
-        with session_scope() as session:
-            subquery = session.query(QuestionRecord)
-            if before_date is not None:
-                subquery = subquery.filter(QuestionRecord.created_at >= before_date)
-            if after_date is not None:
-                subquery = subquery.filter(QuestionRecord.created_at < after_date)
-            question_alias = aliased(QuestionRecord, subquery.subquery())
-
-            query = (
-                session.query(User, question_alias)
-                .filter(User.id.in_(user_ids))
-                .outerjoin(question_alias, question_alias.user_id == User.id)
+        statement = RECORDS_BY_USERS_STATEMENTS[
+            (
+                before_date is not None,
+                after_date is not None,
+                summary_type == SummaryType.ALL_UNIQUE,
             )
+        ]
+        parameters: dict[str, object] = {"user_ids": user_ids}
+        if before_date is not None:
+            parameters["before_date"] = before_date
+        if after_date is not None:
+            parameters["after_date"] = after_date
 
-            if summary_type == SummaryType.ALL_UNIQUE:
-                query = query.distinct(
-                    question_alias.question_name,
-                    question_alias.platform,
-                    question_alias.difficulty,
-                )
-                user_record_pairs = query.all()
-            else:
-                user_record_pairs = query.order_by(question_alias.created_at).all()
+        with read_session_scope() as session:
+            user_record_pairs = session.execute(statement, parameters).all()
 
             results: dict[str, dict] = {}
             for user, question_record in user_record_pairs:
@@ -201,20 +366,188 @@ class QuestionRecordService:
                     )
             return results
 
+    @validate_input(GET_CHATS_SUMMARY_SCHEMA)
+    def get_record_counts_for_all_chats(
+        self, summary_type: Optional[SummaryType] = None, is_last_week: bool = False
+    ) -> dict[str, dict[str, dict]]:
+        """Returns the number of questions completed by each opted-in member of every chat,
+        grouped by chat id and then user id."""
+        before_date = self.__get_before_date(summary_type, is_last_week=is_last_week)
+        after_date = self.__get_after_date(summary_type) if is_last_week else None
+
+        record_filters = [QuestionRecord.user_id == User.id]
+        if before_date is not None:
+            record_filters.append(QuestionRecord.created_at >= before_date)
+        if after_date is not None:
+            record_filters.append(QuestionRecord.created_at < after_date)
+
+        with read_session_scope() as session:
+            rows = (
+                session.query(
+                    Belong.chat_id,
+                    User.id,
+                    User.full_name,
+                    func.count(QuestionRecord.id),
+                )
+                .join(User, Belong.user_id == User.id)
+                .outerjoin(QuestionRecord, and_(*record_filters))
+                .filter(Belong.is_opted_out.is_(False))
+                .group_by(Belong.chat_id, User.id, User.full_name)
+                .all()
+            )
+            results: dict[str, dict[str, dict]] = {}
+            for chat_id, user_id, full_name, count in rows:
+                results.setdefault(chat_id, {})[str(user_id)] = {
+                    "full_name": full_name,
+                    "count": count,
+                }
+            return results
+
+    @validate_input(GET_CHAT_RECORD_COUNTS_SCHEMA)
+    def get_record_counts_for_chat(
+        self, chat_id: str, summary_type: Optional[SummaryType] = None
+    ) -> dict[str, dict]:
+        """Returns the number of questions completed by each opted-in member of the chat,
+        by user id. Reads from the primary, as leaderboards loaded from it are then
+        kept up to date with every later change."""
+        before_date = self.__get_before_date(summary_type)
+
+        record_filters = [QuestionRecord.user_id == User.id]
+        if before_date is not None:
+            record_filters.append(QuestionRecord.created_at >= before_date)
+
+        with session_scope() as session:
+            rows = (
+                session.query(User.id, User.full_name, func.count(QuestionRecord.id))
+                .join(Belong, Belong.user_id == User.id)
+                .outerjoin(QuestionRecord, and_(*record_filters))
+                .filter(Belong.chat_id == chat_id)
+                .filter(Belong.is_opted_out.is_(False))
+                .group_by(User.id, User.full_name)
+                .all()
+            )
+            return {
+                str(user_id): {"full_name": full_name, "count": count}
+                for user_id, full_name, count in rows
+            }
+
+    @validate_input(GET_RECORD_STATS_SCHEMA)
+    def get_record_stats(self, user_ids: list[str], months: int) -> dict:
+        """Returns the streaks, weekday histogram and monthly difficulty mix of the
+        records of the given users, taken together.
+
+        Everything is aggregated by the database, so only a row per streak, weekday
+        and month is loaded, however many records there are. Streaks are runs of
+        consecutive days with at least one record. Consecutive days less their
+        position among the days are the same date, which groups each run.
+        """
+        days = (
+            select(cast(LOCAL_CREATED_AT, Date).label("day"))
+            .filter(QuestionRecord.user_id.in_(user_ids))
+            .distinct()
+            .subquery()
+        )
+        islands = select(
+            days.c.day,
+            (
+                days.c.day - cast(func.row_number().over(order_by=days.c.day), Integer)
+            ).label("island"),
+        ).subquery()
+        streaks_statement = (
+            select(func.max(islands.c.day), func.count())
+            .group_by(islands.c.island)
+            .order_by(func.max(islands.c.day))
+        )
+
+        # Grouped outside a subquery, as grouping by an expression with parameters
+        # does not match the selected expression when parameters are sent separately
+        weekdays = (
+            select(extract("isodow", LOCAL_CREATED_AT).label("weekday"))
+            .filter(QuestionRecord.user_id.in_(user_ids))
+            .subquery()
+        )
+        weekdays_statement = select(weekdays.c.weekday, func.count()).group_by(
+            weekdays.c.weekday
+        )
+
+        first_month = get_start_of_month(months_ago=months - 1).astimezone()
+        months_subquery = (
+            select(
+                func.date_trunc("month", LOCAL_CREATED_AT).label("month"),
+                QuestionRecord.difficulty,
+            )
+            .filter(QuestionRecord.user_id.in_(user_ids))
+            .filter(QuestionRecord.created_at >= first_month)
+            .subquery()
+        )
+        difficulties_statement = (
+            select(months_subquery.c.month, months_subquery.c.difficulty, func.count())
+            .group_by(months_subquery.c.month, months_subquery.c.difficulty)
+            .order_by(months_subquery.c.month)
+        )
+
+        with read_session_scope() as session:
+            streaks = session.execute(streaks_statement).all()
+            weekday_counts = session.execute(weekdays_statement).all()
+            difficulty_counts = session.execute(difficulties_statement).all()
+
+        # A streak is still current if it ended yesterday, until today is over
+        today = date.today()
+        current_streak = 0
+        if streaks and (today - streaks[-1][0]).days <= 1:
+            current_streak = streaks[-1][1]
+
+        counts_by_weekday = [0] * 7
+        for isodow, count in weekday_counts:
+            counts_by_weekday[int(isodow) - 1] = count
+
+        difficulties_by_month: dict[date, dict[str, int]] = {}
+        for month_start, difficulty, count in difficulty_counts:
+            difficulties_by_month.setdefault(month_start.date(), {})[difficulty] = count
+
+        return {
+            "total": sum(counts_by_weekday),
+            "current_streak": current_streak,
+            "longest_streak": max((length for _, length in streaks), default=0),
+            # Monday first
+            "counts_by_weekday": counts_by_weekday,
+            "difficulties_by_month": difficulties_by_month,
+        }
+
+    @validate_input({"user_ids": UUIDS_RULE})
+    def export_records(self, user_ids: list[str]) -> Iterator[tuple]:
+        """Yields a row per record of the given users, oldest first, as in
+        RECORD_EXPORT_COLUMNS. Rows are streamed from a server-side cursor, so only a
+        batch of them is in memory at a time."""
+        statement = (
+            select(
+                QuestionRecord.created_at,
+                User.full_name,
+                QuestionRecord.question_name,
+                QuestionRecord.difficulty,
+                QuestionRecord.platform,
+            )
+            .join(User, QuestionRecord.user_id == User.id)
+            .filter(QuestionRecord.user_id.in_(user_ids))
+            .order_by(QuestionRecord.created_at)
+            .execution_options(stream_results=True)
+        )
+        yield from stream_rows(statement, self.config["EXPORT_BATCH_SIZE"])
+
+    # Dates are made timezone aware, as comparing created_at with a naive timestamp
+    # depends on the session time zone, which stops the planner from pruning partitions.
+
     def __get_before_date(
         self, summary_type: Optional[SummaryType], is_last_week: bool = False
     ) -> Optional[datetime]:
-        if summary_type == SummaryType.WEEKLY:
-            return get_start_of_last_week() if is_last_week else get_start_of_week()
-        elif summary_type == SummaryType.MONTHLY:
-            return get_start_of_month()
-        return None
+        before_date = get_summary_period_start(summary_type, is_last_week=is_last_week)
+        return before_date.astimezone() if before_date is not None else None
 
     def __get_after_date(
         self, summary_type: Optional[SummaryType]
     ) -> Optional[datetime]:
         if summary_type == SummaryType.WEEKLY:
-            return get_start_of_week()
+            return get_start_of_week().astimezone()
         return None
 
 
@@ -240,7 +573,7 @@ class ChatService:
 
     @validate_input(GET_CHAT_SCHEMA)
     def get_chat_by_telegram_id(self, telegram_id: str) -> dict:
-        with session_scope() as session:
+        with read_session_scope() as session:
             chat: Optional[Chat] = (
                 session.query(Chat).filter_by(telegram_id=telegram_id).one_or_none()
             )
@@ -249,6 +582,20 @@ class ChatService:
             chat_dict = chat.asdict()
         return chat_dict
 
+    @validate_input({"ids": UUIDS_RULE})
+    def get_chats_by_id(self, ids: list[str]) -> list[dict]:
+        with read_session_scope() as session:
+            chats: list[Chat] = session.query(Chat).filter(Chat.id.in_(ids)).all()
+            if len(chats) != len(ids):
+                raise ResourceNotFoundException()
+            chat_dicts = [chat.asdict() for chat in chats]
+        return chat_dicts
+
+    def get_all_chats(self) -> list[dict]:
+        with read_session_scope() as session:
+            chat_dicts = [chat.asdict() for chat in session.query(Chat).all()]
+        return chat_dicts
+
     @validate_input(MIGRATE_CHAT_SCHEMA)
     def migrate_chat_telegram_id(
         self, old_telegram_id: str, new_telegram_id: str
@@ -268,8 +615,12 @@ class ChatService:
 
 
 class BelongService:
-    def __init__(self, config: Config):
+    def __init__(
+        self, config: Config, summary_cache: SummaryCache, leaderboards: Leaderboards
+    ):
         self.config = config
+        self.summary_cache = summary_cache
+        self.leaderboards = leaderboards
 
     @validate_input(BELONG_SCHEMA)
     def add_user_to_chat_if_not_inside(self, user_id: str, chat_id: str) -> dict:
@@ -279,12 +630,17 @@ class BelongService:
                 .filter_by(user_id=user_id, chat_id=chat_id)
                 .one_or_none()
             )
+            is_added = belong is None
             if belong is None:
                 belong = Belong(user_id=user_id, chat_id=chat_id)
                 session.add(belong)
                 session.flush()
             session.commit()
-            return belong.asdict()
+            belong_dict = belong.asdict()
+        if is_added:
+            self.summary_cache.bump([chat_id])
+            self.leaderboards.invalidate([chat_id])
+        return belong_dict
 
     @validate_input(BELONG_SCHEMA)
     def remove_user_from_chat_if_inside(self, user_id: str, chat_id: str) -> dict:
@@ -296,23 +652,25 @@ class BelongService:
             )
             if belong is not None:
                 session.delete(belong)
+        if belong is not None:
+            self.summary_cache.bump([chat_id])
+            self.leaderboards.remove_member(user_id, chat_id)
         return {}
 
     @validate_input({"chat_id": UUID_RULE})
     def get_users_in_chat(self, chat_id: str) -> list[dict]:
-        with session_scope() as session:
+        with read_session_scope() as session:
             users = [
                 {**u.asdict(), "is_opted_out": b.is_opted_out}
-                for (u, b) in session.query(User, Belong)
-                .join(Belong, Belong.user_id == User.id)
-                .filter(Belong.chat_id == chat_id)
-                .all()
+                for (u, b) in session.execute(
+                    USERS_IN_CHAT_STATEMENT, {"chat_id": chat_id}
+                ).all()
             ]
         return users
 
     @validate_input(BELONG_SCHEMA)
     def is_user_inside_chat(self, user_id: str, chat_id: str) -> bool:
-        with session_scope() as session:
+        with read_session_scope() as session:
             belong = (
                 session.query(Belong)
                 .filter_by(user_id=user_id, chat_id=chat_id)
@@ -322,7 +680,7 @@ class BelongService:
 
     @validate_input(BELONG_SCHEMA)
     def is_user_opted_out(self, user_id: str, chat_id: str) -> bool:
-        with session_scope() as session:
+        with read_session_scope() as session:
             belong: Optional[Belong] = (
                 session.query(Belong)
                 .filter_by(user_id=user_id, chat_id=chat_id)
@@ -344,12 +702,19 @@ class BelongService:
                 raise ResourceNotFoundException()
             belong.is_opted_out = should_opt_out
             session.commit()
-            return belong.asdict()
+            belong_dict = belong.asdict()
+        self.summary_cache.bump([chat_id])
+        if should_opt_out:
+            self.leaderboards.remove_member(user_id, chat_id)
+        else:
+            self.leaderboards.invalidate([chat_id])
+        return belong_dict
 
 
 class InterviewPairService:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, summary_cache: SummaryCache):
         self.config = config
+        self.summary_cache = summary_cache
 
     @validate_input(CREATE_INTERVIEW_PAIRS_SCHEMA)
     def add_pairs_for_chat(self, pairs: list[list[str]], chat_id: str):
@@ -366,6 +731,7 @@ class InterviewPairService:
                     for user_one_id, user_two_id in pairs
                 ]
             )
+        self.summary_cache.bump([chat_id])
 
     @validate_input(
         {"chat_id": UUID_RULE, "is_last_week": {"type": "boolean", "required": False}}
@@ -375,22 +741,116 @@ class InterviewPairService:
     ) -> list[dict]:
         before_date = get_start_of_last_week() if is_last_week else get_start_of_week()
         after_date = get_start_of_week() if is_last_week else datetime.now()
-        with session_scope() as session:
+        with read_session_scope() as session:
+            pairs = (
+                session.execute(
+                    PAIRS_FOR_CHAT_STATEMENT,
+                    {
+                        "chat_id": chat_id,
+                        "before_date": before_date,
+                        "after_date": after_date,
+                    },
+                )
+                .scalars()
+                .all()
+            )
+            return [pair.asdict() for pair in pairs]
+
+    @validate_input({"chat_ids": UUIDS_RULE})
+    def get_pairs_for_chats(self, chat_ids: list[str]) -> dict[str, list[dict]]:
+        monday = get_start_of_week()
+        with read_session_scope() as session:
             pairs = (
                 session.query(InterviewPair)
-                .filter(InterviewPair.chat_id == chat_id)
+                .options(*PAIR_LOAD_OPTIONS)
+                .filter(InterviewPair.chat_id.in_(chat_ids))
+                .filter(InterviewPair.started_at >= monday)
+                .all()
+            )
+            results: dict[str, list[dict]] = {chat_id: [] for chat_id in chat_ids}
+            for pair in pairs:
+                results[pair.chat_id].append(pair.asdict())
+            return results
+
+    @validate_input({"is_last_week": {"type": "boolean", "required": False}})
+    def get_pair_completion_for_all_chats(
+        self, is_last_week: bool = False
+    ) -> dict[str, dict]:
+        """Returns the number of pairs and completed pairs in every chat, grouped by chat id."""
+        before_date = get_start_of_last_week() if is_last_week else get_start_of_week()
+        after_date = get_start_of_week() if is_last_week else datetime.now()
+        with read_session_scope() as session:
+            rows = (
+                session.query(
+                    InterviewPair.chat_id,
+                    func.count(InterviewPair.id),
+                    func.count(InterviewPair.id).filter(InterviewPair.is_completed),
+                )
                 .filter(InterviewPair.started_at >= before_date)
                 .filter(InterviewPair.started_at < after_date)
+                .group_by(InterviewPair.chat_id)
                 .all()
             )
-            return [pair.asdict() for pair in pairs]
+            return {
+                chat_id: {"total": total, "completed": completed}
+                for chat_id, total, completed in rows
+            }
+
+    def get_unpaired_users_for_all_chats(self) -> dict[str, list[str]]:
+        """Returns the opted-in users without a pair this week, grouped by chat id. Read
+        from the primary, as new pairs are made from it."""
+        monday = get_start_of_week()
+        with session_scope() as session:
+            has_current_pair = (
+                session.query(InterviewPair.id)
+                .filter(InterviewPair.chat_id == Belong.chat_id)
+                .filter(InterviewPair.started_at >= monday)
+                .filter(
+                    or_(
+                        InterviewPair.user_one_id == Belong.user_id,
+                        InterviewPair.user_two_id == Belong.user_id,
+                    )
+                )
+                .exists()
+            )
+            rows = (
+                session.query(Belong.chat_id, Belong.user_id)
+                .filter(Belong.is_opted_out.is_(False))
+                .filter(~has_current_pair)
+                .all()
+            )
+            results: dict[str, list[str]] = {}
+            for chat_id, user_id in rows:
+                results.setdefault(chat_id, []).append(user_id)
+            return results
+
+    @validate_input(CREATE_INTERVIEW_PAIRS_FOR_CHATS_SCHEMA)
+    def add_pairs_for_chats(self, pairs_by_chat: dict[str, list[list[str]]]):
+        monday = get_start_of_week()
+        with session_scope() as session:
+            session.bulk_insert_mappings(
+                InterviewPair,
+                [
+                    {
+                        "user_one_id": user_one_id,
+                        "user_two_id": user_two_id,
+                        "chat_id": chat_id,
+                        "started_at": monday,
+                    }
+                    for chat_id, pairs in pairs_by_chat.items()
+                    for user_one_id, user_two_id in pairs
+                ],
+            )
+        self.summary_cache.bump(pairs_by_chat.keys())
 
     @validate_input(GET_INTERVIEW_PAIRS_FOR_USER_SCHEMA)
     def get_pairs_for_user(self, user_id: str, is_current: bool = True) -> list[dict]:
+        """Archived pairs are not included, see get_archived_pairs_for_user."""
         monday = get_start_of_week()
-        with session_scope() as session:
+        with read_session_scope() as session:
             query = (
                 session.query(InterviewPair)
+                .options(*PAIR_LOAD_OPTIONS)
                 .filter(
                     or_(
                         InterviewPair.user_one_id == user_id,
@@ -402,38 +862,137 @@ class InterviewPairService:
             if is_current:
                 query = query.filter(InterviewPair.started_at >= monday)
             pairs = query.all()
-            results = []
-            for pair in pairs:
-                pair_dict = pair.asdict()
-                entry = {}
-                for key, value in pair_dict.items():
-                    if key not in [
-                        "user_one_id",
-                        "user_two_id",
-                        "user_one_name",
-                        "user_two_name",
-                    ]:
-                        entry[key] = value
-
-                entry["self_id"] = user_id
-                entry["self_name"] = (
-                    pair_dict["user_one_name"]
-                    if pair_dict["user_one_id"] == user_id
-                    else pair_dict["user_two_name"]
-                )
-                entry["partner_id"] = (
-                    pair_dict["user_two_id"]
-                    if pair_dict["user_one_id"] == user_id
-                    else pair_dict["user_one_id"]
-                )
-                entry["partner_name"] = (
-                    pair_dict["user_two_name"]
-                    if pair_dict["user_one_id"] == user_id
-                    else pair_dict["user_one_name"]
-                )
+            return [self.__to_user_pair_entry(pair.asdict(), user_id) for pair in pairs]
+
+    @validate_input({"user_id": UUID_RULE})
+    def export_pairs_for_user(self, user_id: str) -> Iterator[tuple]:
+        """Yields a row per current or archived pair of the user, oldest first, as in
+        PAIR_EXPORT_COLUMNS. Rows are streamed from a server-side cursor."""
+        # One index scan per side of the pair, instead of a single scan on an OR
+        statement = build_pair_export_statement(
+            lambda model: model.user_one_id == user_id,
+            lambda model: model.user_two_id == user_id,
+        )
+        yield from stream_rows(statement, self.config["EXPORT_BATCH_SIZE"])
 
-                results.append(entry)
+    @validate_input({"chat_id": UUID_RULE})
+    def export_pairs_for_chat(self, chat_id: str) -> Iterator[tuple]:
+        """Yields a row per current or archived pair of the chat, oldest first, as in
+        PAIR_EXPORT_COLUMNS. Rows are streamed from a server-side cursor."""
+        statement = build_pair_export_statement(lambda model: model.chat_id == chat_id)
+        yield from stream_rows(statement, self.config["EXPORT_BATCH_SIZE"])
+
+    @validate_input(GET_ARCHIVED_INTERVIEW_PAIRS_FOR_USER_SCHEMA)
+    def get_archived_pairs_for_user(
+        self, user_id: str, page: int, page_size: int
+    ) -> tuple[list[dict], bool]:
+        """Returns a page of the user's archived pairs, newest first, and whether there
+        are older ones."""
+        with read_session_scope() as session:
+            user_pairs = union_all(
+                select(
+                    ArchivedInterviewPair.id, ArchivedInterviewPair.started_at
+                ).where(ArchivedInterviewPair.user_one_id == user_id),
+                select(
+                    ArchivedInterviewPair.id, ArchivedInterviewPair.started_at
+                ).where(ArchivedInterviewPair.user_two_id == user_id),
+            ).subquery()
+            # One extra pair is fetched to tell whether there is another page
+            page_ids = (
+                select(user_pairs.c.id)
+                .order_by(user_pairs.c.started_at.desc(), user_pairs.c.id)
+                .offset(page * page_size)
+                .limit(page_size + 1)
+            )
+            pairs = (
+                session.query(ArchivedInterviewPair)
+                .options(*ARCHIVED_PAIR_LOAD_OPTIONS)
+                .filter(ArchivedInterviewPair.id.in_(page_ids))
+                .order_by(
+                    ArchivedInterviewPair.started_at.desc(), ArchivedInterviewPair.id
+                )
+                .all()
+            )
+            return [
+                self.__to_user_pair_entry(pair.asdict(), user_id)
+                for pair in pairs[:page_size]
+            ], len(pairs) > page_size
+
+    @validate_input({"batch_size": {"type": "integer", "min": 1}})
+    def archive_old_pairs(
+        self, batch_size: int, chat_ids: Optional[list[str]] = None
+    ) -> int:
+        """Moves pairs that started more than PAIR_ARCHIVE_HORIZON_WEEKS weeks before
+        this week into the archive, only those of the given chats if any are given.
+        Each batch is moved in its own transaction. Returns the number of pairs
+        moved."""
+        horizon = get_start_of_week().astimezone() - timedelta(
+            weeks=self.config["PAIR_ARCHIVE_HORIZON_WEEKS"]
+        )
+        columns = [
+            column.name
+            for column in ArchivedInterviewPair.__table__.columns
+            if column.name != "archived_at"
+        ]
+        pair_ids = select(InterviewPair.id).where(InterviewPair.started_at < horizon)
+        if chat_ids is not None:
+            pair_ids = pair_ids.where(InterviewPair.chat_id.in_(chat_ids))
+        pair_ids = pair_ids.limit(batch_size)
+        moved_pairs = (
+            delete(InterviewPair)
+            .where(InterviewPair.id.in_(pair_ids))
+            .returning(*[InterviewPair.__table__.c[column] for column in columns])
+            .cte("moved_pairs")
+        )
+        statement = (
+            insert(ArchivedInterviewPair)
+            .from_select(
+                columns, select(*[moved_pairs.c[column] for column in columns])
+            )
+            .add_cte(moved_pairs)
+        )
 
+        archived_count = 0
+        while True:
+            with session_scope() as session:
+                moved_count = session.execute(statement).rowcount
+            archived_count += moved_count
+            if moved_count < batch_size:
+                return archived_count
+
+    @validate_input(GET_CURRENT_INTERVIEW_PAIRS_FOR_USERS_IN_CHAT_SCHEMA)
+    def get_current_pairs_for_users_in_chat(
+        self, chat_id: str, user_ids: list[str]
+    ) -> dict[str, dict]:
+        """Returns this week's pair of each of the given users in the chat, keyed by user id.
+        Users without a pair are left out."""
+        monday = get_start_of_week()
+        with read_session_scope() as session:
+            # One index scan per side of the pair, instead of a single scan on an OR
+            participants = union_all(
+                select(
+                    InterviewPair.id.label("pair_id"),
+                    InterviewPair.user_one_id.label("self_id"),
+                )
+                .where(InterviewPair.chat_id == chat_id)
+                .where(InterviewPair.user_one_id.in_(user_ids))
+                .where(InterviewPair.started_at >= monday),
+                select(InterviewPair.id, InterviewPair.user_two_id)
+                .where(InterviewPair.chat_id == chat_id)
+                .where(InterviewPair.user_two_id.in_(user_ids))
+                .where(InterviewPair.started_at >= monday),
+            ).subquery()
+            rows = (
+                session.query(InterviewPair, participants.c.self_id)
+                .options(*PAIR_LOAD_OPTIONS)
+                .join(participants, participants.c.pair_id == InterviewPair.id)
+                .order_by(InterviewPair.created_at)
+                .all()
+            )
+            results: dict[str, dict] = {}
+            for pair, self_id in rows:
+                if self_id not in results:
+                    results[self_id] = self.__to_user_pair_entry(pair.asdict(), self_id)
             return results
 
     @validate_input({"id": UUID_RULE})
@@ -446,7 +1005,9 @@ class InterviewPairService:
             interview_pair.is_completed = True
 
             session.commit()
-            return interview_pair.asdict()
+            interview_pair_dict = interview_pair.asdict()
+        self.summary_cache.bump([interview_pair_dict["chat_id"]])
+        return interview_pair_dict
 
     @validate_input(SWAP_INTERVIEW_PAIRS_SCHEMA)
     def swap_pairs_for_users(
@@ -456,42 +1017,151 @@ class InterviewPairService:
         pair_one_id: Optional[str] = None,
         pair_two_id: Optional[str] = None,
     ) -> list[Optional[dict]]:
+        """Swaps the two users between their pairs in a single transaction. The pairs are
+        locked and their state re-verified, as it may have changed since the swap was
+        requested."""
+        monday = get_start_of_week()
+        pair_ids = [
+            pair_id for pair_id in [pair_one_id, pair_two_id] if pair_id is not None
+        ]
+        if not pair_ids:
+            raise InvalidRequestException("At least one of the users must be paired!")
         with session_scope() as session:
-            pair_one: Optional[InterviewPair] = None
-            pair_two: Optional[InterviewPair] = None
-            if pair_one_id is not None:
-                pair_one = session.query(InterviewPair).get(pair_one_id)
-                if pair_one is None:
-                    raise ResourceNotFoundException()
+            # Lock in a consistent order so that concurrent swaps cannot deadlock
+            locked_pairs: dict[str, InterviewPair] = {
+                str(pair.id): pair
+                for pair in session.query(InterviewPair)
+                .filter(InterviewPair.id.in_(pair_ids))
+                .filter(InterviewPair.started_at >= monday)
+                .order_by(InterviewPair.id)
+                .with_for_update()
+                .all()
+            }
+            if len(locked_pairs) != len(set(pair_ids)):
+                raise InvalidRequestException(SWAP_STALE_MESSAGE)
+
+            pair_one = locked_pairs.get(pair_one_id) if pair_one_id else None
+            pair_two = locked_pairs.get(pair_two_id) if pair_two_id else None
+            for pair, user_id in [(pair_one, user_one_id), (pair_two, user_two_id)]:
+                if pair is None:
+                    continue
+                if user_id not in [pair.user_one_id, pair.user_two_id]:
+                    raise InvalidRequestException(SWAP_STALE_MESSAGE)
+                if pair.is_completed:
+                    raise InvalidRequestException(SWAP_COMPLETED_MESSAGE)
+            if pair_one is not None and pair_one is pair_two:
+                raise InvalidRequestException(SWAP_STALE_MESSAGE)
+
+            # A user who was unpaired must still be unpaired
+            if pair_one is None or pair_two is None:
+                paired = pair_one if pair_one is not None else pair_two
+                assert paired is not None
+                unpaired_user_id = user_one_id if pair_one is None else user_two_id
+                # Their membership is locked too, so that concurrent swaps cannot both
+                # find them unpaired and both pair them
+                belong = (
+                    session.query(Belong)
+                    .filter_by(chat_id=paired.chat_id, user_id=unpaired_user_id)
+                    .with_for_update()
+                    .one_or_none()
+                )
+                if belong is None:
+                    raise InvalidRequestException(SWAP_STALE_MESSAGE)
+                is_now_paired = (
+                    session.query(InterviewPair.id)
+                    .filter(InterviewPair.chat_id == paired.chat_id)
+                    .filter(InterviewPair.started_at >= monday)
+                    .filter(
+                        or_(
+                            InterviewPair.user_one_id == unpaired_user_id,
+                            InterviewPair.user_two_id == unpaired_user_id,
+                        )
+                    )
+                    .first()
+                    is not None
+                )
+                if is_now_paired:
+                    raise InvalidRequestException(SWAP_STALE_MESSAGE)
+
+            if pair_one is not None:
                 if pair_one.user_one_id == user_one_id:
                     pair_one.user_one_id = user_two_id
                 else:
                     pair_one.user_two_id = user_two_id
-            if pair_two_id is not None:
-                pair_two = session.query(InterviewPair).get(pair_two_id)
-                if pair_two is None:
-                    raise ResourceNotFoundException()
+            if pair_two is not None:
                 if pair_two.user_one_id == user_two_id:
                     pair_two.user_one_id = user_one_id
                 else:
                     pair_two.user_two_id = user_one_id
             session.commit()
-            return [
+            pair_dicts = [
                 pair_one.asdict() if pair_one is not None else None,
                 pair_two.asdict() if pair_two is not None else None,
             ]
+        self.summary_cache.bump(
+            {pair_dict["chat_id"] for pair_dict in pair_dicts if pair_dict is not None}
+        )
+        return pair_dicts
+
+    def __to_user_pair_entry(self, pair_dict: dict, user_id: str) -> dict:
+        """Describes a pair from the point of view of one of its users."""
+        entry = {}
+        for key, value in pair_dict.items():
+            if key not in [
+                "user_one_id",
+                "user_two_id",
+                "user_one_name",
+                "user_two_name",
+            ]:
+                entry[key] = value
+
+        entry["self_id"] = user_id
+        entry["self_name"] = (
+            pair_dict["user_one_name"]
+            if pair_dict["user_one_id"] == user_id
+            else pair_dict["user_two_name"]
+        )
+        entry["partner_id"] = (
+            pair_dict["user_two_id"]
+            if pair_dict["user_one_id"] == user_id
+            else pair_dict["user_one_id"]
+        )
+        entry["partner_name"] = (
+            pair_dict["user_two_name"]
+            if pair_dict["user_one_id"] == user_id
+            else pair_dict["user_one_name"]
+        )
+        return entry
 
 
 class QuestionInfoService:
+    """Fetches question details with a headless Chrome. Selenium is imported and Chrome
+    launched on first use rather than at startup, as they take seconds and most
+    restarts never need them."""
+
     def __init__(self, config: Config):
         self.config = config
+        self._driver = None
+        self._driver_lock = Lock()
+
+    @property
+    def driver(self):
+        with self._driver_lock:
+            if self._driver is None:
+                self._driver = self.__create_driver()
+            return self._driver
+
+    def __create_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+
         chrome_options = webdriver.ChromeOptions()
         chrome_options.add_argument("--headless")
         chrome_options.add_argument("--no-sandbox")
         chrome_options.add_argument(
             "user-agent=Mozilla/5.0 (iPhone; CPU iPhone OS 13_2_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.0.3 Mobile/15E148 Safari/604.1"
         )
-        self.driver = webdriver.Chrome(service=Service(), options=chrome_options)
+        return webdriver.Chrome(service=Service(), options=chrome_options)
 
     @validate_input({"url": QUESTION_URL_RULE, "is_leetcode": {"type": "boolean"}})
     def get_question_info(self, url: str, is_leetcode: bool) -> QuestionInfo:
@@ -543,6 +1213,9 @@ class QuestionInfoService:
         return question_name
 
     def __get_difficulty(self, is_leetcode: bool) -> Optional[str]:
+        from selenium.common.exceptions import NoSuchElementException
+        from selenium.webdriver.common.by import By
+
         difficulties = ["easy", "medium", "hard"]
         for difficulty in difficulties:
             difficulty = difficulty.title() if is_leetcode else difficulty
@@ -564,29 +1237,32 @@ class QuestionInfoService:
 class Services:
     def __init__(self, config: Config, logger: logging.Logger):
         self.config = config
-        self.user_service = UserService(config)
+        self.summary_cache = SummaryCache(
+            config["SUMMARY_CACHE_SIZE"],
+            config["REPLICA_MAX_LAG"] if config["READ_DATABASE_URL"] else 0,
+        )
+        self.leaderboards = Leaderboards(
+            lambda chat_id, summary_type: (
+                self.question_record_service.get_record_counts_for_chat(
+                    chat_id=chat_id, summary_type=summary_type
+                )
+            )
+        )
+        self.user_service = UserService(config, self.summary_cache, self.leaderboards)
         self.chat_service = ChatService(config)
-        self.belong_service = BelongService(config)
-        self.question_record_service = QuestionRecordService(config)
-        self.pair_service = InterviewPairService(config)
+        self.belong_service = BelongService(
+            config, self.summary_cache, self.leaderboards
+        )
+        self.question_record_service = QuestionRecordService(
+            config, self.summary_cache, self.leaderboards
+        )
+        self.pair_service = InterviewPairService(config, self.summary_cache)
         self.question_info_service = QuestionInfoService(config)
         self.logger = logger
 
 
+# Every module logs under the src logger, which is configured once here
+configure_logging(logging.getLogger("src"), APP_CONFIG["LOG_INFO_SAMPLE_RATE"])
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-stdout_handler = logging.StreamHandler(stdout)
-stdout_handler.setLevel(logging.INFO)
-stdout_handler.addFilter(lambda record: record.levelno == logging.INFO)
-stderr_handler = logging.StreamHandler()
-stderr_handler.setLevel(logging.WARNING)
-
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-stdout_handler.setFormatter(formatter)
-stderr_handler.setFormatter(formatter)
-
-logger.addHandler(stdout_handler)
-logger.addHandler(stderr_handler)
 
 SERVICES = Services(APP_CONFIG, logger)
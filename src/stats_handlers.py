@@ -1,7 +1,11 @@
+from datetime import date
+from typing import Optional
+
 from telegram import Update
 from telegram.ext import CallbackContext
 
 from src.config import APP_CONFIG
+from src.general_handlers import developer_only
 from src.services import SERVICES
 from src.utils import (
     MONTH_ALL_SUMMARY_STRFTIME_FORMAT,
@@ -9,11 +13,22 @@ from src.utils import (
     SummaryType,
     difficulty_to_int,
     format_platform_name,
+    get_summary_period_start,
     platform_to_int,
     reply_html,
     unwrap,
 )
 
+WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+STATS_BAR_LENGTH = 10
+
+# Periods of /rank and /top, by their argument
+LEADERBOARD_PERIODS = {
+    "week": SummaryType.WEEKLY,
+    "month": SummaryType.MONTHLY,
+    "all": SummaryType.ALL,
+}
+
 # Summary Generators
 
 
@@ -130,6 +145,57 @@ def generate_detailed_group_summary(
     return summary
 
 
+def generate_top_summary(entries: list[dict], summary_type: SummaryType) -> str:
+    if not entries:
+        return "No one in this group is on the leaderboard! Add yourself using /add_me now."
+
+    summary = f"<b>Top members {summary_type.format()}:</b>\n"
+    for entry in entries:
+        # Using .format for readability
+        summary += "{}. {}: {} completed\n".format(
+            entry["rank"], entry["full_name"], entry["count"]
+        )
+    return summary
+
+
+def generate_rank_summary(entry: Optional[dict], summary_type: SummaryType) -> str:
+    if entry is None:
+        return "You are not on this group's leaderboard! Add yourself using /add_me or /opt_in now."
+    # Using .format for readability
+    return "You are ranked {} of {} {}, with {} completed.".format(
+        entry["rank"], entry["size"], summary_type.format(), entry["count"]
+    )
+
+
+def generate_stats_summary(stats: dict, title: str) -> str:
+    if not stats["total"]:
+        return "No questions have been completed yet!"
+
+    summary = f"<b>{title}:</b>\n"
+    summary += f"Questions completed: {stats['total']}\n"
+    summary += f"Current streak: {stats['current_streak']} days\n"
+    summary += f"Longest streak: {stats['longest_streak']} days\n"
+
+    summary += "\n<b>By weekday:</b>\n"
+    most = max(stats["counts_by_weekday"])
+    for name, count in zip(WEEKDAY_NAMES, stats["counts_by_weekday"]):
+        # Using .format for readability
+        summary += "{} {} {}\n".format(
+            name, "█" * round(count / most * STATS_BAR_LENGTH), count
+        )
+
+    summary += "\n<b>By difficulty:</b>\n"
+    for month_start, counts in stats["difficulties_by_month"].items():
+        # Using .format for readability
+        summary += "{}: {} easy, {} medium, {} hard\n".format(
+            month_start.strftime("%b %Y"),
+            counts.get("easy", 0),
+            counts.get("medium", 0),
+            counts.get("hard", 0),
+        )
+    return summary
+
+
 # Summary Helpers
 
 
@@ -152,21 +218,15 @@ def create_and_send_individual_summary(
     reply_html(update, summary)
 
 
-def create_and_send_group_summary(
-    update: Update,
+def generate_group_summary_for_chat(
+    chat_id: str,
     summary_type: SummaryType,
     is_detailed: bool = False,
     is_last_week: bool = False,
-) -> None:
-    update.message = unwrap(update.message)
-    chat = update.message.chat
-    chat_dict = SERVICES.chat_service.get_chat_by_telegram_id(telegram_id=str(chat.id))
-    user_dicts = SERVICES.belong_service.get_users_in_chat(chat_id=chat_dict["id"])
+) -> str:
+    user_dicts = SERVICES.belong_service.get_users_in_chat(chat_id=chat_id)
     if not user_dicts:
-        update.message.reply_html(
-            "This group has no members! Add yourself using /add_me now."
-        )
-        return
+        return "This group has no members! Add yourself using /add_me now."
 
     records = SERVICES.question_record_service.get_records_by_users(
         # Filter out opted out members
@@ -178,16 +238,43 @@ def create_and_send_group_summary(
     )
 
     if not records:
-        update.message.reply_html(
-            "All members in this group have opted out! Opt yourself in using /opt_in now."
-        )
-        return
+        return "All members in this group have opted out! Opt yourself in using /opt_in now."
 
-    summary = (
+    return (
         generate_group_summary(records, summary_type, is_last_week=is_last_week)
         if not is_detailed
         else generate_detailed_group_summary(records, summary_type)
     )
+
+
+def create_and_send_group_summary(
+    update: Update,
+    summary_type: SummaryType,
+    is_detailed: bool = False,
+    is_last_week: bool = False,
+) -> None:
+    update.message = unwrap(update.message)
+    chat = update.message.chat
+    chat_dict = SERVICES.chat_service.get_chat_by_telegram_id(telegram_id=str(chat.id))
+
+    # Summaries are cached until the group's data changes, or the period rolls over
+    cache_key = (
+        summary_type,
+        is_detailed,
+        is_last_week,
+        get_summary_period_start(summary_type, is_last_week=is_last_week),
+    )
+    version = SERVICES.summary_cache.get_version(chat_dict["id"])
+    summary = SERVICES.summary_cache.get(chat_dict["id"], cache_key)
+    if summary is None:
+        summary = generate_group_summary_for_chat(
+            chat_dict["id"],
+            summary_type,
+            is_detailed=is_detailed,
+            is_last_week=is_last_week,
+        )
+        SERVICES.summary_cache.set(chat_dict["id"], cache_key, version, summary)
+
     reply_html(update, summary)
 
 
@@ -265,3 +352,116 @@ def all_questions_chat(update: Update, _: CallbackContext) -> None:
 
 def all_unique_chat(update: Update, _: CallbackContext) -> None:
     create_and_send_group_summary(update, SummaryType.ALL_UNIQUE)
+
+
+def get_leaderboard_summary_type(
+    update: Update, context: CallbackContext, command: str
+) -> Optional[SummaryType]:
+    """Returns the period asked for, this week by default, or replies with the usage
+    and returns None."""
+    update.message = unwrap(update.message)
+    if not context.args:
+        return SummaryType.WEEKLY
+    summary_type = LEADERBOARD_PERIODS.get(context.args[0].lower())
+    if summary_type is None:
+        update.message.reply_text(
+            f"Please send one of {', '.join(LEADERBOARD_PERIODS)}, e.g. /{command} month"
+        )
+    return summary_type
+
+
+def stats(update: Update, _: CallbackContext) -> None:
+    update.message = unwrap(update.message)
+    user = unwrap(update.effective_user)
+    chat = update.message.chat
+
+    if chat.type == "private":
+        user_dict = SERVICES.user_service.create_if_not_exists(
+            full_name=user.full_name, telegram_id=str(user.id)
+        )
+        record_stats = SERVICES.question_record_service.get_record_stats(
+            user_ids=[user_dict["id"]], months=APP_CONFIG["STATS_MONTHS"]
+        )
+        reply_html(update, generate_stats_summary(record_stats, "Your stats"))
+        return
+
+    chat_dict = SERVICES.chat_service.get_chat_by_telegram_id(telegram_id=str(chat.id))
+    # Streaks depend on the day, so cached stats are only used on the same day
+    cache_key = ("stats", date.today())
+    version = SERVICES.summary_cache.get_version(chat_dict["id"])
+    summary = SERVICES.summary_cache.get(chat_dict["id"], cache_key)
+    if summary is None:
+        user_ids = [
+            user_dict["id"]
+            for user_dict in SERVICES.belong_service.get_users_in_chat(
+                chat_id=chat_dict["id"]
+            )
+            if not user_dict["is_opted_out"]
+        ]
+        if not user_ids:
+            summary = (
+                "This group has no opted in members! Add yourself using /add_me now."
+            )
+        else:
+            record_stats = SERVICES.question_record_service.get_record_stats(
+                user_ids=user_ids, months=APP_CONFIG["STATS_MONTHS"]
+            )
+            summary = generate_stats_summary(record_stats, "Group stats")
+        SERVICES.summary_cache.set(chat_dict["id"], cache_key, version, summary)
+
+    reply_html(update, summary)
+
+
+def rank(update: Update, context: CallbackContext) -> None:
+    update.message = unwrap(update.message)
+    user = unwrap(update.effective_user)
+    chat = update.message.chat
+    if chat.type == "private":
+        update.message.reply_text("Please use this command in a chat group!")
+        return
+    summary_type = get_leaderboard_summary_type(update, context, "rank")
+    if summary_type is None:
+        return
+
+    chat_dict = SERVICES.chat_service.get_chat_by_telegram_id(telegram_id=str(chat.id))
+    user_dict = SERVICES.user_service.create_if_not_exists(
+        full_name=user.full_name, telegram_id=str(user.id)
+    )
+    entry = SERVICES.leaderboards.get_rank(
+        chat_dict["id"], summary_type, user_dict["id"]
+    )
+    reply_html(update, generate_rank_summary(entry, summary_type))
+
+
+def top(update: Update, context: CallbackContext) -> None:
+    update.message = unwrap(update.message)
+    chat = update.message.chat
+    if chat.type == "private":
+        update.message.reply_text("Please use this command in a chat group!")
+        return
+    summary_type = get_leaderboard_summary_type(update, context, "top")
+    if summary_type is None:
+        return
+
+    chat_dict = SERVICES.chat_service.get_chat_by_telegram_id(telegram_id=str(chat.id))
+    entries = SERVICES.leaderboards.get_top(
+        chat_dict["id"], summary_type, APP_CONFIG["LEADERBOARD_TOP_SIZE"]
+    )
+    reply_html(update, generate_top_summary(entries, summary_type))
+
+
+# Developer Handlers
+
+
+@developer_only
+def cache_stats(update: Update, _: CallbackContext) -> None:
+    """Reports the usage of the group summary cache."""
+    update.message = unwrap(update.message)
+    stats = SERVICES.summary_cache.stats()
+    update.message.reply_text(
+        f"Summary cache: {stats['size']}/{stats['max_size']} entries\n"
+        f"Hits: {stats['hits']}\n"
+        f"Misses: {stats['misses']} ({stats['stale']} stale)\n"
+        f"Evictions: {stats['evictions']}\n"
+        f"Hit rate: {stats['hit_rate']:.1%}"
+    )
@@ -1,7 +1,9 @@
+import html
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import Optional, TypeVar
+from typing import Iterator, Optional, TypeVar
 
+from telegram.ext import ConversationHandler, Dispatcher, Handler
 from telegram.update import Update
 
 from src.exceptions import InvalidUnwrapException
@@ -74,9 +76,21 @@ def get_start_of_last_week() -> datetime:
     )
 
 
-def get_start_of_month() -> datetime:
-    now = datetime.now()
-    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+def get_start_of_month(months_ago: int = 0) -> datetime:
+    start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(months_ago):
+        start = (start - timedelta(days=1)).replace(day=1)
+    return start
+
+
+def get_summary_period_start(
+    summary_type: Optional[SummaryType], is_last_week: bool = False
+) -> Optional[datetime]:
+    if summary_type == SummaryType.WEEKLY:
+        return get_start_of_last_week() if is_last_week else get_start_of_week()
+    elif summary_type == SummaryType.MONTHLY:
+        return get_start_of_month()
+    return None
 
 
 # Desired behaviour:
@@ -141,6 +155,40 @@ def break_message_up(message: str) -> list[str]:
     return messages_to_send
 
 
+def escape_html(text: str, max_length: int, keep_end: bool = False) -> str:
+    """Escapes text for an HTML message, in at most max_length characters. The text is
+    cut before it is escaped, as cutting it after could split an entity. Its start is
+    kept, or its end if keep_end is set."""
+    escaped = html.escape(text)
+    if len(escaped) <= max_length:
+        return escaped
+    parts = []
+    length = 0
+    for char in reversed(text) if keep_end else text:
+        escaped_char = html.escape(char)
+        if length + len(escaped_char) > max_length:
+            break
+        parts.append(escaped_char)
+        length += len(escaped_char)
+    return "".join(reversed(parts) if keep_end else parts)
+
+
+def pack_messages(entries: list[str]) -> list[str]:
+    """Joins self-contained entries, such as ones with their own HTML tags, into as few
+    messages as possible without splitting any entry across messages."""
+    messages: list[str] = []
+    current = ""
+    for entry in entries:
+        entry = entry[:MAX_MESSAGE_LENGTH]
+        if current and len(current) + len(entry) + 1 > MAX_MESSAGE_LENGTH:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n{entry}" if current else entry
+    if current:
+        messages.append(current)
+    return messages
+
+
 def reply_html(update: Update, message: str, **kwargs) -> None:
     # Unwrap and fail fast
     update.message = unwrap(update.message)
@@ -148,3 +196,22 @@ def reply_html(update: Update, message: str, **kwargs) -> None:
 
     for message in messages_to_send:
         update.message.reply_html(message, **kwargs)
+
+
+def get_callback_handlers(dispatcher: Dispatcher) -> Iterator[Handler]:
+    """Yields every handler of the dispatcher that has a callback, including those
+    within conversation handlers."""
+
+    def expand(handler: Handler) -> Iterator[Handler]:
+        if not isinstance(handler, ConversationHandler):
+            yield handler
+            return
+        for inner_handler in handler.entry_points + handler.fallbacks:
+            yield from expand(inner_handler)
+        for state_handlers in handler.states.values():
+            for inner_handler in state_handlers:
+                yield from expand(inner_handler)
+
+    for handlers in dispatcher.handlers.values():
+        for handler in handlers:
+            yield from expand(handler)
@@ -0,0 +1,245 @@
+import json
+import logging
+import multiprocessing
+import signal
+from multiprocessing.context import SpawnContext, SpawnProcess
+from multiprocessing.queues import Queue as ProcessQueue
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Optional
+
+from telegram import Bot, Update
+from telegram.ext import CallbackContext, Dispatcher, JobQueue, TypeHandler, Updater
+
+from src.app import register_handlers, schedule_jobs, schedule_process_jobs
+from src.config import APP_CONFIG
+from src.general_handlers import error_handler
+from src.metrics import start_metrics_server
+from src.persistence import SQLPersistence
+from src.services import SERVICES
+
+logger = logging.getLogger(__name__)
+
+# In worker mode, one intake process receives updates and forwards each to one of
+# several worker processes, which handle them. Updates are sharded by chat, so that
+# each chat's updates are handled in order by the same worker. A user's updates from
+# groups and from their private chat can reach different workers, so only the worker
+# of their private chat, whose id is the user's, persists their user_data.
+# Each queue is written to by one process only, so that a worker that is killed can
+# leave only its own queues unusable. They are replaced when the worker is restarted,
+# and the updates still queued for it are moved to its new queue.
+
+# Messages on a worker's queue. None asks the worker to stop.
+UPDATE_MESSAGE = "update"
+BUMP_MESSAGE = "bump"
+# Seconds between checks that every worker is alive
+WORKER_CHECK_INTERVAL = 1
+
+
+def get_shard(update: Update, shard_count: int) -> int:
+    if update.effective_chat is not None:
+        key = update.effective_chat.id
+    elif update.effective_user is not None:
+        key = update.effective_user.id
+    else:
+        key = update.update_id
+    return key % shard_count
+
+
+# Worker
+
+
+def run_worker(
+    index: int,
+    worker_count: int,
+    inbox: ProcessQueue,
+    bump_outbox: ProcessQueue,
+) -> None:
+    """Handles the updates forwarded to one worker until asked to stop. Each worker has
+    its own database connections, caches and persistence."""
+    # The intake stops the workers itself, after it stops receiving updates
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    bot = Bot(APP_CONFIG["BOT_ACCESS_TOKEN"], base_url=APP_CONFIG["BOT_API_URL"])
+    persistence = SQLPersistence(shard_index=index, shard_count=worker_count)
+    job_queue = JobQueue()
+    dispatcher = Dispatcher(bot, Queue(), persistence=persistence, job_queue=job_queue)
+    job_queue.set_dispatcher(dispatcher)
+    register_handlers(dispatcher)
+    schedule_process_jobs(job_queue, persistence)
+    job_queue.start()
+    if APP_CONFIG["METRICS_PORT"]:
+        start_metrics_server(APP_CONFIG["METRICS_PORT"] + index)
+
+    # Other workers may have cached summaries and leaderboards that this worker's
+    # writes change. The intake passes the bumps on to them.
+    SERVICES.summary_cache.bump_listener = bump_outbox.put
+
+    logger.info("Worker %d started", index)
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        kind, payload = message
+        if kind == UPDATE_MESSAGE:
+            dispatcher.process_update(Update.de_json(json.loads(payload), bot))
+        elif kind == BUMP_MESSAGE:
+            SERVICES.summary_cache.bump(payload, notify=False)
+            # Bumps do not say what changed, so leaderboards are loaded again
+            SERVICES.leaderboards.invalidate(payload)
+
+    job_queue.stop()
+    persistence.flush()
+    logger.info("Worker %d stopped", index)
+
+
+# Intake
+
+
+class WorkerPool:
+    """Runs the worker processes, forwards updates to them, and restarts workers that
+    exit unexpectedly."""
+
+    def __init__(self, worker_count: int):
+        self._context: SpawnContext = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue() for _ in range(worker_count)]
+        # The chat ids of the bumps made by each worker
+        self.bump_queues = [self._context.Queue() for _ in range(worker_count)]
+        self._processes: list[Optional[SpawnProcess]] = [None] * worker_count
+        self._lock = Lock()
+        self._stopping = Event()
+
+    def start(self) -> None:
+        for index in range(len(self._processes)):
+            self.__start_worker(index)
+        Thread(target=self.__watch_workers, name="worker_watcher", daemon=True).start()
+
+    def forward_update(self, update: object, _: CallbackContext) -> None:
+        if not isinstance(update, Update):
+            return
+        shard = get_shard(update, len(self.queues))
+        self.queues[shard].put((UPDATE_MESSAGE, update.to_json()))
+
+    def broadcast_bump(self, chat_ids: list[str]) -> None:
+        for queue in self.queues:
+            queue.put((BUMP_MESSAGE, chat_ids))
+
+    def stop(self) -> None:
+        """Asks every worker to stop once it has handled the updates already forwarded
+        to it, and waits for them. Workers that do not stop in time are terminated."""
+        self._stopping.set()
+        with self._lock:
+            for queue in self.queues:
+                queue.put(None)
+            deadline = monotonic() + APP_CONFIG["WORKER_SHUTDOWN_TIMEOUT"]
+            for index, process in enumerate(self._processes):
+                if process is None:
+                    continue
+                process.join(max(0, deadline - monotonic()))
+                if process.is_alive():
+                    logger.warning("Worker %d did not stop in time", index)
+                    process.terminate()
+                    process.join()
+
+    def __start_worker(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, len(self.queues), self.queues[index], self.bump_queues[index]),
+            name=f"worker_{index}",
+        )
+        process.start()
+        self._processes[index] = process
+        Thread(
+            target=self.__relay_bumps,
+            args=(index, self.bump_queues[index]),
+            name=f"bump_relay_{index}",
+            daemon=True,
+        ).start()
+
+    def __relay_bumps(self, index: int, bump_queue: ProcessQueue) -> None:
+        """Passes the worker's bumps on to the other workers, until the worker is
+        stopped or restarted with a new queue."""
+        while not self._stopping.is_set() and bump_queue is self.bump_queues[index]:
+            try:
+                chat_ids = bump_queue.get(timeout=WORKER_CHECK_INTERVAL)
+            except Empty:
+                continue
+            for other_index, queue in enumerate(self.queues):
+                if other_index != index:
+                    queue.put((BUMP_MESSAGE, chat_ids))
+
+    def __watch_workers(self) -> None:
+        while not self._stopping.wait(WORKER_CHECK_INTERVAL):
+            with self._lock:
+                if self._stopping.is_set():
+                    return
+                for index, process in enumerate(self._processes):
+                    if process is not None and not process.is_alive():
+                        logger.error(
+                            "Worker %d exited with code %s, restarting",
+                            index,
+                            process.exitcode,
+                        )
+                        # The worker may have been killed while using its queues,
+                        # leaving them corrupt or locked, so it gets new ones. The
+                        # updates left on its old queue are moved to the new one.
+                        old_queue = self.queues[index]
+                        new_queue = self._context.Queue()
+                        moved = self.__move_updates(old_queue, new_queue)
+                        self.queues[index] = new_queue
+                        # Updates forwarded while the first ones were moved
+                        moved += self.__move_updates(old_queue, new_queue)
+                        if moved:
+                            logger.info(
+                                "Moved %d updates to worker %d's new queue",
+                                moved,
+                                index,
+                            )
+                        self.bump_queues[index] = self._context.Queue()
+                        self.__start_worker(index)
+
+    @staticmethod
+    def __move_updates(old_queue: ProcessQueue, new_queue: ProcessQueue) -> int:
+        """Moves the updates on a dead worker's queue to its new one, in order, and
+        returns how many were moved. Bumps are dropped, as the new worker starts with
+        empty caches. If the old queue is locked or corrupt, the updates still on it
+        are lost."""
+        moved = 0
+        while True:
+            try:
+                message = old_queue.get_nowait()
+            except Empty:
+                return moved
+            except Exception:
+                logger.exception(
+                    "Could not read a dead worker's queue, the updates left on it "
+                    "are lost"
+                )
+                return moved
+            if message is not None and message[0] == UPDATE_MESSAGE:
+                new_queue.put(message)
+                moved += 1
+
+
+def run_intake(worker_count: int) -> None:
+    """Receives updates and forwards them to the given number of worker processes. Jobs
+    that run once for the whole bot run in this process."""
+    pool = WorkerPool(worker_count)
+    pool.start()
+    # Jobs here also change data that appears in the workers' cached summaries
+    SERVICES.summary_cache.bump_listener = pool.broadcast_bump
+
+    updater = Updater(
+        APP_CONFIG["BOT_ACCESS_TOKEN"], base_url=APP_CONFIG["BOT_API_URL"]
+    )
+    updater.dispatcher.add_handler(TypeHandler(Update, pool.forward_update))
+    updater.dispatcher.add_error_handler(error_handler)
+    schedule_jobs(updater.job_queue)
+    schedule_process_jobs(updater.job_queue)
+
+    updater.start_polling()
+    # Returns once the bot is asked to stop, after updates are no longer received
+    updater.idle()
+    pool.stop()
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("asyncpg")
+
+from sqlalchemy.util import await_only  # noqa: E402
+
+from src.async_services import AsyncService  # noqa: E402
+
+
+class RowService:
+    def get_count(self) -> int:
+        # Fails with MissingGreenlet unless run within greenlet_spawn
+        await_only(asyncio.sleep(0))
+        return 1
+
+    def export_rows(self, count: int):
+        for i in range(count):
+            await_only(asyncio.sleep(0))
+            yield i
+
+
+def test_generator_methods_run_within_greenlets():
+    service = AsyncService(RowService())
+
+    async def run():
+        return await service.get_count(), [x async for x in service.export_rows(5)]
+
+    assert asyncio.run(run()) == (1, [0, 1, 2, 3, 4])
@@ -0,0 +1,55 @@
+from src.cache import SummaryCache
+
+
+def test_summary_cache_hit():
+    cache = SummaryCache(max_size=10)
+    version = cache.get_version("chat")
+    cache.set("chat", "week", version, "summary")
+    assert cache.get("chat", "week") == "summary"
+    assert cache.stats()["hits"] == 1
+
+
+def test_summary_cache_bump_invalidates():
+    cache = SummaryCache(max_size=10)
+    cache.set("chat", "week", cache.get_version("chat"), "summary")
+    cache.bump(["chat"])
+    assert cache.get("chat", "week") is None
+    assert cache.stats()["stale"] == 1
+
+
+def test_summary_cache_ignores_stale_set():
+    cache = SummaryCache(max_size=10)
+    version = cache.get_version("chat")
+    cache.bump(["chat"])
+    cache.set("chat", "week", version, "summary")
+    assert cache.get("chat", "week") is None
+
+
+def test_summary_cache_evicts_least_recently_used():
+    cache = SummaryCache(max_size=2)
+    cache.set("a", "week", 0, "a")
+    cache.set("b", "week", 0, "b")
+    cache.get("a", "week")
+    cache.set("c", "week", 0, "c")
+    assert cache.get("b", "week") is None
+    assert cache.get("a", "week") == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_summary_cache_waits_for_changes_to_settle():
+    cache = SummaryCache(max_size=10, settle_time=60)
+    cache.set("a", "week", 0, "a")
+    cache.bump(["b"])
+    cache.set("b", "week", cache.get_version("b"), "b")
+    assert cache.get("a", "week") == "a"
+    assert cache.get("b", "week") is None
+
+
+def test_summary_cache_notifies_bump_listener():
+    cache = SummaryCache(max_size=10)
+    bumps = []
+    cache.bump_listener = bumps.append
+    cache.bump(["a"])
+    cache.bump(["b"], notify=False)
+    assert bumps == [["a"]]
+    assert cache.get_version("b") == 1
@@ -0,0 +1,23 @@
+from src.error_reports import ErrorCollector, ErrorReport, format_report
+from src.utils import MAX_MESSAGE_LENGTH
+
+
+def test_format_report_fits_a_message_despite_escaping():
+    report = ErrorReport(("ValueError", "app.py:1 in main"), "<&>" * 2000)
+    report.occurrences = 1
+    report.sample_updates = ['{"text": "&&&"}'] * 3
+    entry = format_report(report)
+    assert len(entry) <= MAX_MESSAGE_LENGTH
+    assert entry.endswith("</pre>")
+    assert entry.count("<pre>") == entry.count("</pre>")
+
+
+def test_restore_merges_with_errors_recorded_since():
+    collector = ErrorCollector()
+    collector.record(ValueError(), None)
+    reports, dropped = collector.pop_reports()
+    collector.record(ValueError(), None)
+    collector.restore(reports, dropped)
+    restored, _ = collector.pop_reports()
+    assert len(restored) == 1
+    assert restored[0].occurrences == 2
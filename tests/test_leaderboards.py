@@ -0,0 +1,71 @@
+from src.leaderboards import Leaderboards
+from src.utils import SummaryType
+
+COUNTS = {
+    "a": {"full_name": "Alice", "count": 3},
+    "b": {"full_name": "Bob", "count": 5},
+    "c": {"full_name": "Carol", "count": 3},
+}
+
+
+def test_leaderboard_ranks_ties_together():
+    leaderboards = Leaderboards(lambda chat_id, summary_type: COUNTS)
+    top = leaderboards.get_top("chat", SummaryType.WEEKLY, 10)
+    assert [(x["full_name"], x["rank"]) for x in top] == [
+        ("Bob", 1),
+        ("Alice", 2),
+        ("Carol", 2),
+    ]
+    assert leaderboards.get_rank("chat", SummaryType.WEEKLY, "c")["rank"] == 2
+
+
+def test_leaderboard_updates_without_loading_again():
+    loads = []
+    leaderboards = Leaderboards(lambda chat_id, summary_type: loads.append(1) or COUNTS)
+    leaderboards.get_top("chat", SummaryType.WEEKLY, 10)
+    with leaderboards.adding_record("c", ["chat"]):
+        pass
+    leaderboards.remove_member("b", "chat")
+    assert leaderboards.get_rank("chat", SummaryType.WEEKLY, "c") == {
+        "full_name": "Carol",
+        "count": 4,
+        "rank": 1,
+        "size": 2,
+    }
+    assert len(loads) == 1
+
+
+def test_leaderboard_loaded_during_a_change_is_not_kept():
+    loads = []
+
+    def load(chat_id, summary_type):
+        loads.append(1)
+        with leaderboards.adding_record("a", [chat_id]):
+            pass
+        return COUNTS
+
+    leaderboards = Leaderboards(load)
+    leaderboards.get_top("chat", SummaryType.WEEKLY, 10)
+    leaderboards.get_top("chat", SummaryType.WEEKLY, 10)
+    assert len(loads) == 2
+
+
+def test_leaderboard_loaded_after_a_commit_counts_the_record_once():
+    counts = {"a": {"full_name": "Alice", "count": 3}}
+    leaderboards = Leaderboards(lambda chat_id, summary_type: counts)
+    with leaderboards.adding_record("a", ["chat"]):
+        # Committed, and then loaded by another thread before the scope exits
+        counts = {"a": {"full_name": "Alice", "count": 4}}
+        assert leaderboards.get_rank("chat", SummaryType.WEEKLY, "a")["count"] == 4
+    assert leaderboards.get_rank("chat", SummaryType.WEEKLY, "a")["count"] == 4
+
+
+def test_leaderboard_does_not_count_a_record_that_failed_to_commit():
+    leaderboards = Leaderboards(lambda chat_id, summary_type: COUNTS)
+    leaderboards.get_top("chat", SummaryType.WEEKLY, 10)
+    try:
+        with leaderboards.adding_record("a", ["chat"]):
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert leaderboards.get_rank("chat", SummaryType.WEEKLY, "a")["count"] == 3
@@ -0,0 +1,91 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("psycopg2")
+
+# Seconds from launching the bot until it first polls for updates
+STARTUP_BUDGET = float(os.environ.get("STARTUP_BUDGET", "5"))
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeBotApiHandler(BaseHTTPRequestHandler):
+    """Answers just enough of the Bot API for the bot to start polling."""
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        endpoint = self.path.rsplit("/", 1)[-1]
+        if endpoint == "getUpdates":
+            self.server.polled.set()  # type: ignore
+            result: object = []
+        elif endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bot", "username": "Bot"}
+        else:
+            result = True
+        body = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def test_cold_start_to_first_get_updates_within_budget():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBotApiHandler)
+    server.polled = threading.Event()  # type: ignore
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_ROOT,
+        "BOT_ENV": os.environ.get("BOT_ENV", "TEST"),
+        "BOT_ACCESS_TOKEN": "123456:startup-test",
+        "DEVELOPER_ID": "1",
+        "BOT_API_URL": f"http://127.0.0.1:{server.server_address[1]}/bot",
+        "METRICS_PORT": "0",
+    }
+    start = perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "src/app.py"],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        # Waits past the budget, so that a slow start reports how slow it was
+        polled = False
+        while (
+            not polled
+            and process.poll() is None
+            and perf_counter() - start < STARTUP_BUDGET * 3
+        ):
+            polled = server.polled.wait(0.05)  # type: ignore
+        elapsed = perf_counter() - start
+        if not polled and process.poll() is not None:
+            stderr = process.communicate()[1]
+            if "OperationalError" in stderr:
+                pytest.skip("The test database is not available")
+            pytest.fail(f"The bot exited before polling:\n{stderr[-3000:]}")
+        assert polled, f"The bot did not poll within {STARTUP_BUDGET * 3:.1f}s"
+        assert (
+            elapsed <= STARTUP_BUDGET
+        ), f"Startup took {elapsed:.2f}s, over the budget of {STARTUP_BUDGET:.1f}s"
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        server.shutdown()
@@ -0,0 +1,16 @@
+from src.utils import escape_html
+
+
+def test_escape_html_keeps_short_text_whole():
+    assert escape_html("a < b", 100) == "a &lt; b"
+
+
+def test_escape_html_does_not_split_entities():
+    escaped = escape_html("a" * 8 + "&&", 12)
+    assert escaped == "a" * 8
+    escaped = escape_html("a" * 8 + "&&", 13)
+    assert escaped == "a" * 8 + "&amp;"
+
+
+def test_escape_html_can_keep_the_end():
+    assert escape_html("&" + "a" * 8, 8, keep_end=True) == "a" * 8
@@ -0,0 +1,19 @@
+import multiprocessing
+from time import sleep
+
+from src.workers import BUMP_MESSAGE, UPDATE_MESSAGE, WorkerPool
+
+
+def test_dead_workers_updates_are_moved_to_its_new_queue():
+    context = multiprocessing.get_context("spawn")
+    old_queue, new_queue = context.Queue(), context.Queue()
+    old_queue.put((UPDATE_MESSAGE, "1"))
+    old_queue.put((BUMP_MESSAGE, ["1"]))
+    old_queue.put((UPDATE_MESSAGE, "2"))
+    # Lets the queue's feeder thread write the messages
+    sleep(0.1)
+
+    assert WorkerPool._WorkerPool__move_updates(old_queue, new_queue) == 2
+    assert new_queue.get(timeout=1) == (UPDATE_MESSAGE, "1")
+    assert new_queue.get(timeout=1) == (UPDATE_MESSAGE, "2")
+    assert new_queue.empty()